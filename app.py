@@ -1,111 +1,255 @@
 import streamlit as st
-import os, base64, asyncio, tempfile
+import os, base64, functools, hashlib, re, time, uuid
+import streamlit.components.v1 as components
 from audio_recorder_streamlit import audio_recorder
 from dotenv import load_dotenv
-from openai import OpenAI
+
+from app import metrics
+from app.config import get_config
+from app.formats import MIME_TYPES
+from app.media import media_url, start_media_server
+from app.audio import upload_stats
+from app.prompts import get_prompt_registry
+from app.recording import RecordedTurn, get_recorder, trace_timing
+from app.resilience import resilience_stats
+from app.services import VoiceBot
+from app.store import get_session_store
+from app.streaming import StreamingTurn
+from app.turns import get_turn_runner
 
 load_dotenv()
 
 st.set_page_config(page_title="🎙️ Ola Voice Bot Support", page_icon="🎙️", layout="wide")
 
-class VoiceBot:
-    def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.system_prompt = """You are an Ola customer support bot speaking only in Hindi. Follow this script exactly:
-        - Wait for the user to say: "Main 2 ghante se online hoon par mujhe koi ride nahi mil rahi."
-        - Then you say: "Ola customer support mein aapka swagat hai. Kya yeh aapka registered number hai?"
-        - If the user confirms (e.g., "Haan"), you say: "Aapka number blocked nahi hai. Sab theek hai. Kripya apna location badal kar phir se rides check kijye."
-        - After giving the solution, end the conversation.
-        Do not deviate from this script. Keep responses very short and concise."""
-        self.conversation_state = "waiting_for_complaint"
-
-    def transcribe_audio(self, audio_bytes):
-        """Transcribe audio using Whisper"""
-        try:
-            #saving file check
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp_file:
-                tmp_file.write(audio_bytes)
-                audio_path = tmp_file.name
-            
-            with open(audio_path, "rb") as audio_file:
-                transcript = self.client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    language="hi"
-                )
-            os.unlink(audio_path)
-            return transcript.text
-        except Exception as e:
-            st.error(f"Transcription error: {e}")
-            return None
-
-    def get_llm_response(self, user_input):
-        """Get response from GPT-4"""
-        try:
-            messages = [
-                {"role": "system", "content": self.system_prompt},
-                {"role": "user", "content": user_input}
-            ]
-            
-            completion = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages,
-                max_tokens=150,
-                temperature=0.1
-            )
-            return completion.choices[0].message.content
-        except Exception as e:
-            return f"Technical error: {e}"
-
-    def text_to_speech(self, text):
-        """Convert text to Hindi speech"""
-        try:
-            response = self.client.audio.speech.create(
-                model="tts-1",
-                voice="nova",
-                input=text
-            )
-            return response.content  # Returns audio bytes directly
-        except Exception as e:
-            st.error(f"TTS error: {e}")
-            return None
-
-def play_audio(audio_bytes):
-    """Auto-play audio in Streamlit"""
+SESSION_ID = re.compile(r"[0-9a-f]{12}")  # uuid4().hex[:12], as issued below
+MAX_TRANSCRIPT_MESSAGES = 50  # on-screen transcript; the LLM context is bounded by ConversationMemory
+# While a turn runs in the background the page reruns when it has something new, at most every TURN_POLL_SECONDS;
+# with nothing new it still reruns every TURN_IDLE_SECONDS so clicks aren't held up by a waiting script run
+TURN_POLL_SECONDS = float(os.getenv("TURN_POLL_SECONDS", "0.3"))
+TURN_IDLE_SECONDS = float(os.getenv("TURN_IDLE_SECONDS", "1.0"))
+
+def streamlit_notify(level, message):
+    """Show VoiceBot errors and hints in the page"""
+    if level == "error":
+        st.error(message)
+    else:
+        st.info(message)
+
+def audio_src(audio_bytes, handle=None, fmt="mp3"):
+    """URL on the media endpoint when the audio is published, otherwise an inline data URI"""
+    return media_url(handle, fmt) or f"data:{MIME_TYPES[fmt]};base64,{base64.b64encode(audio_bytes).decode()}"
+
+def clip_src(assistant, text, audio):
+    """Playable source for one synthesized reply clip (built in the turn worker, not on reruns)"""
+    with metrics.stage("render", bytes_in=len(audio)) as span:
+        src = audio_src(audio, assistant.publish_speech(text, audio), assistant.tts_format)
+        span.bytes_out = len(src)
+    return src
+
+def queue_audio(src, key):
+    """Append audio to an in-page playback queue so streamed sentences play back to back
+
+    Clips stay on the page while their turn runs; `key` makes sure a clip is
+    queued once even if its element is re-rendered.
+    """
+    components.html(f"""
+        <script>
+            const host = window.parent;
+            const queue = host.__voiceBotQueue = host.__voiceBotQueue || {{ items: [], playing: false, seen: {{}} }};
+            const playNext = () => {{
+                const next = queue.items.shift();
+                if (!next) {{ queue.playing = false; return; }}
+                queue.playing = true;
+                const audio = new host.Audio(next);
+                audio.onended = playNext;
+                audio.onerror = playNext;
+                audio.play().catch(playNext);
+            }};
+            if (!queue.seen["{key}"]) {{
+                queue.seen["{key}"] = true;
+                queue.items.push("{src}");
+                if (!queue.playing) playNext();
+            }}
+        </script>
+    """, height=0)
+
+def process_turn(job, assistant, recorded_audio, streaming):
+    """STT -> reply -> TTS on a background worker; results go on the job, never through st.*"""
+    notify, assistant.notify = assistant.notify, job.notify
+    played = []
     try:
-        audio_base64 = base64.b64encode(audio_bytes).decode()
-        audio_html = f"""
-            <audio autoplay controls style="width: 100%">
-                <source src="data:audio/mp3;base64,{audio_base64}" type="audio/mp3">
-            </audio>
-        """
-        st.markdown(audio_html, unsafe_allow_html=True)
-    except Exception as e:
-        st.error(f"Audio playback error: {e}")
+        with metrics.turn(job.session_id) as trace:
+            transcript = assistant.transcribe_audio(recorded_audio)
+            if not transcript:
+                return
+            job.transcript = transcript
+            job.touch()
 
-def main():
+            if streaming:
+                # Speak each sentence as soon as it is synthesized
+                turn = StreamingTurn(assistant.stream_respond(transcript), assistant.text_to_speech)
+                for sentence, audio in turn:
+                    job.reply = turn.text
+                    if audio:
+                        played.append(audio)
+                        job.clips.append(clip_src(assistant, sentence, audio))
+                    job.touch()
+                job.reply = turn.text
+                job.timing = turn.latencies_ms()
+            else:
+                bot_text = assistant.respond(transcript)
+                if bot_text:
+                    job.reply = bot_text
+                    bot_audio = assistant.text_to_speech(bot_text)
+                    if bot_audio:
+                        played.append(bot_audio)
+                        job.clips.append(clip_src(assistant, bot_text, bot_audio))
+                    job.touch()
+
+            recorder = get_recorder()
+            if recorder is not None:
+                recorder.record(RecordedTurn(
+                    job.session_id, trace.turn_id, "streamlit", transcript, job.reply,
+                    caller_audio=recorded_audio, bot_audio=played, bot_format=assistant.tts_format,
+                    flow=assistant.flow.id, timing={**trace_timing(trace), **job.timing},
+                ))
+    finally:
+        assistant.notify = notify
+
+def bubble_html(role, content):
+    """One transcript bubble"""
+    speaker = "You" if role == "user" else "Bot"
+    return f'<div style="background:#000000;padding:10px;border-radius:10px;margin:5px 0;"><strong>{speaker}:</strong> {content}</div>'
+
+def add_message(role, content, **extra):
+    """Append to the on-screen transcript, keeping only the most recent messages"""
+    st.session_state.messages.append({"role": role, "content": content, **extra})
+    del st.session_state.messages[:-MAX_TRANSCRIPT_MESSAGES]
+
+def save_session():
+    """Persist the conversation so any replica can pick up the next request"""
+    get_session_store().save(st.session_state.session_id, {
+        "bot": st.session_state.assistant.snapshot(),
+        "messages": st.session_state.messages,
+    })
+
+def collect_turn(job):
+    """Move a finished turn into the session transcript and persist it"""
+    if job.error:
+        st.error(f"Turn failed: {job.error}")
+    if job.transcript:
+        add_message("user", job.transcript)
+        if job.reply:
+            add_message("assistant", job.reply)
+        save_session()
+    if job.timing:
+        st.session_state.last_turn_timing = job.timing
+    get_turn_runner().forget(job.session_id)
+
+def render_page():
+    """One script run: submit new audio, show the transcript and the running turn; returns that turn"""
+    if "session_id" not in st.session_state:
+        # The id lives in the URL so a request routed to another replica finds the same session
+        params = st.experimental_get_query_params()
+        session_id = params.get("sid", [""])[0]
+        if not SESSION_ID.fullmatch(session_id):  # it keys the store, recordings and logs: only ids we issued
+            session_id = uuid.uuid4().hex[:12]
+        st.experimental_set_query_params(**{**params, "sid": session_id})
+        st.session_state.session_id = session_id
     if "assistant" not in st.session_state:
-        st.session_state.assistant = VoiceBot()
+        # ?flow= picks the support flow; a restored session keeps the flow it started with
+        flow_id = st.experimental_get_query_params().get("flow", [None])[0]
+        try:
+            st.session_state.assistant = VoiceBot(notify=streamlit_notify, flow=flow_id)
+        except ValueError as e:
+            st.warning(str(e))
+            st.session_state.assistant = VoiceBot(notify=streamlit_notify)
+        saved = get_session_store().load(st.session_state.session_id)
+        if saved:
+            st.session_state.assistant.restore(saved.get("bot", {}))
+            st.session_state.messages = saved.get("messages", [])
+    # Cheap per rerun; edits to the config file apply from the next turn
+    st.session_state.assistant.apply_config(get_config())
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    if "last_turn_timing" not in st.session_state:
+        st.session_state.last_turn_timing = {}
+    metrics.start_metrics_server()
+    start_media_server()
+    runner = get_turn_runner()
+    flow = st.session_state.assistant.flow
     
     st.markdown('<h1 style="text-align:center;color:#FF4B4B;">🎙️ Ola Voice Bot Support</h1>', unsafe_allow_html=True)
     
     # Sidebar
     with st.sidebar:
+        flows = get_prompt_registry().flows()
+        flow_ids = list(flows)
+        selected = st.selectbox("📋 Support flow", flow_ids, format_func=lambda flow_id: flows[flow_id].title,
+                                index=flow_ids.index(flow.id) if flow.id in flows else 0)
+        if selected != flow.id:
+            # Another flow is another conversation
+            st.session_state.messages = []
+            st.session_state.assistant = VoiceBot(notify=streamlit_notify, flow=selected)
+            runner.forget(st.session_state.session_id)
+            get_session_store().delete(st.session_state.session_id)
+            st.experimental_set_query_params(sid=st.session_state.session_id, flow=selected)
+            st.rerun()
+
         st.header("ℹ️ Instructions")
-        st.write("""
+        st.write(f"""
         1. Click the microphone below
-        2. Say in Hindi: *"Main 2 ghante se online hoon par mujhe koi ride nahi mil rahi."*
+        2. Say in Hindi: *"{flow.script.complaint_texts[0]}"*
         3. Wait for bot response
-        4. Then say: *"Haan, yeh mera registered number hai."*
+        4. Then say: *"{flow.confirmation}"*
         """)
         
+        streaming = st.checkbox("⚡ Streaming replies", value=True, help="Speak each sentence as soon as it is generated")
+
         if st.button("🔄 Reset Conversation"):
             st.session_state.messages = []
-            st.session_state.assistant = VoiceBot()
+            st.session_state.assistant = VoiceBot(notify=streamlit_notify, flow=flow.id)
+            runner.forget(st.session_state.session_id)
+            get_session_store().delete(st.session_state.session_id)
             st.rerun()
 
+        cache_stats = st.session_state.assistant.tts_cache.stats()
+        dialogue_stats = st.session_state.assistant.dialogue.stats()
+        st.caption(f"⚡ Scripted fast path: {dialogue_stats['fast_path_turns']} turns / LLM: {dialogue_stats['llm_turns']} turns")
+        st.caption(f"🔊 TTS cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses ({cache_stats['entries']} cached)")
+        coalesced = st.session_state.assistant.flights.stats()["coalesced"]
+        if coalesced:
+            st.caption("🔗 Coalesced requests: " + ", ".join(f"{kind} {n}" for kind, n in sorted(coalesced.items())))
+        for model, limits in st.session_state.assistant.limiter.stats().items():
+            if limits["queue_depth"] or limits["throttled"]:
+                st.caption(f"🚦 {model}: {limits['queue_depth']} queued, avg wait {limits['wait_avg_ms']:.0f} ms, "
+                           f"{limits['rpm']:.0f}/{limits['target_rpm']:.0f} rpm, {limits['throttled']} throttled")
+        for stage, upstream in resilience_stats().items():
+            if upstream["breaker"] != "closed" or upstream["hedged"] or upstream["deadline_exceeded"]:
+                st.caption(f"🛡️ {stage.upper()}: circuit {upstream['breaker']}, {upstream['hedged']} hedged "
+                           f"({upstream['hedge_won']} won), {upstream['deadline_exceeded']} over deadline")
+        upload = upload_stats.as_dict()
+        if upload["uploads"]:
+            st.caption(f"📉 STT uploads: {upload['bytes_saved'] / 1024:.0f} KB saved ({upload['saved_ratio']:.0%})")
+        timing = st.session_state.last_turn_timing
+        if timing.get("first_audio") is not None:
+            st.caption(f"⏱️ Last turn: first token {timing.get('first_token', 0):.0f} ms, first audio {timing['first_audio']:.0f} ms")
+        if "last_render_ms" in st.session_state:
+            turns = runner.stats()
+            st.caption(f"🖼️ Last rerun: {st.session_state.last_render_ms:.0f} ms render "
+                       f"({turns['running']} turns running in background)")
+        recorder = get_recorder()
+        if recorder is not None:
+            recording = recorder.stats()
+            st.caption(f"💾 Recording: {recording['recorded']} turns saved, {recording['queued']} queued, "
+                       f"{recording['dropped']} dropped")
+
+        latency = metrics.get_registry().summary()
+        if latency:
+            with st.expander("📊 Stage latency (p50 / p95 / p99 ms)"):
+                for name, row in latency.items():
+                    st.caption(f"{name}: {row['p50_ms']} / {row['p95_ms']} / {row['p99_ms']} ({row['count']} calls)")
+
     # Main content
     recorded_audio = audio_recorder(
         text="🎤 Press to speak",
@@ -114,37 +258,50 @@ def main():
         icon_size="2x"
     )
     
+    # The recorder keeps returning its last clip on every rerun; only a new clip starts a turn
     if recorded_audio:
-        with st.spinner("🔄 Processing your voice..."):
-            
-            transcript = st.session_state.assistant.transcribe_audio(recorded_audio)
-            
-            if transcript:
-                st.session_state.messages.append({"role": "user", "content": transcript})
-                
-                
-                bot_text = st.session_state.assistant.get_llm_response(transcript)
-                
-                if bot_text:
-                    st.session_state.messages.append({"role": "assistant", "content": bot_text})
-                    
-                    # Convert to speech
-                    bot_audio = st.session_state.assistant.text_to_speech(bot_text)
-    
+        audio_key = hashlib.sha256(recorded_audio).hexdigest()
+        if audio_key != st.session_state.get("last_audio_key"):
+            st.session_state.last_audio_key = audio_key
+            runner.submit(st.session_state.session_id, functools.partial(
+                process_turn, assistant=st.session_state.assistant, recorded_audio=recorded_audio, streaming=streaming))
+
+    job = runner.job(st.session_state.session_id)
+    if job is not None:
+        st.session_state.rendered_version = job.version  # before reading it, so nothing produced meanwhile is missed
+        for level, message in job.notices:
+            streamlit_notify(level, message)
+        if job.done:
+            collect_turn(job)
     
-    if st.session_state.messages:
+    if st.session_state.messages or job is not None:
         st.subheader("💬 Conversation")
+        # One element per settled message, in transcript order: a rerun leaves them in place and the browser
+        # only updates the elements after them (the running turn)
         for msg in st.session_state.messages:
-            if msg["role"] == "user":
-                st.markdown(f'<div style="background:#000000;padding:10px;border-radius:10px;margin:5px 0;"><strong>You:</strong> {msg["content"]}</div>', unsafe_allow_html=True)
-            else:
-                st.markdown(f'<div style="background:#000000;padding:10px;border-radius:10px;margin:5px 0;"><strong>Bot:</strong> {msg["content"]}</div>', unsafe_allow_html=True)
-                
-                
-                if msg == st.session_state.messages[-1]:  # latest message
-                    bot_audio = st.session_state.assistant.text_to_speech(msg["content"])
-                    if bot_audio:
-                        play_audio(bot_audio)
+            st.markdown(bubble_html(msg["role"], msg["content"]), unsafe_allow_html=True)
+
+    if job is not None:
+        if not job.done:
+            if job.transcript:
+                st.markdown(bubble_html("user", job.transcript), unsafe_allow_html=True)
+            if job.reply:
+                st.markdown(bubble_html("assistant", job.reply), unsafe_allow_html=True)
+            if not job.transcript and not job.reply:
+                st.caption("🔄 Processing your voice...")
+        for i, src in enumerate(job.clips):
+            queue_audio(src, f"{job.id}:{i}")
+    return job
+
+def main():
+    with metrics.stage("rerun") as span:
+        job = render_page()
+    st.session_state.last_render_ms = span.seconds * 1000
+    # Rerun for the background turn once it has produced something new (or after TURN_IDLE_SECONDS)
+    if job is not None and not job.done:
+        time.sleep(TURN_POLL_SECONDS)
+        job.wait_for_change(st.session_state.rendered_version, TURN_IDLE_SECONDS)
+        st.rerun()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
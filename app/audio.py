@@ -0,0 +1,170 @@
+"""
+Audio Utilities
+===============
+
+In-memory decode, downmix, resample and re-encode helpers for the voice
+path. Recordings are converted to 16 kHz mono before upload so Whisper gets
+a fraction of the bytes the browser captured, without touching the disk.
+"""
+
+import io
+import threading
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import soundfile as sf
+
+STT_SAMPLE_RATE = 16000
+
+# soundfile format/subtype per upload codec (all accepted by Whisper)
+UPLOAD_CODECS = {
+    "wav": ("WAV", "PCM_16"),
+    "flac": ("FLAC", "PCM_16"),
+    "ogg": ("OGG", "OPUS"),
+}
+
+
+def decode_audio(audio_bytes: bytes) -> Tuple[np.ndarray, int]:
+    """Decode an encoded clip to float32 samples shaped (frames, channels)"""
+    samples, sample_rate = sf.read(io.BytesIO(audio_bytes), dtype="float32", always_2d=True)
+    return samples, sample_rate
+
+
+def to_mono(samples: np.ndarray) -> np.ndarray:
+    """Average channels into a 1-D float32 signal"""
+    if samples.ndim == 1:
+        return samples
+    return samples.mean(axis=1, dtype=np.float32)
+
+
+@lru_cache(maxsize=16)
+def _lowpass_kernel(cutoff: float, taps: int = 63) -> np.ndarray:
+    """Hann-windowed sinc low-pass; cutoff is a fraction of the source Nyquist"""
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = np.sinc(cutoff * n) * np.hanning(taps)
+    kernel = (kernel / kernel.sum()).astype(np.float32)
+    kernel.flags.writeable = False  # shared between calls
+    return kernel
+
+
+def resample(samples: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    """Vectorized resampling of a 1-D signal (anti-aliased when downsampling)"""
+    if src_rate == dst_rate or samples.size == 0:
+        return samples.astype(np.float32, copy=False)
+    if dst_rate < src_rate:
+        samples = np.convolve(samples, _lowpass_kernel(dst_rate / src_rate), mode="same")
+    duration = samples.size / src_rate
+    dst_len = max(1, int(round(duration * dst_rate)))
+    src_positions = np.arange(dst_len, dtype=np.float64) * (src_rate / dst_rate)
+    return np.interp(src_positions, np.arange(samples.size), samples).astype(np.float32)
+
+
+def encode_audio(samples: np.ndarray, sample_rate: int, codec: str = "flac") -> bytes:
+    """Encode a mono float32 signal in memory"""
+    audio_format, subtype = UPLOAD_CODECS[codec]
+    buffer = io.BytesIO()
+    sf.write(buffer, np.clip(samples, -1.0, 1.0), sample_rate, format=audio_format, subtype=subtype)
+    return buffer.getvalue()
+
+
+class UploadStats:
+    """Process-wide counters for bytes saved by preparing audio before upload"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.converted = 0
+        self.rejected = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def record(self, bytes_in: int, bytes_out: int, converted: bool):
+        with self._lock:
+            self.uploads += 1
+            self.converted += int(converted)
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def record_rejected(self, bytes_in: int):
+        """A recording that never reached the API because it held no speech"""
+        with self._lock:
+            self.rejected += 1
+            self.bytes_in += bytes_in
+
+    def as_dict(self) -> Dict:
+        with self._lock:
+            saved = self.bytes_in - self.bytes_out
+            return {
+                "uploads": self.uploads,
+                "converted": self.converted,
+                "rejected": self.rejected,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "bytes_saved": saved,
+                "saved_ratio": saved / self.bytes_in if self.bytes_in else 0.0,
+            }
+
+
+upload_stats = UploadStats()
+
+
+def pcm16_to_float(pcm: bytes) -> np.ndarray:
+    """Raw little-endian int16 PCM to float32 in [-1, 1]"""
+    return np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+
+
+def float_to_pcm16(samples: np.ndarray) -> bytes:
+    """Float32 in [-1, 1] to raw little-endian int16 PCM"""
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+def prepare_samples_for_stt(mono: np.ndarray, sample_rate: int, codec: str = "flac",
+                            target_rate: int = STT_SAMPLE_RATE, vad=None,
+                            bytes_in: Optional[int] = None) -> Optional[Tuple[str, bytes]]:
+    """Resample, trim silence and encode an already-decoded mono signal for upload"""
+    bytes_in = bytes_in if bytes_in is not None else mono.size * 2
+    mono = resample(mono, sample_rate, target_rate)
+    if vad is not None:
+        mono = vad.trim(mono, target_rate)
+        if mono is None:
+            upload_stats.record_rejected(bytes_in)
+            return None
+
+    encoded = encode_audio(mono, target_rate, codec)
+    upload_stats.record(bytes_in, len(encoded), converted=True)
+    return f"audio.{codec}", encoded
+
+
+def prepare_for_stt(audio_bytes: bytes, codec: str = "flac", target_rate: int = STT_SAMPLE_RATE,
+                    vad=None) -> Optional[Tuple[str, bytes]]:
+    """Downmix, resample, trim silence and re-encode a recording for upload
+
+    Returns (filename, encoded bytes), or None when the VAD finds no speech.
+    If the clip cannot be decoded the original bytes are passed through.
+    """
+    try:
+        samples, sample_rate = decode_audio(audio_bytes)
+        mono = resample(to_mono(samples), sample_rate, target_rate)
+    except Exception:
+        upload_stats.record(len(audio_bytes), len(audio_bytes), converted=False)
+        return "audio.wav", audio_bytes
+
+    if vad is not None:
+        mono = vad.trim(mono, target_rate)
+        if mono is None:
+            upload_stats.record_rejected(len(audio_bytes))
+            return None
+
+    try:
+        encoded = encode_audio(mono, target_rate, codec)
+    except Exception:
+        encoded = audio_bytes
+
+    # Never upload more than we were given
+    if len(encoded) >= len(audio_bytes):
+        upload_stats.record(len(audio_bytes), len(audio_bytes), converted=False)
+        return "audio.wav", audio_bytes
+
+    upload_stats.record(len(audio_bytes), len(encoded), converted=True)
+    return f"audio.{codec}", encoded
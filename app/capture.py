@@ -0,0 +1,250 @@
+"""
+Microphone Capture
+==================
+
+Real-time PyAudio capture for the local (non-Pipecat) path, opened with the
+audio settings from app.config. A dedicated thread reads device blocks
+straight into a preallocated int16 ring buffer; an asyncio consumer (VAD,
+STT) takes fixed-size frames out of it as zero-copy views. Memory stays
+constant however long the call runs.
+
+Counters:
+    overflows   the device dropped input because the reader thread fell behind
+    overruns    the consumer fell behind by more than the ring holds (oldest audio dropped)
+    underruns   the consumer waited for a frame longer than the device blocks it takes (capture stalled)
+
+Run a short capture with VAD:
+    python -m app.capture --seconds 10
+"""
+
+import argparse
+import asyncio
+import threading
+import time
+from typing import AsyncIterator, Dict, Optional
+
+import numpy as np
+
+from app.audio import STT_SAMPLE_RATE
+from app.config import get_config
+
+PA_INPUT_OVERFLOWED = -9981  # PortAudio paInputOverflowed
+
+
+class RingBuffer:
+    """Single-producer/single-consumer int16 ring of whole frames
+
+    The capacity is a multiple of the frame size, so every frame handed out is
+    a contiguous view into the ring; it stays valid until the writer laps it.
+    """
+
+    def __init__(self, frame_samples: int, capacity_frames: int):
+        self.frame_samples = frame_samples
+        self.capacity = frame_samples * capacity_frames
+        self._data = np.zeros(self.capacity, dtype=np.int16)
+        self._written = 0  # total samples ever written
+        self._read = 0     # total samples ever consumed
+        self._lock = threading.Lock()
+        self.overruns = 0
+        self.dropped_samples = 0
+        self.max_fill = 0
+
+    def write(self, samples: np.ndarray):
+        """Copy one block in (at most two slices when it wraps); drops the oldest frames if full"""
+        n = samples.size
+        if n > self.capacity:
+            samples, n = samples[-self.capacity:], self.capacity
+        start = self._written % self.capacity
+        first = min(n, self.capacity - start)
+        self._data[start:start + first] = samples[:first]
+        if first < n:
+            self._data[:n - first] = samples[first:]
+        with self._lock:
+            self._written += n
+            fill = self._written - self._read
+            if fill > self.capacity:
+                # Skip the reader ahead to the oldest whole frame still in the ring
+                lag = fill - self.capacity
+                skip = -(-lag // self.frame_samples) * self.frame_samples
+                self._read += skip
+                self.overruns += 1
+                self.dropped_samples += skip
+                fill -= skip
+            self.max_fill = max(self.max_fill, fill)
+
+    def available(self) -> int:
+        """Whole frames ready to read"""
+        with self._lock:
+            return (self._written - self._read) // self.frame_samples
+
+    def read_frame(self) -> Optional[np.ndarray]:
+        """View of the next frame, or None when none is ready"""
+        with self._lock:
+            if self._written - self._read < self.frame_samples:
+                return None
+            start = self._read % self.capacity
+            self._read += self.frame_samples
+        return self._data[start:start + self.frame_samples]
+
+
+class MicrophoneCapture:
+    """Dedicated reader thread -> ring buffer -> fixed-size frames for an asyncio consumer"""
+
+    def __init__(self, config: Optional[Dict] = None, frame_ms: int = 30, buffer_seconds: float = 10.0,
+                 stream_factory=None):
+        config = dict(config or _default_config())
+        config.pop("exception_on_overflow", None)  # a read() option, not an open() one
+        self.config = config
+        self.sample_rate = int(config.get("rate", STT_SAMPLE_RATE))
+        self.block_samples = int(config.get("frames_per_buffer", 1024))
+        self.frame_samples = max(1, self.sample_rate * frame_ms // 1000)
+        # Waiting for the blocks that complete the next frame is normal; a whole block longer means starved
+        blocks_per_frame = -(-self.frame_samples // self.block_samples)
+        self.starved_after = (blocks_per_frame + 1) * self.block_samples / self.sample_rate
+        capacity_frames = max(2, int(buffer_seconds * self.sample_rate) // self.frame_samples)
+        self.ring = RingBuffer(self.frame_samples, capacity_frames)
+        self._stream_factory = stream_factory
+        self._pyaudio = None
+        self._stream = None
+        self._thread: Optional[threading.Thread] = None
+        self._running = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ready: Optional[asyncio.Event] = None
+        self._waiting = False
+        self.blocks = 0
+        self.overflows = 0
+        self.underruns = 0
+        self.error: Optional[BaseException] = None
+
+    def _open(self):
+        if self._stream_factory is not None:
+            return self._stream_factory(self.config)
+        try:
+            import pyaudio
+        except ImportError as e:
+            raise ImportError("Microphone capture needs the 'pyaudio' package: pip install pyaudio") from e
+        self._pyaudio = pyaudio.PyAudio()
+        return self._pyaudio.open(**self.config)
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> "MicrophoneCapture":
+        """Open the stream and start the reader thread (frames() wakes on `loop`)"""
+        if self._thread is not None:
+            return self
+        self._loop = loop or asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+        self._stream = self._open()
+        self._running.set()
+        self._thread = threading.Thread(target=self._read_loop, name="voicebot-capture", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running.clear()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        if self._stream is not None:
+            try:
+                self._stream.stop_stream()
+                self._stream.close()
+            except Exception:
+                pass
+            self._stream = None
+        if self._pyaudio is not None:
+            self._pyaudio.terminate()
+            self._pyaudio = None
+        self._wake()
+
+    def _read_loop(self):
+        try:
+            while self._running.is_set():
+                try:
+                    data = self._stream.read(self.block_samples, exception_on_overflow=True)
+                except IOError as e:
+                    if getattr(e, "errno", None) != PA_INPUT_OVERFLOWED:
+                        raise
+                    # The device buffer overflowed: count it and take what's there now
+                    self.overflows += 1
+                    data = self._stream.read(self.block_samples, exception_on_overflow=False)
+                self.ring.write(np.frombuffer(data, dtype=np.int16))
+                self.blocks += 1
+                if self._waiting and self.ring.available():
+                    self._wake()
+        except BaseException as e:
+            self.error = e
+            self._running.clear()
+            self._wake()
+
+    def _wake(self):
+        if self._loop is not None and self._ready is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._ready.set)
+
+    async def frames(self) -> AsyncIterator[np.ndarray]:
+        """Fixed-size int16 frames as views into the ring; copy a frame to keep it past the next one"""
+        while True:
+            frame = self.ring.read_frame()
+            if frame is not None:
+                yield frame
+                continue
+            if not self._running.is_set():
+                if self.error is not None:
+                    raise self.error
+                return
+            self._ready.clear()
+            self._waiting = True
+            started = time.monotonic()
+            try:
+                if not self.ring.available():  # the writer may have filled a frame since read_frame()
+                    await self._ready.wait()
+            finally:
+                self._waiting = False
+            if self._running.is_set() and time.monotonic() - started > self.starved_after:
+                self.underruns += 1
+
+    def stats(self) -> Dict:
+        return {
+            "sample_rate": self.sample_rate,
+            "frame_samples": self.frame_samples,
+            "blocks": self.blocks,
+            "overflows": self.overflows,
+            "overruns": self.ring.overruns,
+            "dropped_ms": round(self.ring.dropped_samples * 1000 / self.sample_rate, 1),
+            "underruns": self.underruns,
+            "max_fill_ms": round(self.ring.max_fill * 1000 / self.sample_rate, 1),
+            "buffer_ms": round(self.ring.capacity * 1000 / self.sample_rate, 1),
+        }
+
+    async def __aenter__(self) -> "MicrophoneCapture":
+        return self.start()
+
+    async def __aexit__(self, *exc):
+        self.stop()
+
+
+def _default_config() -> Dict:
+    """PyAudio.open() arguments from the runtime config"""
+    return get_config().audio.pyaudio_config()
+
+
+async def _demo(seconds: float):
+    from app.vad import get_vad
+
+    vad = get_vad()
+    speech_frames = total_frames = 0
+    async with MicrophoneCapture(frame_ms=vad.frame_ms) as capture:
+        print(f"🎙️ Capturing {seconds:.0f}s at {capture.sample_rate}Hz...")
+        deadline = time.monotonic() + seconds
+        async for frame in capture.frames():
+            total_frames += 1
+            speech_frames += vad.frame_is_speech(frame, capture.sample_rate)
+            if time.monotonic() >= deadline:
+                break
+    print(f"✅ {total_frames} frames, {speech_frames} with speech")
+    for name, value in capture.stats().items():
+        print(f"  {name}: {value}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capture from the configured microphone through the ring buffer")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    asyncio.run(_demo(parser.parse_args().seconds))
@@ -0,0 +1,92 @@
+"""
+Shared OpenAI Clients
+=====================
+
+Process-wide OpenAI clients with a pooled, keep-alive HTTP transport so TLS
+connections are reused across Streamlit sessions and VoiceBot instances.
+The SDK never retries (max_retries=0): app.ratelimit retries in a fresh
+slot so retries are charged to the rate limits. Every response is also fed
+to the limiter so limits adapt to 429s and headers.
+
+Tuning (environment variables):
+    OPENAI_MAX_CONNECTIONS      total pooled connections        (default 50)
+    OPENAI_MAX_KEEPALIVE        idle keep-alive connections     (default 20)
+    OPENAI_KEEPALIVE_EXPIRY     seconds an idle socket is kept  (default 30)
+    OPENAI_TIMEOUT              read/write timeout in seconds   (default 30)
+    OPENAI_CONNECT_TIMEOUT      connect timeout in seconds      (default 5)
+"""
+
+import asyncio
+import os
+import threading
+import weakref
+from functools import lru_cache
+from typing import Dict
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+from app.ratelimit import aobserve_response, observe_response
+
+
+def client_settings() -> Dict:
+    """Pool and timeout settings read from the environment"""
+    return {
+        "api_key": os.getenv("OPENAI_API_KEY"),
+        "base_url": os.getenv("OPENAI_BASE_URL") or None,
+        "max_connections": int(os.getenv("OPENAI_MAX_CONNECTIONS", "50")),
+        "max_keepalive": int(os.getenv("OPENAI_MAX_KEEPALIVE", "20")),
+        "keepalive_expiry": float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30")),
+        "timeout": float(os.getenv("OPENAI_TIMEOUT", "30")),
+        "connect_timeout": float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5")),
+    }
+
+
+def _transport_options(settings: Dict) -> Dict:
+    return {
+        "limits": httpx.Limits(
+            max_connections=settings["max_connections"],
+            max_keepalive_connections=settings["max_keepalive"],
+            keepalive_expiry=settings["keepalive_expiry"],
+        ),
+        "timeout": httpx.Timeout(settings["timeout"], connect=settings["connect_timeout"]),
+    }
+
+
+@lru_cache(maxsize=None)
+def get_openai_client() -> OpenAI:
+    """Synchronous client shared by every session in this process"""
+    settings = client_settings()
+    return OpenAI(
+        api_key=settings["api_key"],
+        base_url=settings["base_url"],
+        max_retries=0,  # retried by app.ratelimit, one slot per attempt
+        http_client=httpx.Client(**_transport_options(settings), event_hooks={"response": [observe_response]}),
+    )
+
+
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+_async_lock = threading.Lock()
+
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """Async client shared by every coroutine on the running event loop
+
+    httpx async pools are bound to the loop that created them, so one client
+    is kept per loop rather than one per process.
+    """
+    loop = asyncio.get_running_loop()
+    with _async_lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            settings = client_settings()
+            client = AsyncOpenAI(
+                api_key=settings["api_key"],
+                base_url=settings["base_url"],
+                max_retries=0,
+                http_client=httpx.AsyncClient(
+                    **_transport_options(settings), event_hooks={"response": [aobserve_response]}
+                ),
+            )
+            _async_clients[loop] = client
+        return client
@@ -0,0 +1,236 @@
+"""
+Runtime Configuration
+=====================
+
+Typed, validated settings shared by the Streamlit app (app.py) and the
+Pipecat pipeline (app/main.py). Values are layered: defaults, then a JSON
+or TOML file, then environment overrides. The result is validated once and
+cached; pyaudio and pipecat are only imported by the helpers that build
+their parameter objects.
+
+    VOICE_CONFIG               config file path        (default voice_bot_config.json, else voice_bot_config.toml)
+    VOICE_AUDIO_<FIELD>        override an audio field, e.g. VOICE_AUDIO_SAMPLE_RATE=16000
+    VOICE_<FIELD>              override a top-level field, e.g. VOICE_TTS_VOICE=alloy
+
+voice_bot_config_helper.py writes voice_bot_config.json from the audio
+diagnostics of the machine it runs on, so the file is not kept in git
+(voice_bot_config.example.json shows the layout). A TOML file uses the same
+keys with an [audio] table.
+
+Hot reload: get_config() re-reads the file when it changes (checked at most
+every couple of seconds), and long-running loops can follow changes with
+`async for config in watch_config()`. Model, voice and VAD settings apply
+to the next turn; audio device settings apply when the stream is reopened.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import AsyncIterator, Dict, NamedTuple, Optional
+
+DEFAULT_CONFIG_FILES = ("voice_bot_config.json", "voice_bot_config.toml")
+SAMPLE_RATES = (8000, 16000, 22050, 24000, 32000, 44100, 48000)
+TTS_VOICES = ("alloy", "echo", "fable", "onyx", "nova", "shimmer")
+
+
+class AudioSettings(NamedTuple):
+    """Capture and playback device settings"""
+    device_index: Optional[int] = None        # PyAudio input device (None: system default)
+    device_name: str = "Default"
+    sample_rate: int = 16000                  # capture rate
+    native_sample_rate: Optional[int] = None  # device default, for reference
+    output_sample_rate: int = 24000           # speaker rate (OpenAI TTS PCM)
+    output_device_index: Optional[int] = None
+    channels: int = 1
+    chunk_size: int = 1024
+    exception_on_overflow: bool = False
+
+    def pyaudio_config(self) -> Dict:
+        """Keyword arguments for PyAudio.open() on the capture stream"""
+        import pyaudio
+
+        config = {
+            "format": pyaudio.paInt16,
+            "channels": self.channels,
+            "rate": self.sample_rate,
+            "input": True,
+            "frames_per_buffer": self.chunk_size,
+        }
+        if self.device_index is not None:
+            config["input_device_index"] = self.device_index
+        return config
+
+    def pipecat_params(self, **kwargs):
+        """LocalAudioTransportParams for the Pipecat pipeline"""
+        from pipecat.transports.local.audio import LocalAudioTransportParams
+
+        return LocalAudioTransportParams(
+            audio_in_sample_rate=self.sample_rate,
+            audio_out_sample_rate=self.output_sample_rate,
+            audio_in_channels=self.channels,
+            audio_out_channels=1,
+            input_device_index=self.device_index,
+            output_device_index=self.output_device_index,
+            **kwargs,
+        )
+
+
+class VoiceConfig(NamedTuple):
+    """Everything the voice paths read at runtime"""
+    audio: AudioSettings = AudioSettings()
+    stt_model: str = "whisper-1"
+    llm_model: str = "gpt-4o-mini"
+    tts_model: str = "tts-1"
+    tts_voice: str = "nova"
+    flow: str = "ride_issue"               # default support flow (app.prompts)
+    vad_threshold: Optional[float] = None  # None: calibrated from the diagnostics report
+    source: Optional[str] = None           # file the values came from
+
+
+# Types of fields whose default is None
+_OPTIONAL_TYPES = {"device_index": int, "native_sample_rate": int, "output_device_index": int, "vad_threshold": float}
+
+
+def _coerce(value, default, field: str):
+    """Convert a file or env value to the type of the field"""
+    if value is None:
+        return None
+    if isinstance(default, bool):
+        if isinstance(value, str):
+            return value.strip().lower() in ("1", "true", "yes", "on")
+        return bool(value)
+    if default is None:
+        return _OPTIONAL_TYPES.get(field, str)(value)
+    return type(default)(value)
+
+
+def _build(cls, values: Dict, env_prefix: str, env):
+    fields = {}
+    for field, default in cls._field_defaults.items():
+        if isinstance(default, tuple) or field == "source":  # nested settings are built separately
+            continue
+        value = values.get(field, default)
+        override = env.get(f"{env_prefix}{field.upper()}")
+        if override not in (None, ""):
+            value = override
+        try:
+            fields[field] = _coerce(value, default, field)
+        except (TypeError, ValueError):
+            raise ValueError(f"{field}: invalid value {value!r}")
+    return fields
+
+
+def validate(config: VoiceConfig) -> VoiceConfig:
+    """Reject settings that would only fail later, mid-call"""
+    problems = []
+    audio = config.audio
+    if audio.sample_rate not in SAMPLE_RATES:
+        problems.append(f"audio.sample_rate {audio.sample_rate} not one of {SAMPLE_RATES}")
+    if audio.output_sample_rate not in SAMPLE_RATES:
+        problems.append(f"audio.output_sample_rate {audio.output_sample_rate} not one of {SAMPLE_RATES}")
+    if audio.channels not in (1, 2):
+        problems.append(f"audio.channels must be 1 or 2, got {audio.channels}")
+    if audio.chunk_size <= 0:
+        problems.append(f"audio.chunk_size must be positive, got {audio.chunk_size}")
+    if config.tts_voice not in TTS_VOICES:
+        problems.append(f"tts_voice {config.tts_voice!r} not one of {TTS_VOICES}")
+    if config.vad_threshold is not None and config.vad_threshold <= 0:
+        problems.append(f"vad_threshold must be positive, got {config.vad_threshold}")
+    if problems:
+        raise ValueError("Invalid voice config: " + "; ".join(problems))
+    return config
+
+
+def _read_file(path: str) -> Dict:
+    if path.endswith(".toml"):
+        import tomllib
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def config_path() -> Optional[str]:
+    """File named by VOICE_CONFIG, else the first default file that exists"""
+    path = os.getenv("VOICE_CONFIG")
+    if path:
+        return path
+    for candidate in DEFAULT_CONFIG_FILES:
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def load_config(path: Optional[str] = None, env=None) -> VoiceConfig:
+    """Defaults <- file <- environment, validated"""
+    env = os.environ if env is None else env
+    values = _read_file(path) if path else {}
+    audio_values = values.get("audio", {})
+    audio = AudioSettings(**_build(AudioSettings, audio_values, "VOICE_AUDIO_", env))
+    top = _build(VoiceConfig, values, "VOICE_", env)
+    top["source"] = path
+    return validate(VoiceConfig(audio=audio, **top))
+
+
+class _ConfigCache:
+    """Current config plus the file stamp it was loaded from"""
+
+    def __init__(self, check_interval: float = 2.0):
+        self.check_interval = check_interval
+        self.config: Optional[VoiceConfig] = None
+        self.stamp = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def _stamp(self, path: Optional[str]):
+        if not path:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return path, stat.st_mtime_ns, stat.st_size
+
+    def get(self, force: bool = False) -> VoiceConfig:
+        now = time.monotonic()
+        with self.lock:
+            if self.config is not None and not force and now - self.checked_at < self.check_interval:
+                return self.config
+            self.checked_at = now
+            path = config_path()
+            stamp = self._stamp(path)
+            if self.config is not None and stamp == self.stamp and not force:
+                return self.config
+            try:
+                config = load_config(path if stamp else None)
+            except Exception as e:
+                if self.config is None:
+                    raise
+                print(f"⚠️  Config reload failed, keeping previous settings: {e}")
+                self.stamp = stamp  # don't retry the same broken file every check
+                return self.config
+            if self.config is not None:
+                print(f"✅ Reloaded voice config from {path}")
+            self.config, self.stamp = config, stamp
+            return config
+
+
+_cache = _ConfigCache()
+
+
+def get_config(force: bool = False) -> VoiceConfig:
+    """Process-wide config; cheap to call per turn, picks up file changes"""
+    return _cache.get(force)
+
+
+async def watch_config(interval: float = 2.0) -> AsyncIterator[VoiceConfig]:
+    """Yield the config each time it changes (for long-running call loops)"""
+    current = get_config()
+    while True:
+        await asyncio.sleep(interval)
+        latest = await asyncio.to_thread(get_config)
+        if latest is not current:
+            current = latest
+            yield latest
@@ -0,0 +1,213 @@
+"""
+Dialogue Engine
+===============
+
+Deterministic state machine for the scripted support flow. Whisper text is
+transliterated (Devanagari to Latin), phonetically folded and fuzzy-matched
+against the expected user turns; a confident match advances the state and
+returns the scripted reply without calling the LLM. Anything else falls back
+to the LLM.
+"""
+
+import re
+import threading
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from app.phrase_bank import extract_scripted_lines, split_sentences
+
+WAITING_FOR_COMPLAINT = "waiting_for_complaint"
+WAITING_FOR_CONFIRMATION = "waiting_for_confirmation"
+ENDED = "ended"
+
+DEFAULT_THRESHOLD = 0.72
+DEFAULT_CONFIRMATION = "Haan, yeh mera registered number hai."
+
+_USER_SAYS_PATTERN = re.compile(r'user to say:\s*"([^"]+)"', re.IGNORECASE)
+
+_CONFIRM_WORDS = {"haan", "han", "ha", "haa", "haanji", "ji", "jee", "yes", "sahi", "bilkul", "theek", "thik", "hanji"}
+_NEGATE_WORDS = {"nahi", "nahin", "nai", "na", "no", "galat"}
+
+# Devanagari -> Latin (ITRANS-like, lossy but stable)
+_VOWELS = {
+    "अ": "a", "आ": "aa", "इ": "i", "ई": "ee", "उ": "u", "ऊ": "oo", "ऋ": "ri",
+    "ए": "e", "ऐ": "ai", "ओ": "o", "औ": "au", "ऑ": "o",
+}
+_MATRAS = {
+    "ा": "aa", "ि": "i", "ी": "ee", "ु": "u", "ू": "oo", "ृ": "ri",
+    "े": "e", "ै": "ai", "ो": "o", "ौ": "au", "ॉ": "o",
+}
+_CONSONANTS = {
+    "क": "k", "ख": "kh", "ग": "g", "घ": "gh", "ङ": "n",
+    "च": "ch", "छ": "chh", "ज": "j", "झ": "jh", "ञ": "n",
+    "ट": "t", "ठ": "th", "ड": "d", "ढ": "dh", "ण": "n",
+    "त": "t", "थ": "th", "द": "d", "ध": "dh", "न": "n",
+    "प": "p", "फ": "ph", "ब": "b", "भ": "bh", "म": "m",
+    "य": "y", "र": "r", "ल": "l", "व": "v", "श": "sh", "ष": "sh",
+    "स": "s", "ह": "h", "क़": "k", "ख़": "kh", "ग़": "g", "ज़": "z",
+    "ड़": "r", "ढ़": "rh", "फ़": "f",
+}
+_NASALS = {"ं": "n", "ँ": "n"}
+_VIRAMA = "्"
+_NUKTA = "़"
+
+_FOLDS = [
+    ("chh", "ch"), ("ph", "f"), ("kh", "k"), ("gh", "g"), ("jh", "j"), ("th", "t"),
+    ("dh", "d"), ("bh", "b"), ("sh", "s"), ("w", "v"), ("z", "j"), ("q", "k"),
+    ("ee", "i"), ("oo", "u"), ("aa", "a"), ("ey", "e"), ("ai", "e"),
+]
+
+
+def transliterate(text: str) -> str:
+    """Romanize Devanagari; Latin text passes through unchanged"""
+    text = unicodedata.normalize("NFC", text)
+    out = []
+    pending_a = False
+    for ch in text:
+        if ch == _NUKTA:
+            continue
+        if ch in _CONSONANTS:
+            if pending_a:
+                out.append("a")
+            out.append(_CONSONANTS[ch])
+            pending_a = True
+        elif ch in _MATRAS:
+            out.append(_MATRAS[ch])
+            pending_a = False
+        elif ch == _VIRAMA:
+            pending_a = False
+        elif ch in _NASALS:
+            if pending_a:
+                out.append("a")
+            out.append(_NASALS[ch])
+            pending_a = False
+        elif ch in _VOWELS:
+            if pending_a:
+                out.append("a")
+            out.append(_VOWELS[ch])
+            pending_a = False
+        else:
+            # Word boundary: drop the final inherent vowel (schwa deletion)
+            pending_a = False
+            out.append(ch)
+    return "".join(out)
+
+
+def fold(text: str) -> str:
+    """Transliterate, lowercase and collapse spelling variants Whisper produces"""
+    text = transliterate(text).lower()
+    text = re.sub(r"[^a-z0-9\s]", " ", text)
+    for src, dst in _FOLDS:
+        text = text.replace(src, dst)
+    text = re.sub(r"(.)\1+", r"\1", text)
+    return " ".join(text.split())
+
+
+def similarity(a: str, b: str) -> float:
+    """Blend of character-level and token-level similarity of two folded strings"""
+    if not a or not b:
+        return 0.0
+    char_score = SequenceMatcher(None, a, b).ratio()
+    tokens_a, tokens_b = set(a.split()), set(b.split())
+    token_score = len(tokens_a & tokens_b) / len(tokens_b)
+    return max(char_score, (char_score + token_score) / 2)
+
+
+class Script(NamedTuple):
+    """A support script compiled for matching (see compile_script)"""
+    greeting: str
+    solution: str
+    complaint_texts: Tuple[str, ...]
+    complaints: Tuple[str, ...]  # folded
+    confirmation: str            # folded
+
+
+def compile_script(system_prompt: str, confirmation: str = DEFAULT_CONFIRMATION) -> Script:
+    """Extract and fold the script once; raises ValueError if the prompt has none"""
+    bot_lines = extract_scripted_lines(system_prompt)
+    complaints = _USER_SAYS_PATTERN.findall(system_prompt)
+    if len(bot_lines) < 2 or not complaints:
+        raise ValueError("System prompt does not contain a recognizable script")
+    return Script(bot_lines[0], bot_lines[-1], tuple(complaints), tuple(fold(c) for c in complaints),
+                  fold(confirmation))
+
+
+class Match(NamedTuple):
+    intent: str
+    reply: str
+    confidence: float
+    next_state: str
+
+
+class DialogueEngine:
+    """Advance the scripted conversation locally; None means ask the LLM"""
+
+    def __init__(self, system_prompt: Optional[str] = None, threshold: float = DEFAULT_THRESHOLD,
+                 state: str = WAITING_FOR_COMPLAINT, script: Optional[Script] = None):
+        # A precompiled script (app.prompts) skips parsing and folding per conversation
+        script = script or compile_script(system_prompt)
+
+        self.threshold = threshold
+        self.state = state
+        self.greeting = script.greeting
+        self.solution = script.solution
+        self.complaint_texts = script.complaint_texts
+        self.complaints = script.complaints
+        self.confirmation = script.confirmation
+        self.fast_path_turns = 0
+        self.llm_turns = 0
+        self._lock = threading.Lock()
+
+    def _score_complaint(self, folded: str) -> float:
+        return max(similarity(folded, c) for c in self.complaints)
+
+    def _score_confirmation(self, folded: str) -> float:
+        tokens = folded.split()
+        # Any negation ("haan par number galat hai") is not a confirmation: the LLM sorts it out
+        if not tokens or any(t in _NEGATE_WORDS for t in tokens):
+            return 0.0
+        if tokens[0] in _CONFIRM_WORDS:
+            return 1.0 if len(tokens) <= 2 else max(0.9, similarity(folded, self.confirmation))
+        return similarity(folded, self.confirmation)
+
+    def classify(self, transcript: str) -> Optional[Match]:
+        """Score the transcript against the step expected in the current state"""
+        folded = fold(transcript or "")
+        if self.state == WAITING_FOR_COMPLAINT:
+            confidence = self._score_complaint(folded)
+            match = Match("complaint", self.greeting, confidence, WAITING_FOR_CONFIRMATION)
+        elif self.state == WAITING_FOR_CONFIRMATION:
+            confidence = self._score_confirmation(folded)
+            match = Match("confirmation", self.solution, confidence, ENDED)
+        else:
+            return None
+        return match if match.confidence >= self.threshold else None
+
+    def respond(self, transcript: str) -> Optional[Match]:
+        """Return the scripted reply and advance state, or None to fall back to the LLM"""
+        with self._lock:
+            match = self.classify(transcript)
+            if match:
+                self.state = match.next_state
+                self.fast_path_turns += 1
+            else:
+                self.llm_turns += 1
+            return match
+
+    def reprompt(self) -> Optional[str]:
+        """The scripted question still waiting for an answer (pre-rendered as its own sentence), if any"""
+        if self.state == WAITING_FOR_CONFIRMATION:
+            return split_sentences(self.greeting)[-1]
+        return None
+
+    def stats(self) -> Dict:
+        """How many turns the fast path handled versus the LLM"""
+        total = self.fast_path_turns + self.llm_turns
+        return {
+            "state": self.state,
+            "fast_path_turns": self.fast_path_turns,
+            "llm_turns": self.llm_turns,
+            "fast_path_rate": self.fast_path_turns / total if total else 0.0,
+        }
+
@@ -0,0 +1,82 @@
+"""
+Audio Format Negotiation
+========================
+
+Picks the TTS response_format and sample rates per audio sink, so speech
+goes from OpenAI to the speaker, browser or socket in a form the sink plays
+as is: at most one vectorized resample of raw PCM, never a decode/re-encode.
+
+    sink        TTS format                  sink rate
+    browser     mp3 (TTS_BROWSER_FORMATS)   decoded by the browser
+    pipecat     pcm                         transport output rate
+    gateway     what the client asks for    "reply_sample_rate" (pcm only)
+
+OpenAI returns "pcm" as 24 kHz 16-bit mono, which is also what Pipecat's
+OpenAI TTS service and the local transport output expect. Capture runs at
+16 kHz, the rate Whisper and the VAD work at, whatever the device's native
+rate is.
+
+    TTS_BROWSER_FORMATS   formats the browser player accepts, in order of preference   (default "mp3")
+"""
+
+import os
+from typing import NamedTuple, Optional, Sequence
+
+from app.audio import STT_SAMPLE_RATE, float_to_pcm16, pcm16_to_float, resample
+
+TTS_PCM_RATE = 24000  # OpenAI "pcm": raw 16-bit little-endian mono at 24 kHz
+CAPTURE_RATE = STT_SAMPLE_RATE
+
+MIME_TYPES = {
+    "mp3": "audio/mpeg",
+    "opus": "audio/ogg",
+    "aac": "audio/aac",
+    "flac": "audio/flac",
+    "wav": "audio/wav",
+    "pcm": "application/octet-stream",
+}
+
+# Names sinks use for formats the TTS API calls something else
+_ALIASES = {"pcm_s16le": "pcm", "s16le": "pcm", "ogg": "opus", "mpeg": "mp3"}
+
+
+class AudioPlan(NamedTuple):
+    """How one sink receives speech"""
+    response_format: str
+    sample_rate: Optional[int] = None    # rate delivered to the sink (raw PCM only)
+    resample_from: Optional[int] = None  # TTS rate to convert from, None when no conversion is needed
+
+    @property
+    def mime_type(self) -> str:
+        return MIME_TYPES[self.response_format]
+
+
+def negotiate(accepts: Sequence[str], sample_rate: Optional[int] = None) -> AudioPlan:
+    """First format in `accepts` the TTS can produce; raw PCM is matched to `sample_rate`"""
+    for name in accepts:
+        fmt = _ALIASES.get(name.strip().lower(), name.strip().lower())
+        if fmt not in MIME_TYPES:
+            continue
+        if fmt != "pcm":
+            return AudioPlan(fmt)
+        rate = int(sample_rate or TTS_PCM_RATE)
+        return AudioPlan("pcm", rate, TTS_PCM_RATE if rate != TTS_PCM_RATE else None)
+    raise ValueError(f"No TTS format matches {list(accepts)}; supported: {', '.join(MIME_TYPES)}")
+
+
+def adapt(audio: bytes, plan: AudioPlan) -> bytes:
+    """Convert synthesized audio to what the sink was promised (a no-op unless rates differ)"""
+    if not audio or plan.resample_from is None:
+        return audio
+    return float_to_pcm16(resample(pcm16_to_float(audio), plan.resample_from, plan.sample_rate))
+
+
+def browser_plan() -> AudioPlan:
+    """Plan for the Streamlit player (container formats, decoded by the browser)"""
+    return negotiate(os.getenv("TTS_BROWSER_FORMATS", "mp3").split(","))
+
+
+def pipecat_plan(output_rate: Optional[int] = None) -> AudioPlan:
+    """Plan for the local Pipecat transport: raw PCM at the speaker output rate"""
+    return negotiate(["pcm"], output_rate or TTS_PCM_RATE)
+
@@ -0,0 +1,445 @@
+"""
+Voice Gateway
+=============
+
+Headless FastAPI/WebSocket gateway for real concurrent calls, alongside the
+Streamlit UI. Every call is a set of asyncio tasks on one event loop and
+reuses the VoiceBot STT/LLM/TTS logic through its async methods. Inbound and
+outbound audio go through small bounded queues, so a slow caller or a slow
+upstream only ever stalls its own call.
+
+Speech is transcribed while it streams in (app.streaming_stt): a partial is
+taken as soon as the caller pauses, and when it matches a scripted intent
+the reply's TTS is dispatched speculatively. If the final transcript lands
+on a different reply the speculative synthesis is cancelled and the turn
+runs normally. "first_audio" spans measure end of speech to first reply audio.
+
+Upstream calls run under deadlines with hedging and circuit breakers
+(app.resilience). If no reply sentence is ready UPSTREAM_HOLD_AFTER_MS after
+the caller stopped talking, a short hold line is spoken so the line never
+goes silent; a failed LLM call is answered with a scripted re-prompt.
+
+With RECORDINGS_DIR set every turn (caller audio, transcript, reply text and
+audio) is handed to the background recorder (app.recording) once it ends.
+
+Protocol (one WebSocket per call at /ws/call):
+    client -> server  binary  16-bit little-endian mono PCM (16 kHz unless negotiated)
+                      text    {"type": "start", "sample_rate": 16000, "session_id": ..., "flow": ...,
+                               "reply_format": "pcm", "reply_sample_rate": 24000}
+                              {"type": "end_of_utterance"}   optional, server-side VAD also endpoints
+                              {"type": "hangup"}
+    server -> client  text    {"type": "ready", "call_id": ..., "session_id": ...}
+                              {"type": "transcript", "text": ...}
+                              {"type": "reply_start", "format": "pcm_s16le", "sample_rate": 24000}   as negotiated
+                              {"type": "reply_text", "text": ...}
+                              {"type": "reply_end"}
+                              {"type": "notice", "level": ..., "message": ...}
+                      binary  reply audio chunks
+
+A malformed control message (bad JSON, a sample_rate outside 8-48 kHz), an
+odd-length audio frame or a turn that fails is answered with an error notice
+and otherwise ignored; the call stays up.
+
+session_id resumes a stored session; flow picks the support flow
+(app.prompts, default from the config). reply_format is any TTS format (pcm,
+opus, mp3, ...); reply_sample_rate applies to pcm, which is synthesized at
+24 kHz and only resampled when the client asks for another rate.
+
+Run:
+    python -m app.gateway        (GATEWAY_HOST, GATEWAY_PORT, GATEWAY_MAX_CALLS)
+"""
+
+import asyncio
+import json
+import os
+import time
+import traceback
+import uuid
+from collections import deque
+from typing import Optional
+
+import numpy as np
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse
+
+from app import metrics
+from app.audio import STT_SAMPLE_RATE, pcm16_to_float
+from app.formats import TTS_PCM_RATE, AudioPlan, adapt, negotiate
+from app.ratelimit import get_rate_limiter
+from app.recording import RecordedTurn, get_recorder, trace_timing
+from app.resilience import HOLD_AFTER_SECONDS, HOLD_LINE, resilience_stats
+from app.services import VoiceBot
+from app.store import get_session_store
+from app.streaming import SentenceChunker
+from app.streaming_stt import Partial, create_recognizer
+
+REPLY_FORMAT = "pcm"
+REPLY_SAMPLE_RATE = TTS_PCM_RATE  # no resampling unless the client asks for another rate
+REPLY_CHUNK_BYTES = REPLY_SAMPLE_RATE * 2 // 10  # 100 ms of 16-bit mono
+MIN_SAMPLE_RATE, MAX_SAMPLE_RATE = 8000, 48000  # caller audio rates accepted in "start"
+
+_END_OF_UTTERANCE = object()
+
+
+class CallSession:
+    """One caller: receive -> segment -> turn -> send, each stage its own task"""
+
+    def __init__(self, websocket: WebSocket, sample_rate: int = STT_SAMPLE_RATE, inbound_frames: int = 50,
+                 outbound_chunks: int = 64, endpoint_silence_ms: int = 700, preroll_ms: int = 300):
+        self.websocket = websocket
+        self.call_id = uuid.uuid4().hex[:12]
+        self.session_id = self.call_id
+        self.sessions = get_session_store()
+        self.sample_rate = sample_rate
+        self.endpoint_silence_ms = endpoint_silence_ms
+        self.preroll_ms = preroll_ms
+        self.bot = VoiceBot(notify=self._notify)
+        self.reply = negotiate([REPLY_FORMAT], REPLY_SAMPLE_RATE)
+        self.inbound: asyncio.Queue = asyncio.Queue(maxsize=inbound_frames)
+        self.outbound: asyncio.Queue = asyncio.Queue(maxsize=outbound_chunks)
+        self.utterances: asyncio.Queue = asyncio.Queue(maxsize=4)
+        self.recognizer = create_recognizer(self.bot, sample_rate, on_partial=self._on_partial)
+        self._speculation = None  # (reply, synthesis tasks) dispatched from a partial
+        self._partial_intent = None
+        self.turns = 0
+
+    def _notify(self, level, message):
+        try:
+            self.outbound.put_nowait({"type": "notice", "level": level, "message": message})
+        except asyncio.QueueFull:
+            pass
+
+    async def run(self):
+        await self.websocket.send_json({"type": "ready", "call_id": self.call_id, "session_id": self.session_id})
+        workers = [
+            asyncio.create_task(self._segment()),
+            asyncio.create_task(self._take_turns()),
+            asyncio.create_task(self._send()),
+        ]
+        try:
+            await self._receive()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _receive(self):
+        """Read frames; a full inbound queue stops reading, which pushes back on the caller"""
+        while True:
+            try:
+                message = await self.websocket.receive()
+            except WebSocketDisconnect:
+                return
+            if message.get("type") == "websocket.disconnect":
+                return
+            if message.get("bytes"):
+                frame = message["bytes"]
+                if len(frame) % 2:
+                    # Not whole 16-bit samples: drop it rather than let it break the segmenter
+                    self._notify("error", f"Ignored audio frame of {len(frame)} bytes (odd length)")
+                    continue
+                await self.inbound.put(frame)
+            elif message.get("text"):
+                try:
+                    if not await self._control(json.loads(message["text"])):
+                        return
+                except (ValueError, TypeError, AttributeError) as e:
+                    # A malformed control frame is reported; the call carries on
+                    self._notify("error", f"Ignored control message: {e}")
+
+    async def _control(self, control: dict) -> bool:
+        """Apply one control message; False on hangup"""
+        kind = control.get("type")
+        if kind == "start":
+            sample_rate = int(control.get("sample_rate", self.sample_rate))
+            if not MIN_SAMPLE_RATE <= sample_rate <= MAX_SAMPLE_RATE:
+                raise ValueError(f"sample_rate {sample_rate} outside {MIN_SAMPLE_RATE}-{MAX_SAMPLE_RATE} Hz")
+            self.sample_rate = sample_rate
+            self.recognizer.sample_rate = sample_rate
+            self._negotiate_reply(control)
+            if control.get("flow"):
+                self._use_flow(control["flow"])
+            if control.get("session_id"):
+                await self._resume(str(control["session_id"]))
+        elif kind == "end_of_utterance":
+            await self.inbound.put(_END_OF_UTTERANCE)
+        elif kind == "hangup":
+            return False
+        return True
+
+    def _use_flow(self, flow_id: str):
+        try:
+            self.bot.use_flow(flow_id)
+        except ValueError as e:
+            self._notify("warning", f"{e}; using {self.bot.flow.id}")
+            return
+        # The stand-in recognizer "hears" the flow's complaint
+        self.recognizer = create_recognizer(self.bot, self.sample_rate, on_partial=self._on_partial)
+
+    def _negotiate_reply(self, control):
+        try:
+            self.reply = negotiate([control.get("reply_format", REPLY_FORMAT)],
+                                   control.get("reply_sample_rate", REPLY_SAMPLE_RATE))
+        except ValueError as e:
+            self._notify("warning", f"{e}; replying with {self.reply.response_format}")
+
+    def _reply_start(self) -> dict:
+        if self.reply.response_format == "pcm":
+            return {"type": "reply_start", "format": "pcm_s16le", "sample_rate": self.reply.sample_rate}
+        return {"type": "reply_start", "format": self.reply.response_format, "mime_type": self.reply.mime_type}
+
+    def _chunk_bytes(self) -> int:
+        if self.reply.response_format == "pcm":
+            return self.reply.sample_rate * 2 // 10
+        return REPLY_CHUNK_BYTES
+
+    async def _speak(self, sentence: str, plan: AudioPlan) -> Optional[bytes]:
+        """Synthesize in the negotiated format; PCM is only resampled when the client asked for another rate"""
+        audio = await self.bot.atext_to_speech(sentence, plan.response_format)
+        if audio and plan.resample_from is not None:
+            with metrics.stage("resample", bytes_in=len(audio)) as span:
+                audio = await asyncio.to_thread(adapt, audio, plan)
+                span.bytes_out = len(audio)
+        return audio
+
+    def _on_partial(self, partial: Partial):
+        """Speculatively synthesize the scripted reply once a partial settles on an intent"""
+        match = self.bot.dialogue.classify(partial.text)
+        intent = match.intent if match else None
+        stable = partial.at_pause or intent == self._partial_intent
+        self._partial_intent = intent
+        if match is None or not stable:
+            return
+        if self._speculation is not None:
+            if self._speculation[0] == match.reply:
+                return
+            self._cancel_speculation()
+        chunker = SentenceChunker()
+        sentences = chunker.feed(match.reply) + chunker.flush()
+        # Same format and rate as the real turn, so its TTS calls join these (single-flight) or hit the cache
+        tasks = [asyncio.create_task(self._speak(sentence, self.reply)) for sentence in sentences]
+        self._speculation = (match.reply, tasks)
+        metrics.get_registry().count("speculation", "dispatched")
+
+    def _cancel_speculation(self):
+        _, tasks = self._speculation
+        for task in tasks:
+            task.cancel()
+        self._speculation = None
+
+    def _settle_speculation(self, transcript: Optional[str]):
+        """Keep the speculative reply if the final transcript leads to it, otherwise cancel it"""
+        self._partial_intent = None
+        if self._speculation is None:
+            return
+        match = self.bot.dialogue.classify(transcript) if transcript else None
+        if match is not None and match.reply == self._speculation[0]:
+            self._speculation = None
+            metrics.get_registry().count("speculation", "hit")
+        else:
+            self._cancel_speculation()
+            metrics.get_registry().count("speculation", "cancelled")
+
+    async def _resume(self, session_id: str):
+        """Continue a conversation started on this or any other gateway worker"""
+        self.session_id = session_id
+        saved = await asyncio.to_thread(self.sessions.load, session_id)
+        if saved:
+            self.bot.restore(saved.get("bot", {}))
+
+    async def _segment(self):
+        """Energy-VAD endpointing: emit an utterance after enough trailing silence"""
+        vad = self.bot.vad
+        preroll: deque = deque()
+        preroll_samples = 0
+        speech: list = []
+        silence_ms = 0.0
+
+        async def flush():
+            nonlocal speech, silence_ms
+            if speech:
+                samples = np.concatenate(speech)
+                speech_ended = time.perf_counter() - silence_ms / 1000
+                await self.utterances.put((self.recognizer.finish(samples), speech_ended, samples))
+            speech, silence_ms = [], 0.0
+
+        while True:
+            item = await self.inbound.get()
+            if item is _END_OF_UTTERANCE:
+                await flush()
+                continue
+
+            frame = pcm16_to_float(item)
+            frame_ms = 1000.0 * frame.size / self.sample_rate
+            if vad.frame_is_speech(frame, self.sample_rate):
+                if not speech:
+                    for earlier in preroll:
+                        self.recognizer.feed(earlier, False)
+                    speech.extend(preroll)
+                    preroll.clear()
+                    preroll_samples = 0
+                speech.append(frame)
+                self.recognizer.feed(frame, True)
+                silence_ms = 0.0
+            elif speech:
+                speech.append(frame)
+                self.recognizer.feed(frame, False)
+                silence_ms += frame_ms
+                if silence_ms >= self.endpoint_silence_ms:
+                    await flush()
+            else:
+                preroll.append(frame)
+                preroll_samples += frame.size
+                while preroll and preroll_samples - preroll[0].size >= self.sample_rate * self.preroll_ms / 1000:
+                    preroll_samples -= preroll.popleft().size
+
+    async def _take_turns(self):
+        while True:
+            transcription, speech_ended, samples = await self.utterances.get()
+            try:
+                with metrics.turn(self.call_id, source="gateway"):
+                    await self._turn(transcription, speech_ended, samples)
+                await asyncio.to_thread(self.sessions.save, self.session_id, {"bot": self.bot.snapshot()})
+            except Exception as e:
+                # One failed turn is reported; the call keeps listening
+                traceback.print_exc()
+                metrics.get_registry().count("gateway", "failed_turns")
+                self._notify("error", f"Turn failed: {type(e).__name__}: {e}")
+
+    async def _turn(self, transcription: "asyncio.Task", speech_ended: float, samples: np.ndarray):
+        # Usually already done: the partial taken at the pause covered the whole utterance
+        transcript = await transcription
+        self._settle_speculation(transcript)
+        if not transcript:
+            return
+        self.turns += 1
+        await self.outbound.put({"type": "transcript", "text": transcript})
+        plan, chunk_bytes = self.reply, self._chunk_bytes()
+        await self.outbound.put(self._reply_start())
+
+        # Sentences go to TTS as soon as they complete; audio is sent strictly in order
+        pending: asyncio.Queue = asyncio.Queue()
+        spoken, clips = [], []
+
+        async def produce():
+            chunker = SentenceChunker()
+            async for delta in self.bot.astream_respond(transcript):
+                for sentence in chunker.feed(delta):
+                    await pending.put((sentence, asyncio.create_task(self._speak(sentence, plan))))
+            for sentence in chunker.flush():
+                await pending.put((sentence, asyncio.create_task(self._speak(sentence, plan))))
+            await pending.put(None)
+
+        async def send(sentence: str, audio: Optional[bytes]):
+            nonlocal speech_ended
+            await self.outbound.put({"type": "reply_text", "text": sentence})
+            spoken.append(sentence)
+            if not audio:
+                return
+            clips.append(audio)
+            if speech_ended is not None:
+                span = metrics.StageSpan("first_audio", bytes_out=len(audio))
+                span.seconds = time.perf_counter() - speech_ended
+                metrics.record_span(span)
+                speech_ended = None
+            for offset in range(0, len(audio), chunk_bytes):
+                await self.outbound.put(audio[offset:offset + chunk_bytes])
+
+        async def first_ready():
+            item = await pending.get()
+            if item is not None:
+                await asyncio.wait({item[1]})
+            return item
+
+        producer = asyncio.create_task(produce())
+        first = asyncio.create_task(first_ready())
+        try:
+            # Keep the line alive when the first audio is slow (an upstream stall or a hedge in flight)
+            if HOLD_AFTER_SECONDS > 0:
+                waited = time.perf_counter() - speech_ended if speech_ended is not None else 0.0
+                await asyncio.wait({first}, timeout=max(0.0, HOLD_AFTER_SECONDS - waited))
+            if not first.done():
+                metrics.get_registry().count("first_audio", "hold_lines")
+                await send(HOLD_LINE, await self._speak(HOLD_LINE, plan))
+            item = await first
+            while item is not None:
+                sentence, synthesis = item
+                await send(sentence, await synthesis)
+                item = await pending.get()
+            await producer
+        finally:
+            for task in (first, producer):
+                if not task.done():
+                    task.cancel()
+        await self.outbound.put({"type": "reply_end"})
+        recorder = get_recorder()
+        if recorder is not None:
+            trace = metrics.current_turn()
+            recorder.record(RecordedTurn(
+                self.call_id, trace.turn_id if trace else f"{self.turns:04d}", "gateway", transcript, " ".join(spoken),
+                caller_audio=samples, caller_rate=self.sample_rate, bot_audio=clips,
+                bot_format=plan.response_format, bot_rate=plan.sample_rate, session_id=self.session_id,
+                flow=self.bot.flow.id, timing=trace_timing(trace),
+            ))
+
+    async def _send(self):
+        while True:
+            item = await self.outbound.get()
+            if isinstance(item, (bytes, bytearray)):
+                await self.websocket.send_bytes(item)
+            else:
+                await self.websocket.send_json(item)
+
+
+def create_app(max_calls: Optional[int] = None) -> FastAPI:
+    """Gateway application; max_calls caps concurrent calls on this node"""
+    max_calls = max_calls or int(os.getenv("GATEWAY_MAX_CALLS", "500"))
+    gateway = FastAPI(title="Ola Voice Bot Gateway")
+    gateway.state.active_calls = 0
+
+    @gateway.get("/healthz")
+    async def healthz():
+        return {
+            "status": "ok",
+            "active_calls": gateway.state.active_calls,
+            "max_calls": max_calls,
+            "upstream": get_rate_limiter().stats(),
+            "resilience": resilience_stats(),
+            "recording": get_recorder().stats() if get_recorder() else None,
+        }
+
+    @gateway.get("/metrics", response_class=PlainTextResponse)
+    async def prometheus_metrics():
+        return metrics.get_registry().render_prometheus()
+
+    @gateway.websocket("/ws/call")
+    async def call(websocket: WebSocket):
+        await websocket.accept()
+        if gateway.state.active_calls >= max_calls:
+            await websocket.close(code=1013, reason="Gateway at capacity")
+            return
+        gateway.state.active_calls += 1
+        try:
+            await CallSession(websocket).run()
+        finally:
+            gateway.state.active_calls -= 1
+
+    return gateway
+
+
+app = create_app()
+
+
+def main():
+    import uvicorn
+
+    uvicorn.run(
+        "app.gateway:app",
+        host=os.getenv("GATEWAY_HOST", "0.0.0.0"),
+        port=int(os.getenv("GATEWAY_PORT", "8080")),
+        ws_max_queue=8,
+    )
+
+
+if __name__ == "__main__":
+    main()
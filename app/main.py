@@ -3,13 +3,46 @@ import os
 from dotenv import load_dotenv
 
 from pipecat.pipeline.pipeline import Pipeline
-from pipecat.pipeline.task import PipelineTask, PipelineTaskParams
-from pipecat.transports.local.audio import LocalAudioTransport, LocalAudioTransportParams
+from pipecat.pipeline.task import PipelineParams, PipelineTask, PipelineTaskParams
+from pipecat.frames.frames import LLMUpdateSettingsFrame, STTUpdateSettingsFrame, TTSUpdateSettingsFrame
+from pipecat.transports.local.audio import LocalAudioTransport
 from pipecat.services.openai.stt import OpenAISTTService
+from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext
 from pipecat.services.openai.llm import OpenAILLMService
-from pipecat.services.openai.tts import OpenAITTSService
 
-from services import SYSTEM_PROMPT
+from app import metrics
+from app.config import get_config, watch_config
+from app.dialogue import DialogueEngine
+from app.formats import TTS_PCM_RATE, pipecat_plan
+from app.processors import (
+    ContextWindowProcessor,
+    EnergyVADAnalyzer,
+    MetricsProcessor,
+    PhraseBankTTSService,
+    ScriptedDialogueProcessor,
+)
+from app.phrase_bank import get_phrase_bank
+from app.prompts import get_prompt_registry
+from app.vad import get_vad
+
+
+async def follow_config(task: PipelineTask, config):
+    """Apply config file edits to the running call: models, voice and VAD threshold"""
+    async for latest in watch_config():
+        if latest.vad_threshold and latest.vad_threshold != get_vad().threshold:
+            get_vad().threshold = latest.vad_threshold
+        if latest.stt_model != config.stt_model:
+            await task.queue_frame(STTUpdateSettingsFrame(settings={"model": latest.stt_model}))
+        if latest.llm_model != config.llm_model:
+            await task.queue_frame(LLMUpdateSettingsFrame(settings={"model": latest.llm_model}))
+        tts_settings = {key: getattr(latest, f"tts_{key}") for key in ("model", "voice")
+                        if getattr(latest, f"tts_{key}") != getattr(config, f"tts_{key}")}
+        if tts_settings:
+            await task.queue_frame(TTSUpdateSettingsFrame(settings=tts_settings))
+        if latest.audio != config.audio:
+            print("⚠️  Audio device settings changed; they apply on the next start")
+        config = latest
+
 
 async def main():
     load_dotenv()
@@ -18,40 +51,86 @@ async def main():
         print("❌ OPENAI_API_KEY not found in .env file")
         return
 
-    try:
-        from voice_bot_config import get_pipecat_audio_params
-        audio_params = get_pipecat_audio_params()
-        print(f"✅ Using optimized audio configuration: In {audio_params.audio_in_sample_rate}Hz/{audio_params.audio_in_channels}ch → Out {audio_params.audio_out_sample_rate}Hz/{audio_params.audio_out_channels}ch")
-    except ImportError:
-        audio_params = LocalAudioTransportParams(
-            audio_in_sample_rate=16000,
-            audio_out_sample_rate=24000,
-            audio_in_channels=1,
-            audio_out_channels=1,
-        )
-        print("⚠️  Using default audio configuration.")
+    config = get_config()
+    audio_params = config.audio.pipecat_params()
+    if config.source:
+        print(f"✅ Using audio configuration from {config.source}: In {audio_params.audio_in_sample_rate}Hz/{audio_params.audio_in_channels}ch → Out {audio_params.audio_out_sample_rate}Hz/{audio_params.audio_out_channels}ch")
+    else:
+        print("⚠️  Using default audio configuration. Generate one with: python voice_bot_config_helper.py")
+    if config.vad_threshold:
+        get_vad().threshold = config.vad_threshold
+
+    # OpenAI TTS streams 24 kHz PCM and Pipecat plays frames as labelled, so the
+    # speaker runs at that rate rather than resampling every frame
+    tts_plan = pipecat_plan(audio_params.audio_out_sample_rate)
+    if tts_plan.resample_from is not None:
+        print(f"⚠️  Output {audio_params.audio_out_sample_rate}Hz differs from TTS PCM; playing at {TTS_PCM_RATE}Hz")
+        audio_params.audio_out_sample_rate = TTS_PCM_RATE
+
+    # Only speech segments reach Whisper; silence is dropped locally
+    audio_params.vad_analyzer = EnergyVADAnalyzer()
 
     local_audio = LocalAudioTransport(params=audio_params)
-    stt = OpenAISTTService(model="whisper-1", api_key=openai_api_key)
-    llm = OpenAILLMService(model="gpt-4o-mini", api_key=openai_api_key, system_prompt=SYSTEM_PROMPT)
-    tts = OpenAITTSService(model="tts-1", api_key=openai_api_key, voice="nova")
+    stt = OpenAISTTService(model=config.stt_model, api_key=openai_api_key)
+    llm = OpenAILLMService(model=config.llm_model, api_key=openai_api_key)
+
+    # Multi-turn context, trimmed to a fixed token budget every turn
+    flow = get_prompt_registry().get(config.flow)
+    context = OpenAILLMContext(messages=[{"role": "system", "content": flow.system_prompt}])
+    context_aggregator = llm.create_context_aggregator(context)
+    context_window = ContextWindowProcessor(token_budget=int(os.getenv("LLM_HISTORY_TOKEN_BUDGET", "600")))
+    dialogue = ScriptedDialogueProcessor(DialogueEngine(script=flow.script), context=context)
+    tts = PhraseBankTTSService(model=config.tts_model, api_key=openai_api_key, voice=config.tts_voice,
+                               sample_rate=audio_params.audio_out_sample_rate)
 
+    phrase_bank = get_phrase_bank()
+    if len(phrase_bank):
+        print(f"✅ Phrase bank {phrase_bank.version}: {len(phrase_bank)} scripted phrases pre-rendered")
+    else:
+        print("⚠️  No phrase bank found. Build one with: python -m app.phrase_bank")
+
+    turn_metrics = MetricsProcessor()
     pipeline = Pipeline([
         local_audio.input(),
         stt,
+        dialogue,
+        context_aggregator.user(),
+        context_window,
         llm,
         tts,
+        turn_metrics,
         local_audio.output(),
+        context_aggregator.assistant(),
     ])
 
     print("=" * 60)
-    print("🎙️  Voice Bot Prototype - Ola Driver Support")
+    print(f"🎙️  Voice Bot Prototype - Ola Driver Support ({flow.title})")
     print("=" * 60)
-    print("👉 'Main 2 ghante se online hoon par mujhe koi ride nahi mil rahi.'")
-    print("👉 'Haan, yeh mera registered number hai.'")
+    print(f"👉 '{flow.script.complaint_texts[0]}'")
+    print(f"👉 '{flow.confirmation}'")
     print("=" * 60)
 
-    task = PipelineTask(pipeline)
+    # Barge-in: caller speech during bot output flushes queued audio and cancels in-flight LLM/TTS work
+    barge_in = os.getenv("VOICE_BARGE_IN", "1") != "0"
+    interruption_strategies = []
+    min_words = int(os.getenv("VOICE_BARGE_IN_MIN_WORDS", "0"))
+    if barge_in and min_words:
+        # Without echo cancellation the bot can hear itself; require real words before interrupting
+        try:
+            from pipecat.audio.interruptions.min_words_interruption_strategy import MinWordsInterruptionStrategy
+            interruption_strategies.append(MinWordsInterruptionStrategy(min_words=min_words))
+        except ImportError:
+            print("⚠️  This pipecat version has no interruption strategies; barge-in triggers on VAD alone.")
+    print(f"{'✅' if barge_in else '⚠️ '} Barge-in {'enabled' if barge_in else 'disabled'}")
+
+    metrics.start_metrics_server()
+    task = PipelineTask(pipeline, params=PipelineParams(
+        allow_interruptions=barge_in,
+        interruption_strategies=interruption_strategies,
+        enable_metrics=True,
+        enable_usage_metrics=True,
+    ))
+    reload = asyncio.create_task(follow_config(task, config))
     try:
         await task.run(PipelineTaskParams(loop=asyncio.get_running_loop()))
     except KeyboardInterrupt:
@@ -60,6 +139,15 @@ async def main():
     except Exception as e:
         print(f"❌ Error: {e}")
         await task.cancel()
+    finally:
+        reload.cancel()
+        stats = dialogue.engine.stats()
+        print(f"⚡ Scripted fast path handled {stats['fast_path_turns']} turns, LLM handled {stats['llm_turns']}")
+        barge = turn_metrics.stats()
+        if barge["interruptions"]:
+            print(f"✋ {barge['interruptions']} barge-ins discarded ~{barge['discarded_seconds']}s of synthesized audio")
+        for name, row in metrics.get_registry().summary().items():
+            print(f"📊 {name}: p50 {row['p50_ms']} ms / p95 {row['p95_ms']} ms / p99 {row['p99_ms']} ms ({row['count']})")
 
 if __name__ == "__main__":
     asyncio.run(main())
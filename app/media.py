@@ -0,0 +1,153 @@
+"""
+Media Endpoint
+==============
+
+Serves synthesized speech by handle instead of inlining it into the page as
+base64. A handle is the TTS cache content address, so the endpoint reads the
+audio straight from app.tts_cache (memory, disk or shared store tier) and
+the page only carries a short URL. Responses support HTTP range requests
+and are immutable, so browsers cache and seek them without refetching.
+
+The endpoint only runs when MEDIA_PUBLIC_URL says where browsers reach it
+(e.g. a reverse-proxy path); without it the page keeps inlining audio as data
+URIs, which work wherever the page does but carry every clip in the page, so
+the payload saving needs MEDIA_PUBLIC_URL. It binds to localhost unless
+MEDIA_HOST says otherwise and sends no CORS header unless MEDIA_ALLOW_ORIGIN
+names an origin.
+
+    MEDIA_PUBLIC_URL    base URL the browser uses to reach the endpoint (unset: audio is inlined)
+    MEDIA_PORT          port of the media endpoint                      (default 8502, 0 disables)
+    MEDIA_HOST          interface it binds to                           (default 127.0.0.1)
+    MEDIA_ALLOW_ORIGIN  Access-Control-Allow-Origin value               (default: no header)
+"""
+
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+from app.formats import MIME_TYPES
+from app.tts_cache import get_tts_cache
+
+_PATH = re.compile(r"^/audio/([0-9a-f]{64})\.(\w+)$")
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) for a single 'bytes=' range; None for the whole body
+
+    Raises ValueError when the range cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+    spec = header[len("bytes="):].split(",")[0].strip()
+    start, _, end = spec.partition("-")
+    if not start:  # suffix range: the last N bytes
+        length = int(end)
+        if length <= 0:
+            raise ValueError(header)
+        return max(0, size - length), size - 1
+    first = int(start)
+    last = min(int(end), size - 1) if end else size - 1
+    if first >= size or first > last:
+        raise ValueError(header)
+    return first, last
+
+
+class _MediaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+    def do_GET(self):
+        self._serve(head=False)
+
+    def _serve(self, head: bool):
+        match = _PATH.match(self.path.split("?")[0])
+        if not match or match.group(2) not in MIME_TYPES:
+            self._empty(404)
+            return
+        handle, fmt = match.groups()
+        etag = f'"{handle}"'
+        if self.headers.get("If-None-Match") == etag:
+            self._empty(304, etag)
+            return
+
+        audio = get_tts_cache().get_by_key(handle)
+        if audio is None:
+            self._empty(404)
+            return
+
+        try:
+            byte_range = parse_range(self.headers.get("Range"), len(audio))
+        except ValueError:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{len(audio)}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if byte_range is None:
+            status, body = 200, audio
+        else:
+            start, end = byte_range
+            status, body = 206, audio[start:end + 1]
+        self.send_response(status)
+        self.send_header("Content-Type", MIME_TYPES[fmt])
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(audio)}")
+        # Handles are content addresses: the bytes behind a URL never change
+        self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+        self.send_header("ETag", etag)
+        allow_origin = os.getenv("MEDIA_ALLOW_ORIGIN")
+        if allow_origin:
+            self.send_header("Access-Control-Allow-Origin", allow_origin)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def _empty(self, status: int, etag: Optional[str] = None):
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+_inline_noted = False
+
+
+def start_media_server(port: Optional[int] = None) -> Optional[ThreadingHTTPServer]:
+    """Serve /audio/<handle>.<fmt> on a daemon thread (once per process, only with MEDIA_PUBLIC_URL set)"""
+    global _server, _inline_noted
+    port = port if port is not None else int(os.getenv("MEDIA_PORT", "8502"))
+    with _server_lock:
+        if _server is None and port and not os.getenv("MEDIA_PUBLIC_URL") and not _inline_noted:
+            _inline_noted = True
+            print("ℹ️  MEDIA_PUBLIC_URL is not set: reply audio is inlined into the page (see README)")
+        if _server is not None or not port or not os.getenv("MEDIA_PUBLIC_URL"):
+            return _server
+        try:
+            _server = ThreadingHTTPServer((os.getenv("MEDIA_HOST", "127.0.0.1"), port), _MediaHandler)
+        except OSError as e:
+            print(f"⚠️  Media endpoint not started on port {port}: {e}; audio will be inlined")
+            return None
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="voicebot-media", daemon=True).start()
+    return _server
+
+
+def media_url(handle: Optional[str], fmt: str = "mp3") -> Optional[str]:
+    """Browser URL for a published handle, or None when the endpoint isn't running or has no public URL"""
+    base = os.getenv("MEDIA_PUBLIC_URL")
+    if not handle or not base or _server is None:
+        return None
+    return f"{base.rstrip('/')}/audio/{handle}.{fmt}"
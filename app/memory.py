@@ -0,0 +1,155 @@
+"""
+Conversation Memory
+===================
+
+Bounded multi-turn context for the LLM. Recent turns are kept verbatim in a
+ring buffer; once they exceed the token budget the oldest turns are folded
+into a short extractive summary, so the prompt stays the same size no matter
+how long the call runs.
+"""
+
+import math
+import re
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+_FIRST_SENTENCE = re.compile(r"^.*?[.?!।](?=\s|$)")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 chars/token for Latin, ~1.5 for Devanagari)"""
+    if not text:
+        return 0
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return math.ceil((len(text) - non_ascii) / 4 + non_ascii / 1.5) + 4
+
+
+def message_tokens(messages: List[Dict]) -> int:
+    return sum(estimate_tokens(m.get("content") or "") for m in messages)
+
+
+def _gist(message: Dict) -> str:
+    content = " ".join((message.get("content") or "").split())
+    match = _FIRST_SENTENCE.match(content)
+    gist = match.group(0) if match else content
+    speaker = "User" if message.get("role") == "user" else "Bot"
+    return f"{speaker}: {gist}"
+
+
+def summarize(messages: List[Dict], previous: str = "", token_budget: int = 120) -> str:
+    """Fold turns into an extractive summary, keeping the most recent lines within budget"""
+    lines = [line for line in previous.split("\n") if line] + [_gist(m) for m in messages]
+    kept: List[str] = []
+    used = 0
+    for line in reversed(lines):
+        cost = estimate_tokens(line)
+        if used + cost > token_budget:
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(reversed(kept))
+
+
+def summary_message(summary: str) -> Dict:
+    return {"role": "system", "content": f"Conversation so far (older turns, summarized):\n{summary}"}
+
+
+def fit_to_budget(messages: List[Dict], token_budget: int = 600, summary_budget: int = 120) -> List[Dict]:
+    """Trim an OpenAI-style message list to a token budget
+
+    Leading system messages are kept, the newest turns are kept verbatim and
+    anything older is replaced by a single summary message.
+    """
+    head = 0
+    while head < len(messages) and messages[head].get("role") == "system":
+        head += 1
+    system, turns = messages[:head], messages[head:]
+
+    budget = token_budget - message_tokens(system)
+    recent: List[Dict] = []
+    used = 0
+    for message in reversed(turns):
+        cost = estimate_tokens(message.get("content") or "")
+        if recent and used + cost > budget - summary_budget:
+            break
+        recent.insert(0, message)
+        used += cost
+
+    older = turns[:len(turns) - len(recent)]
+    if not older:
+        return system + recent
+    return system + [summary_message(summarize(older, token_budget=summary_budget))] + recent
+
+
+class ConversationMemory:
+    """Ring buffer of recent turns plus a rolling summary of evicted ones"""
+
+    def __init__(self, max_messages: int = 12, token_budget: int = 400, summary_budget: int = 120):
+        self.max_messages = max_messages
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.summary = ""
+        self._turns: deque = deque()
+        self._tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, role: str, content: str):
+        """Record one message and evict/summarize down to the budget"""
+        if not content:
+            return
+        with self._lock:
+            self._turns.append({"role": role, "content": content})
+            self._tokens += estimate_tokens(content)
+            evicted = []
+            while len(self._turns) > 1 and (len(self._turns) > self.max_messages or self._tokens > self.token_budget):
+                message = self._turns.popleft()
+                self._tokens -= estimate_tokens(message["content"])
+                evicted.append(message)
+            if evicted:
+                self.summary = summarize(evicted, self.summary, self.summary_budget)
+
+    def add_turn(self, user_input: str, reply: Optional[str]):
+        """One exchange; without a reply (the model didn't answer) only the user's message is kept"""
+        self.add("user", user_input)
+        self.add("assistant", reply)
+
+    def build_messages(self, system_prompt: str, user_input: Optional[str] = None) -> List[Dict]:
+        """System prompt, summary of older turns, recent turns and the new utterance
+
+        Ordered from most to least stable, so consecutive requests share the
+        longest possible prefix for provider-side prompt caching.
+        """
+        with self._lock:
+            messages = [{"role": "system", "content": system_prompt}]
+            if self.summary:
+                messages.append(summary_message(self.summary))
+            messages.extend(self._turns)
+        if user_input:
+            messages.append({"role": "user", "content": user_input})
+        return messages
+
+    def snapshot(self) -> Dict:
+        """JSON-serializable state, for persisting a session outside this process"""
+        with self._lock:
+            return {"summary": self.summary, "turns": list(self._turns)}
+
+    def restore(self, snapshot: Dict):
+        with self._lock:
+            self.summary = snapshot.get("summary", "")
+            self._turns = deque(snapshot.get("turns", []))
+            self._tokens = sum(estimate_tokens(m["content"]) for m in self._turns)
+
+    def clear(self):
+        with self._lock:
+            self._turns.clear()
+            self._tokens = 0
+            self.summary = ""
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "messages": len(self._turns),
+                "tokens": self._tokens + estimate_tokens(self.summary),
+                "summarized": bool(self.summary),
+            }
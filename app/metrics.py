@@ -0,0 +1,275 @@
+"""
+Voice Turn Metrics
+==================
+
+Per-stage latency tracing for every voice turn. Each turn records wall time,
+bytes in/out and token counts for STT, LLM, TTS, audio encode and playback
+render; a barge-in records how much synthesized reply audio went unplayed.
+Stage timings feed p50/p95/p99 histograms exposed in Prometheus text format
+(optional HTTP endpoint) and every finished turn is appended to a JSONL sink.
+
+    VOICE_METRICS_JSONL   path of the per-turn JSONL sink   (default: disabled)
+    VOICE_METRICS_PORT    port for a /metrics HTTP endpoint  (default: disabled)
+    VOICE_METRICS_HOST    interface the endpoint binds to    (default 127.0.0.1)
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+STAGES = ("stt", "llm", "tts", "encode", "render")
+
+# Prometheus-style latency buckets in seconds
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Cumulative buckets for export plus a sliding window for exact quantiles"""
+
+    def __init__(self, window: int = 2048):
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self._window: deque = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self._window.append(seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self._window:
+            return None
+        ordered = sorted(self._window)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self) -> Dict:
+        return {
+            "count": self.count,
+            "p50_ms": _ms(self.quantile(0.50)),
+            "p95_ms": _ms(self.quantile(0.95)),
+            "p99_ms": _ms(self.quantile(0.99)),
+        }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+class StageSpan:
+    """Timing and payload sizes of one stage within a turn"""
+
+    def __init__(self, name: str, bytes_in: int = 0, bytes_out: int = 0, tokens_in: int = 0, tokens_out: int = 0):
+        self.name = name
+        self.bytes_in = bytes_in
+        self.bytes_out = bytes_out
+        self.tokens_in = tokens_in
+        self.tokens_out = tokens_out
+        self.seconds = 0.0
+        self.error: Optional[str] = None
+
+    def as_dict(self) -> Dict:
+        record = {
+            "ms": round(self.seconds * 1000, 1),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "tokens_in": self.tokens_in,
+            "tokens_out": self.tokens_out,
+        }
+        if self.error:
+            record["error"] = self.error
+        return record
+
+
+class TurnTrace:
+    """All stage spans of one user turn"""
+
+    def __init__(self, session_id: str, source: str):
+        self.session_id = session_id
+        self.source = source
+        self.turn_id = uuid.uuid4().hex[:12]
+        self.started = time.perf_counter()
+        self.spans: List[StageSpan] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: StageSpan):
+        with self._lock:
+            self.spans.append(span)
+
+    def as_dict(self, total_seconds: float) -> Dict:
+        stages: Dict[str, Dict] = {}
+        with self._lock:
+            for span in self.spans:
+                merged = stages.setdefault(span.name, {"ms": 0.0, "calls": 0, "bytes_in": 0, "bytes_out": 0,
+                                                       "tokens_in": 0, "tokens_out": 0})
+                merged["calls"] += 1
+                for key, value in span.as_dict().items():
+                    if key == "error":
+                        merged["error"] = value
+                    else:
+                        merged[key] = round(merged[key] + value, 1)
+        return {
+            "timestamp": datetime.now().isoformat(),
+            "source": self.source,
+            "session_id": self.session_id,
+            "turn_id": self.turn_id,
+            "total_ms": round(total_seconds * 1000, 1),
+            "stages": stages,
+        }
+
+
+class MetricsRegistry:
+    """Process-wide stage histograms, byte/token counters and the JSONL sink"""
+
+    def __init__(self, jsonl_path: Optional[str] = None):
+        self.jsonl_path = jsonl_path
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, span: StageSpan):
+        with self._lock:
+            self.histograms.setdefault(span.name, Histogram()).observe(span.seconds)
+            for field in ("bytes_in", "bytes_out", "tokens_in", "tokens_out"):
+                key = (span.name, field)
+                self.counters[key] = self.counters.get(key, 0) + getattr(span, field)
+            if span.error:
+                key = (span.name, "errors")
+                self.counters[key] = self.counters.get(key, 0) + 1
+
+    def count(self, stage: str, field: str, amount: int = 1):
+        """Bump a counter that isn't tied to a timed span (e.g. coalesced requests)"""
+        with self._lock:
+            key = (stage, field)
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def record_turn(self, turn: TurnTrace) -> Dict:
+        total = time.perf_counter() - turn.started
+        with self._lock:
+            self.histograms.setdefault("turn", Histogram()).observe(total)
+        record = turn.as_dict(total)
+        if self.jsonl_path:
+            line = json.dumps(record, ensure_ascii=False)
+            with self._lock, open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        return record
+
+    def summary(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {name: hist.summary() for name, hist in self.histograms.items()}
+
+    def render_prometheus(self) -> str:
+        """Text exposition format for a /metrics endpoint"""
+        lines = [
+            "# HELP voicebot_stage_seconds Wall time per voice turn stage",
+            "# TYPE voicebot_stage_seconds histogram",
+        ]
+        with self._lock:
+            for name, hist in sorted(self.histograms.items()):
+                for bound, count in zip(BUCKETS, hist.bucket_counts):
+                    lines.append(f'voicebot_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+                lines.append(f'voicebot_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {hist.count}')
+                lines.append(f'voicebot_stage_seconds_sum{{stage="{name}"}} {hist.total:.6f}')
+                lines.append(f'voicebot_stage_seconds_count{{stage="{name}"}} {hist.count}')
+            lines.append("# TYPE voicebot_stage_total counter")
+            for (stage, field), value in sorted(self.counters.items()):
+                lines.append(f'voicebot_stage_total{{stage="{stage}",field="{field}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+_registry: Optional[MetricsRegistry] = None
+_registry_lock = threading.Lock()
+_current_turn: contextvars.ContextVar = contextvars.ContextVar("voicebot_turn", default=None)
+
+
+def get_registry() -> MetricsRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry(jsonl_path=os.getenv("VOICE_METRICS_JSONL") or None)
+        return _registry
+
+
+def current_turn() -> Optional[TurnTrace]:
+    return _current_turn.get()
+
+
+@contextmanager
+def turn(session_id: str, source: str = "streamlit"):
+    """Trace one user turn; stage() calls inside it (same context) attach to it"""
+    trace = TurnTrace(session_id, source)
+    token = _current_turn.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_turn.reset(token)
+        get_registry().record_turn(trace)
+
+
+@contextmanager
+def stage(name: str, **counts):
+    """Time one stage; set bytes/tokens on the yielded span as they become known"""
+    span = StageSpan(name, **counts)
+    started = time.perf_counter()
+    try:
+        yield span
+    except Exception as e:
+        span.error = type(e).__name__
+        raise
+    finally:
+        span.seconds = time.perf_counter() - started
+        record_span(span)
+
+
+def record_span(span: StageSpan):
+    """Attach a finished span to the current turn (if any) and the histograms"""
+    trace = _current_turn.get()
+    if trace is not None:
+        trace.add(span)
+    get_registry().observe(span)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("/metrics", ""):
+            self.send_error(404)
+            return
+        body = get_registry().render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_metrics_server(port: Optional[int] = None) -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics on a daemon thread (once per process); no-op without a port"""
+    global _server
+    port = port or int(os.getenv("VOICE_METRICS_PORT", "0"))
+    with _registry_lock:
+        if _server is not None or not port:
+            return _server
+        try:
+            _server = ThreadingHTTPServer((os.getenv("VOICE_METRICS_HOST", "127.0.0.1"), port), _MetricsHandler)
+        except OSError as e:
+            print(f"⚠️  Metrics endpoint not started on port {port}: {e}")
+            return None
+        threading.Thread(target=_server.serve_forever, name="voicebot-metrics", daemon=True).start()
+    return _server
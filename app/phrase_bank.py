@@ -0,0 +1,225 @@
+"""
+Phrase Bank
+===========
+
+Pre-rendered audio for the scripted bot lines of every support flow
+(app.prompts). The build step extracts every line the bot is told to say,
+synthesizes each line (and each sentence within it, since Pipecat speaks
+sentence by sentence) concurrently, and writes a versioned bank with a
+manifest. The fallback lines of app.resilience are rendered too, so they can
+be spoken while the upstream is down. At runtime an exact-match reply is
+served from disk with no API call.
+
+Build:
+    python -m app.phrase_bank --out assets/phrase_bank
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.tts_cache import normalize_text
+
+DEFAULT_BANK_DIR = os.path.join("assets", "phrase_bank")
+DEFAULT_FORMATS = ("mp3", "pcm")
+MANIFEST_NAME = "manifest.json"
+LATEST_NAME = "LATEST"
+
+_SAY_PATTERN = re.compile(r'you say:\s*"([^"]+)"', re.IGNORECASE)
+_SENTENCE_PATTERN = re.compile(r"[^.?!।]+[.?!।]*")
+
+
+def match_key(text: str) -> str:
+    """Key used for exact-match lookups (whitespace and quotes don't count)"""
+    return normalize_text(text).strip("\"'“”‘’ ")
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split a line into sentences the way a streaming TTS would speak them"""
+    return [s.strip() for s in _SENTENCE_PATTERN.findall(text) if s.strip()]
+
+
+def extract_scripted_lines(prompt: str) -> List[str]:
+    """The full lines the bot is told to say, in script order"""
+    return _SAY_PATTERN.findall(prompt)
+
+
+def extract_bot_lines(prompt: str) -> List[str]:
+    """Pull the scripted bot lines (and their sentences) out of a system prompt"""
+    phrases = []
+    for line in extract_scripted_lines(prompt):
+        candidates = [line]
+        sentences = split_sentences(line)
+        if len(sentences) > 1:
+            candidates.extend(sentences)
+        for phrase in candidates:
+            if match_key(phrase) not in {match_key(p) for p in phrases}:
+                phrases.append(phrase)
+    return phrases
+
+
+def bank_version(phrases: List[str], model: str, voice: str, formats) -> str:
+    """Version id that changes whenever the script or the voice changes"""
+    payload = json.dumps([phrases, model, voice, list(formats)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
+
+
+def build_phrase_bank(prompt: str, client, out_dir: str = DEFAULT_BANK_DIR, model: str = "tts-1",
+                      voice: str = "nova", formats=DEFAULT_FORMATS, max_workers: int = 6,
+                      extra_phrases=()) -> Dict:
+    """Synthesize every scripted phrase (plus `extra_phrases`) concurrently and write a versioned bank"""
+    phrases = extract_bot_lines(prompt)
+    phrases += [p for p in extra_phrases if match_key(p) not in {match_key(q) for q in phrases}]
+    if not phrases:
+        raise ValueError("No scripted bot lines found in the prompt")
+
+    version = bank_version(phrases, model, voice, formats)
+    version_dir = os.path.join(out_dir, version)
+    os.makedirs(version_dir, exist_ok=True)
+
+    def synthesize(job):
+        phrase, fmt = job
+        digest = hashlib.sha256(match_key(phrase).encode("utf-8")).hexdigest()[:16]
+        filename = f"{digest}.{fmt}"
+        response = client.audio.speech.create(model=model, voice=voice, input=phrase, response_format=fmt)
+        audio = response.content
+        with open(os.path.join(version_dir, filename), "wb") as f:
+            f.write(audio)
+        return {
+            "text": phrase,
+            "key": match_key(phrase),
+            "format": fmt,
+            "file": filename,
+            "bytes": len(audio),
+            "sha256": hashlib.sha256(audio).hexdigest(),
+        }
+
+    jobs = [(phrase, fmt) for phrase in phrases for fmt in formats]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        entries = list(pool.map(synthesize, jobs))
+
+    manifest = {
+        "version": version,
+        "created": datetime.now().isoformat(),
+        "model": model,
+        "voice": voice,
+        "formats": list(formats),
+        "pcm_sample_rate": 24000,
+        "entries": entries,
+    }
+    with open(os.path.join(version_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    with open(os.path.join(out_dir, LATEST_NAME), "w") as f:
+        f.write(version)
+    return manifest
+
+
+class PhraseBank:
+    """Read-only exact-match lookup over a built phrase bank"""
+
+    def __init__(self, bank_dir: Optional[str] = None, manifest: Optional[Dict] = None):
+        self.bank_dir = bank_dir
+        self.manifest = manifest or {}
+        self.model = self.manifest.get("model")
+        self.voice = self.manifest.get("voice")
+        self.pcm_sample_rate = self.manifest.get("pcm_sample_rate", 24000)
+        self._files = {(e["key"], e["format"]): e["file"] for e in self.manifest.get("entries", [])}
+        self._audio: Dict[tuple, bytes] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, root: str = DEFAULT_BANK_DIR) -> "PhraseBank":
+        """Load the latest bank under root; an empty bank if none was built"""
+        try:
+            with open(os.path.join(root, LATEST_NAME)) as f:
+                version_dir = os.path.join(root, f.read().strip())
+            with open(os.path.join(version_dir, MANIFEST_NAME), encoding="utf-8") as f:
+                return cls(version_dir, json.load(f))
+        except (OSError, ValueError):
+            return cls()
+
+    @property
+    def version(self) -> Optional[str]:
+        return self.manifest.get("version")
+
+    def __len__(self):
+        return len({key for key, _ in self._files})
+
+    def serves(self, model: str, voice: str) -> bool:
+        """Whether this bank was rendered with the given TTS model and voice"""
+        return bool(self._files) and self.model == model and self.voice == voice
+
+    def lookup(self, text: str, fmt: str = "mp3") -> Optional[bytes]:
+        """Return pre-rendered audio for an exact scripted phrase, else None"""
+        entry_key = (match_key(text), fmt)
+        filename = self._files.get(entry_key)
+        if filename is None:
+            self.misses += 1
+            return None
+
+        with self._lock:
+            audio = self._audio.get(entry_key)
+            if audio is None:
+                try:
+                    with open(os.path.join(self.bank_dir, filename), "rb") as f:
+                        audio = f.read()
+                except OSError:
+                    self.misses += 1
+                    return None
+                self._audio[entry_key] = audio
+            self.hits += 1
+        return audio
+
+
+_shared_bank: Optional[PhraseBank] = None
+_shared_lock = threading.Lock()
+
+
+def get_phrase_bank() -> PhraseBank:
+    """Process-wide phrase bank loaded from PHRASE_BANK_DIR"""
+    global _shared_bank
+    with _shared_lock:
+        if _shared_bank is None:
+            _shared_bank = PhraseBank.load(os.getenv("PHRASE_BANK_DIR", DEFAULT_BANK_DIR))
+        return _shared_bank
+
+
+def main():
+    """Build the phrase bank from the scripts of all support flows"""
+    from dotenv import load_dotenv
+
+    from app.clients import get_openai_client
+    from app.prompts import get_prompt_registry
+    from app.resilience import FALLBACK_LINES
+
+    parser = argparse.ArgumentParser(description="Pre-render scripted bot lines")
+    parser.add_argument("--out", default=DEFAULT_BANK_DIR)
+    parser.add_argument("--model", default="tts-1")
+    parser.add_argument("--voice", default="nova")
+    parser.add_argument("--formats", default=",".join(DEFAULT_FORMATS))
+    parser.add_argument("--workers", type=int, default=6)
+    args = parser.parse_args()
+
+    load_dotenv()
+    client = get_openai_client()
+    prompts = "\n".join(flow.system_prompt for flow in get_prompt_registry().flows().values())
+    manifest = build_phrase_bank(
+        prompts, client, out_dir=args.out, model=args.model, voice=args.voice,
+        formats=tuple(f.strip() for f in args.formats.split(",") if f.strip()),
+        max_workers=args.workers, extra_phrases=FALLBACK_LINES,
+    )
+    print(f"✅ Phrase bank {manifest['version']}: {len(manifest['entries'])} clips in {args.out}")
+    for entry in manifest["entries"]:
+        print(f"  - [{entry['format']}] {entry['text']}")
+
+
+if __name__ == "__main__":
+    main()
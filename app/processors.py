@@ -0,0 +1,214 @@
+"""
+Pipecat processors and service variants used by the voice pipeline in main.py.
+"""
+
+import time
+from typing import AsyncGenerator, Dict, Optional
+
+import numpy as np
+from pipecat.audio.vad.vad_analyzer import VADAnalyzer, VADParams
+from pipecat.frames.frames import (
+    BotStartedSpeakingFrame,
+    BotStoppedSpeakingFrame,
+    Frame,
+    MetricsFrame,
+    StartInterruptionFrame,
+    TranscriptionFrame,
+    TTSAudioRawFrame,
+    TTSSpeakFrame,
+    TTSStartedFrame,
+    TTSStoppedFrame,
+    UserStoppedSpeakingFrame,
+)
+from pipecat.metrics.metrics import LLMUsageMetricsData, ProcessingMetricsData, TTFBMetricsData, TTSUsageMetricsData
+from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext, OpenAILLMContextFrame
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+from pipecat.services.openai.tts import OpenAITTSService
+
+from app import metrics
+from app.dialogue import DialogueEngine
+from app.memory import fit_to_budget
+from app.phrase_bank import PhraseBank, get_phrase_bank
+from app.vad import VoiceActivityDetector, get_vad
+
+
+class EnergyVADAnalyzer(VADAnalyzer):
+    """Pipecat VAD backed by the calibrated energy detector in app.vad"""
+
+    def __init__(self, *, detector: Optional[VoiceActivityDetector] = None, sample_rate: Optional[int] = None,
+                 params: Optional[VADParams] = None):
+        # Levels are calibrated from the diagnostics report, so don't also gate on pipecat's volume estimate
+        super().__init__(sample_rate=sample_rate, params=params or VADParams(min_volume=0.0))
+        self._detector = detector or get_vad()
+
+    def num_frames_required(self) -> int:
+        return self._detector.frame_length(self.sample_rate)
+
+    def voice_confidence(self, buffer) -> float:
+        frame = np.frombuffer(buffer, dtype=np.int16)
+        return 1.0 if self._detector.frame_is_speech(frame, self.sample_rate) else 0.0
+
+
+class ScriptedDialogueProcessor(FrameProcessor):
+    """Answers scripted transcripts directly with TTS, bypassing the LLM"""
+
+    def __init__(self, engine: DialogueEngine, context: Optional[OpenAILLMContext] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.engine = engine
+        self.context = context
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, TranscriptionFrame):
+            match = self.engine.respond(frame.text)
+            if match:
+                # Keep the LLM context aware of scripted turns so later fallbacks have history
+                if self.context is not None:
+                    self.context.add_message({"role": "user", "content": frame.text})
+                    self.context.add_message({"role": "assistant", "content": match.reply})
+                await self.push_frame(TTSSpeakFrame(match.reply), direction)
+                return
+
+        await self.push_frame(frame, direction)
+
+
+class ContextWindowProcessor(FrameProcessor):
+    """Keeps the LLM context within a token budget by summarizing older turns"""
+
+    def __init__(self, token_budget: int = 600, summary_budget: int = 120, **kwargs):
+        super().__init__(**kwargs)
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, OpenAILLMContextFrame):
+            context = frame.context
+            context.set_messages(fit_to_budget(context.messages, self.token_budget, self.summary_budget))
+
+        await self.push_frame(frame, direction)
+
+
+class MetricsProcessor(FrameProcessor):
+    """Feeds pipecat's per-service metrics into app.metrics, one trace per user turn
+
+    Place it between the TTS service and the transport output so it sees
+    service MetricsFrames and TTS audio downstream and Bot*SpeakingFrames
+    upstream. When the caller barges in, the reply audio that was synthesized
+    but never played is recorded as a "barge_in" span.
+    """
+
+    def __init__(self, session_id: str = "pipecat", **kwargs):
+        super().__init__(**kwargs)
+        self.session_id = session_id
+        self._turn: Optional[metrics.TurnTrace] = None
+        self._reply_bytes = 0
+        self._reply_rate = 0
+        self._bot_started: Optional[float] = None
+        self.interruptions = 0
+        self.discarded_bytes = 0
+        self.discarded_seconds = 0.0
+
+    @staticmethod
+    def _stage_for(processor_name: str) -> Optional[str]:
+        name = processor_name.lower()
+        for stage in ("stt", "llm", "tts"):
+            if stage in name:
+                return stage
+        return None
+
+    def _record(self, data):
+        stage = self._stage_for(data.processor)
+        if stage is None:
+            return
+        span = metrics.StageSpan(f"{stage}_ttfb" if isinstance(data, TTFBMetricsData) else stage)
+        if isinstance(data, (TTFBMetricsData, ProcessingMetricsData)):
+            span.seconds = data.value
+        elif isinstance(data, LLMUsageMetricsData):
+            span.tokens_in = data.value.prompt_tokens
+            span.tokens_out = data.value.completion_tokens
+        elif isinstance(data, TTSUsageMetricsData):
+            span.bytes_in = data.value
+        else:
+            return
+        if self._turn is not None:
+            self._turn.add(span)
+        metrics.get_registry().observe(span)
+
+    def _reset_reply(self):
+        self._reply_bytes = 0
+        self._bot_started = None
+
+    def _record_interruption(self):
+        """Account for reply audio that was synthesized but flushed unplayed"""
+        spoken = time.perf_counter() - self._bot_started if self._bot_started else 0.0
+        played = int(spoken * self._reply_rate * 2)  # 16-bit mono
+        unplayed = max(0, self._reply_bytes - played)
+        span = metrics.StageSpan("barge_in", bytes_in=self._reply_bytes, bytes_out=unplayed)
+        span.seconds = spoken
+        if self._turn is not None:
+            self._turn.add(span)
+            metrics.get_registry().record_turn(self._turn)
+            self._turn = None
+        metrics.get_registry().observe(span)
+        self.interruptions += 1
+        self.discarded_bytes += unplayed
+        self.discarded_seconds += unplayed / (self._reply_rate * 2) if self._reply_rate else 0.0
+        self._reset_reply()
+
+    def stats(self) -> Dict:
+        return {
+            "interruptions": self.interruptions,
+            "discarded_bytes": self.discarded_bytes,
+            "discarded_seconds": round(self.discarded_seconds, 1),
+        }
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, MetricsFrame):
+            for data in frame.data:
+                self._record(data)
+        elif isinstance(frame, TTSAudioRawFrame):
+            self._reply_bytes += len(frame.audio)
+            self._reply_rate = frame.sample_rate
+        elif isinstance(frame, StartInterruptionFrame):
+            if self._reply_bytes:
+                self._record_interruption()
+        elif isinstance(frame, UserStoppedSpeakingFrame):
+            self._turn = metrics.TurnTrace(self.session_id, source="pipecat")
+        elif isinstance(frame, BotStartedSpeakingFrame):
+            self._bot_started = self._bot_started or time.perf_counter()
+        elif isinstance(frame, BotStoppedSpeakingFrame):
+            self._reset_reply()
+            if self._turn is not None:
+                metrics.get_registry().record_turn(self._turn)
+                self._turn = None
+
+        await self.push_frame(frame, direction)
+
+
+class PhraseBankTTSService(OpenAITTSService):
+    """OpenAI TTS that serves scripted sentences from the pre-rendered phrase bank"""
+
+    def __init__(self, *, phrase_bank: PhraseBank = None, **kwargs):
+        super().__init__(**kwargs)
+        self._phrase_bank = phrase_bank or get_phrase_bank()
+
+    async def run_tts(self, text: str) -> AsyncGenerator[Frame, None]:
+        audio = None
+        # Current model/voice, which TTSUpdateSettingsFrame can change mid-call
+        if (self._phrase_bank.serves(self.model_name, self._voice_id)
+                and self._phrase_bank.pcm_sample_rate == self.sample_rate):
+            audio = self._phrase_bank.lookup(text, fmt="pcm")
+
+        if audio is None:
+            async for frame in super().run_tts(text):
+                yield frame
+            return
+
+        yield TTSStartedFrame()
+        yield TTSAudioRawFrame(audio=audio, sample_rate=self.sample_rate, num_channels=1)
+        yield TTSStoppedFrame()
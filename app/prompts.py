@@ -0,0 +1,182 @@
+"""
+Prompt Registry
+===============
+
+Support flows (ride issues, payments, account blocks, ...) served from one
+deployment. Each flow is a TOML file in the prompts directory, named by its
+flow id:
+
+    title = "Driver online, no rides"
+    confirmation = "Haan, yeh mera registered number hai."   # what a confirming caller says (optional)
+    script = '''
+    - Wait for the user to say: "..."
+    - Then you say: "..."
+    - If the user confirms (e.g., "Haan"), you say: "..."
+    '''
+
+system_prompt.txt in the same directory holds the instructions every flow
+shares. Each flow is validated and compiled once, into its system prompt
+(shared instructions first, then the flow script, whitespace normalized) and
+its DialogueEngine script. The system prompt is byte-identical on every
+request and ConversationMemory puts it ahead of everything that varies
+(summary, turns, the new utterance), so provider-side prompt-prefix caching
+can reuse it across calls; flows also share the leading instructions.
+
+Changed files are recompiled on the next lookup (checked at most every couple
+of seconds) and a broken edit keeps the previous version. Calls keep the flow
+they started with.
+
+    PROMPTS_DIR   flow directory   (default assets/prompts)
+    VOICE_FLOW    default flow id  (the `flow` field of app.config, default ride_issue)
+"""
+
+import os
+import threading
+import time
+import tomllib
+from typing import Dict, NamedTuple, Optional
+
+from app.config import get_config
+from app.dialogue import DEFAULT_CONFIRMATION, Script, compile_script
+
+DEFAULT_PROMPTS_DIR = os.path.join("assets", "prompts")
+SHARED_PROMPT_FILE = "system_prompt.txt"
+FLOW_SUFFIX = ".toml"
+
+
+class Flow(NamedTuple):
+    """One compiled support flow"""
+    id: str
+    title: str
+    system_prompt: str
+    script: Script
+    confirmation: str
+    source: str
+
+
+def _normalize(text: str) -> str:
+    return "\n".join(line.strip() for line in text.strip().splitlines() if line.strip())
+
+
+def compile_flow(flow_id: str, values: Dict, shared: str = "", source: str = "") -> Flow:
+    """Validate a flow definition and build its system prompt and dialogue script"""
+    script_text = values.get("script")
+    if not isinstance(script_text, str) or not script_text.strip():
+        raise ValueError(f"{flow_id}: 'script' is missing")
+    confirmation = values.get("confirmation", DEFAULT_CONFIRMATION)
+    system_prompt = "\n".join(part for part in (_normalize(shared), _normalize(script_text)) if part)
+    try:
+        script = compile_script(system_prompt, confirmation)
+    except ValueError as e:
+        raise ValueError(f"{flow_id}: {e}")
+    return Flow(flow_id, str(values.get("title", flow_id)), system_prompt, script, confirmation, source)
+
+
+class PromptRegistry:
+    """Compiled flows from one directory, recompiled per file when it changes"""
+
+    def __init__(self, directory: str = DEFAULT_PROMPTS_DIR, check_interval: float = 2.0):
+        self.directory = directory
+        self.check_interval = check_interval
+        self._flows: Dict[str, Flow] = {}
+        self._stamps: Dict[str, tuple] = {}  # file name -> (mtime_ns, size)
+        self._checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self.compiled = 0
+        self.errors = 0
+
+    def _scan(self) -> Dict[str, tuple]:
+        stamps = {}
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith(FLOW_SUFFIX) or entry.name == SHARED_PROMPT_FILE:
+                        stat = entry.stat()
+                        stamps[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            pass
+        return stamps
+
+    def _read_shared(self) -> str:
+        try:
+            with open(os.path.join(self.directory, SHARED_PROMPT_FILE), "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return ""
+
+    def _compile(self, name: str, shared: str) -> Flow:
+        path = os.path.join(self.directory, name)
+        with open(path, "rb") as f:
+            values = tomllib.load(f)
+        return compile_flow(name[:-len(FLOW_SUFFIX)], values, shared, source=path)
+
+    def _refresh(self, force: bool = False):
+        # caller holds self._lock
+        now = time.monotonic()
+        if not force and self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        stamps = self._scan()
+        if stamps == self._stamps and not force:
+            return
+
+        shared_changed = force or stamps.get(SHARED_PROMPT_FILE) != self._stamps.get(SHARED_PROMPT_FILE)
+        shared = self._read_shared()
+        flows = {}
+        for name, stamp in stamps.items():
+            if not name.endswith(FLOW_SUFFIX):
+                continue
+            flow_id = name[:-len(FLOW_SUFFIX)]
+            current = self._flows.get(flow_id)
+            if current is not None and not shared_changed and self._stamps.get(name) == stamp:
+                flows[flow_id] = current
+                continue
+            try:
+                flows[flow_id] = self._compile(name, shared)
+            except (OSError, ValueError) as e:
+                self.errors += 1
+                print(f"⚠️  Prompt flow {name} not loaded: {e}")
+                if current is not None:
+                    flows[flow_id] = current  # keep serving the last good version
+                continue
+            self.compiled += 1
+            if self._stamps:
+                print(f"✅ Reloaded prompt flow {flow_id}")
+        self._flows, self._stamps = flows, stamps
+
+    def get(self, flow_id: Optional[str] = None) -> Flow:
+        """The compiled flow (default: the configured one); ValueError if there is no such flow"""
+        flow_id = flow_id or get_config().flow
+        with self._lock:
+            self._refresh()
+            flow = self._flows.get(flow_id)
+            available = sorted(self._flows)
+        if flow is None:
+            raise ValueError(f"Unknown support flow {flow_id!r} (available: {', '.join(available) or 'none'})")
+        return flow
+
+    def flows(self) -> Dict[str, Flow]:
+        with self._lock:
+            self._refresh()
+            return dict(sorted(self._flows.items()))
+
+    def reload(self):
+        with self._lock:
+            self._refresh(force=True)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"flows": len(self._flows), "compiled": self.compiled, "errors": self.errors}
+
+
+_registry: Optional[PromptRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_prompt_registry() -> PromptRegistry:
+    """Process-wide registry loaded from PROMPTS_DIR"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PromptRegistry(os.getenv("PROMPTS_DIR", DEFAULT_PROMPTS_DIR))
+        return _registry
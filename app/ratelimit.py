@@ -0,0 +1,456 @@
+"""
+Upstream Rate Limiting
+======================
+
+Token-bucket scheduler in front of every OpenAI call. Each model has a
+requests-per-minute bucket and (for chat models) a tokens-per-minute bucket.
+Waiting calls are served by priority, so turns of conversations already in
+progress go ahead of calls that would start new ones.
+
+Limits adapt at runtime:
+  * x-ratelimit-* response headers resync the limits and remaining quota
+  * a 429 halves the request rate and pauses the model until retry-after,
+    then the rate climbs back additively on successful responses
+
+so throughput settles at the provider quota instead of collapsing into
+retries. Queue depth and wait times are reported per model; waits are also
+recorded as "<kind>_queue" stages in app.metrics.
+
+Retries belong to the limiter too: the OpenAI clients don't retry (SDK
+max_retries=0), and call()/acall() retry a 429, 5xx or dropped connection
+in a fresh slot, so every retry is charged to the RPM/TPM buckets and waits
+out the pause a 429 sets; 5xx and connection failures also back off
+exponentially before queueing again.
+
+    OPENAI_RATE_LIMITS    model=rpm[:tpm],...   initial limits, e.g. "gpt-4o-mini=500:200000,tts-1=50"
+    OPENAI_MAX_RETRIES    retries per call, each in a new slot   (default 3)
+
+With a shared app.store every replica also counts requests in a common
+per-minute window, so the RPM limit holds for the deployment, not per worker.
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import re
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Awaitable, Callable, Dict, Optional
+
+from openai import APIConnectionError, APITimeoutError
+
+from app import metrics
+from app.store import get_store
+
+PRIORITY_ONGOING = 0  # conversation already in progress
+PRIORITY_NEW = 1      # first turn of a conversation
+
+DEFAULT_LIMITS = {
+    "gpt-4o-mini": (500, 200000),
+    "whisper-1": (50, 0),
+    "tts-1": (50, 0),
+}
+FALLBACK_LIMITS = (60, 0)
+RETRY_STATUSES = (408, 409, 429)  # plus every 5xx, as the SDK would retry
+
+_current_model: contextvars.ContextVar = contextvars.ContextVar("voicebot_rate_model", default=None)
+
+
+def retryable(error: BaseException) -> bool:
+    """Whether a failed request is worth another slot (throttled, server error or dropped connection)"""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRY_STATUSES or status >= 500
+    # A timeout already spent the caller's budget
+    return isinstance(error, APIConnectionError) and not isinstance(error, APITimeoutError)
+
+
+def backoff(attempt: int, error: BaseException) -> float:
+    """Seconds to sleep before retry `attempt` (0-based); a 429 waits in the limiter's pause instead"""
+    if getattr(error, "status_code", None) == 429:
+        return 0.0
+    return min(8.0, 0.5 * 2 ** attempt) * random.uniform(0.75, 1.0)
+
+
+def parse_duration(value: str) -> Optional[float]:
+    """OpenAI reset durations such as '20ms', '6s', '1m30s' or '2h0m0s' in seconds"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total, matched = 0.0, False
+    for amount, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value):
+        total += float(amount) * {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}[unit]
+        matched = True
+    return total if matched else None
+
+
+class TokenBucket:
+    """Continuous-refill bucket; `rate` per second up to `capacity`"""
+
+    def __init__(self, per_minute: float, burst_seconds: float = 6.0):
+        self.burst_seconds = burst_seconds
+        self.level = 0.0
+        self.set_rate(per_minute)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def set_rate(self, per_minute: float):
+        self.per_minute = max(1.0, per_minute)
+        self.rate = self.per_minute / 60.0
+        self.capacity = max(1.0, self.rate * self.burst_seconds)
+        self.level = min(self.level, self.capacity)
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_for(self, amount: float) -> float:
+        """Seconds until `amount` is available (0 if it already is)"""
+        missing = min(amount, self.capacity) - self.level
+        return 0.0 if missing <= 0 else missing / self.rate
+
+
+class ModelLimiter:
+    """RPM/TPM buckets and the priority queue of callers for one model"""
+
+    def __init__(self, model: str, rpm: float, tpm: float = 0):
+        self.model = model
+        self.target_rpm = rpm
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.paused_until = 0.0
+        self.throttled = 0
+        self.granted = 0
+        self.retried = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._queue: list = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _enqueue(self, priority: int):
+        with self._cond:
+            return self._enqueue_locked(priority)
+
+    def _enqueue_locked(self, priority: int):
+        ticket = (priority, next(self._seq))
+        heapq.heappush(self._queue, ticket)
+        return ticket
+
+    def _dequeue(self, ticket):
+        """Drop an abandoned ticket (cancelled or interrupted caller)"""
+        with self._cond:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+
+    def _grant(self, ticket, tokens: float) -> float:
+        """Take capacity for `ticket` if it is first in line; otherwise seconds to wait. Caller holds the lock."""
+        now = time.monotonic()
+        if self._queue[0] != ticket:
+            return 0.05
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.requests.refill(now)
+        wait = self.requests.wait_for(1)
+        if self.tokens is not None and tokens:
+            self.tokens.refill(now)
+            wait = max(wait, self.tokens.wait_for(tokens))
+        if wait > 0:
+            return wait
+        self.requests.level -= 1
+        if self.tokens is not None and tokens:
+            self.tokens.level -= min(tokens, self.tokens.capacity)
+        heapq.heappop(self._queue)
+        self._cond.notify_all()
+        return 0.0
+
+    def try_acquire(self, tokens: float = 0) -> bool:
+        """Take capacity only if it is free now and nobody is queued for it (never waits)"""
+        with self._cond:
+            if self._queue:
+                return False
+            ticket = self._enqueue_locked(PRIORITY_ONGOING)
+            if self._grant(ticket, tokens):
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                return False
+        self._granted(0.0)
+        return True
+
+    def refund(self, tokens: float = 0):
+        """Give back capacity taken by try_acquire() for a request that was not sent"""
+        with self._cond:
+            self.requests.level = min(self.requests.capacity, self.requests.level + 1)
+            if self.tokens is not None and tokens:
+                self.tokens.level = min(self.tokens.capacity, self.tokens.level + tokens)
+            self.granted -= 1
+            self._cond.notify_all()
+
+    def _granted(self, waited: float):
+        with self._cond:
+            self.granted += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def acquire(self, tokens: float = 0, priority: int = PRIORITY_NEW) -> float:
+        """Block until this call may go upstream; returns the seconds spent queued"""
+        started = time.monotonic()
+        ticket = self._enqueue(priority)
+        try:
+            with self._cond:
+                while True:
+                    wait = self._grant(ticket, tokens)
+                    if not wait:
+                        break
+                    self._cond.wait(timeout=min(wait, 1.0))
+        except BaseException:
+            self._dequeue(ticket)
+            raise
+        waited = time.monotonic() - started
+        self._granted(waited)
+        return waited
+
+    async def aacquire(self, tokens: float = 0, priority: int = PRIORITY_NEW) -> float:
+        """Async acquire(); polls instead of blocking the event loop"""
+        started = time.monotonic()
+        ticket = self._enqueue(priority)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._grant(ticket, tokens)
+                if not wait:
+                    break
+                await asyncio.sleep(min(wait, 0.05))
+        except BaseException:
+            self._dequeue(ticket)
+            raise
+        waited = time.monotonic() - started
+        self._granted(waited)
+        return waited
+
+    def count_retry(self):
+        with self._cond:
+            self.retried += 1
+
+    def observe(self, status: int, headers):
+        """Adapt limits from a response: x-ratelimit-* headers, 429s and successes"""
+        with self._cond:
+            now = time.monotonic()
+            limit = headers.get("x-ratelimit-limit-requests")
+            if limit:
+                self.target_rpm = float(limit)
+            remaining = headers.get("x-ratelimit-remaining-requests")
+            if remaining is not None:
+                self.requests.refill(now)
+                self.requests.level = min(self.requests.level, float(remaining))
+            if self.tokens is not None:
+                token_limit = headers.get("x-ratelimit-limit-tokens")
+                if token_limit:
+                    self.tokens.set_rate(float(token_limit))
+                token_remaining = headers.get("x-ratelimit-remaining-tokens")
+                if token_remaining is not None:
+                    self.tokens.refill(now)
+                    self.tokens.level = min(self.tokens.level, float(token_remaining))
+
+            if status == 429:
+                self.throttled += 1
+                retry_ms = headers.get("retry-after-ms")
+                retry_after = ((float(retry_ms) / 1000 if retry_ms else None)
+                               or parse_duration(headers.get("retry-after", ""))
+                               or parse_duration(headers.get("x-ratelimit-reset-requests", ""))
+                               or 1.0)
+                self.paused_until = max(self.paused_until, now + retry_after)
+                self.requests.set_rate(self.requests.per_minute / 2)  # multiplicative decrease
+            elif status < 400:
+                if remaining is not None and float(remaining) <= 0:
+                    reset = parse_duration(headers.get("x-ratelimit-reset-requests", ""))
+                    if reset:
+                        self.paused_until = max(self.paused_until, now + reset)
+                # additive increase back toward the quota
+                step = max(1.0, self.target_rpm * 0.05)
+                self.requests.set_rate(min(self.target_rpm, self.requests.per_minute + step))
+            self._cond.notify_all()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "rpm": round(self.requests.per_minute, 1),
+                "target_rpm": self.target_rpm,
+                "tpm": round(self.tokens.per_minute) if self.tokens is not None else None,
+                "queue_depth": len(self._queue),
+                "granted": self.granted,
+                "throttled": self.throttled,
+                "retried": self.retried,
+                "wait_avg_ms": round(self.wait_total / self.granted * 1000, 1) if self.granted else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 1),
+            }
+
+
+class RateLimiter:
+    """Per-model limiters; run each upstream call through call()/acall() (or slot()/aslot())"""
+
+    def __init__(self, limits: Optional[Dict[str, tuple]] = None, store=None, max_retries: int = 3):
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.store = store
+        self.max_retries = max_retries
+        self._models: Dict[str, ModelLimiter] = {}
+        self._lock = threading.Lock()
+
+    def model(self, name: str) -> ModelLimiter:
+        with self._lock:
+            limiter = self._models.get(name)
+            if limiter is None:
+                rpm, tpm = self.limits.get(name, FALLBACK_LIMITS)
+                limiter = self._models[name] = ModelLimiter(name, rpm, tpm)
+            return limiter
+
+    def _window_key(self, limiter: ModelLimiter):
+        window = int(time.time() // 60)
+        return f"rl:{limiter.model}:{window}", 60 - time.time() % 60
+
+    def _global_admit(self, limiter: ModelLimiter) -> float:
+        """Seconds to wait for the deployment-wide minute window (0 when admitted)"""
+        if self.store is None:
+            return 0.0
+        key, remaining = self._window_key(limiter)
+        try:
+            count = self.store.incr(key, ttl=120)
+        except Exception:
+            return 0.0  # the shared counter is advisory; never block calls on a store outage
+        return 0.0 if count <= limiter.target_rpm else remaining
+
+    def _record_wait(self, kind: str, waited: float):
+        span = metrics.StageSpan(f"{kind}_queue")
+        span.seconds = waited
+        metrics.record_span(span)
+
+    @contextmanager
+    def slot(self, model: str, kind: str, tokens: float = 0, priority: int = PRIORITY_NEW):
+        """Wait for capacity, then attribute the responses made inside the block to `model`"""
+        limiter = self.model(model)
+        waited = limiter.acquire(tokens, priority)
+        while True:
+            pause = self._global_admit(limiter)
+            if not pause:
+                break
+            time.sleep(pause)
+            waited += pause
+        self._record_wait(kind, waited)
+        token = _current_model.set(limiter)
+        try:
+            yield limiter
+        finally:
+            _current_model.reset(token)
+
+    @asynccontextmanager
+    async def aslot(self, model: str, kind: str, tokens: float = 0, priority: int = PRIORITY_NEW):
+        limiter = self.model(model)
+        waited = await limiter.aacquire(tokens, priority)
+        while True:
+            pause = await asyncio.to_thread(self._global_admit, limiter) if self.store is not None else 0.0
+            if not pause:
+                break
+            await asyncio.sleep(pause)
+            waited += pause
+        self._record_wait(kind, waited)
+        token = _current_model.set(limiter)
+        try:
+            yield limiter
+        finally:
+            _current_model.reset(token)
+
+    def try_acquire(self, model: str, tokens: float = 0) -> bool:
+        """A slot for `model` if one is free right now (e.g. for a hedged request); never queues"""
+        limiter = self.model(model)
+        if not limiter.try_acquire(tokens):
+            return False
+        if self.store is not None and self._global_admit(limiter):
+            limiter.refund(tokens)  # the deployment-wide window is full: the local token goes back
+            return False
+        return True
+
+    def _retry(self, limiter: ModelLimiter, attempt: int, error: BaseException) -> Optional[float]:
+        """Backoff before the next attempt, or None when `error` should be raised"""
+        if attempt >= self.max_retries or not retryable(error):
+            return None
+        limiter.count_retry()
+        metrics.get_registry().count(limiter.model, "retried")
+        return backoff(attempt, error)
+
+    def call(self, model: str, kind: str, fn: Callable, tokens: float = 0, priority: int = PRIORITY_NEW):
+        """fn() inside a slot; retryable failures are retried, each in a new slot"""
+        for attempt in itertools.count():
+            with self.slot(model, kind, tokens, priority) as limiter:
+                try:
+                    return fn()
+                except Exception as e:
+                    delay = self._retry(limiter, attempt, e)
+                    if delay is None:
+                        raise
+            time.sleep(delay)
+
+    async def acall(self, model: str, kind: str, factory: Callable[[], Awaitable], tokens: float = 0,
+                    priority: int = PRIORITY_NEW):
+        """Async call(): `factory()` returns a fresh awaitable per attempt"""
+        for attempt in itertools.count():
+            async with self.aslot(model, kind, tokens, priority) as limiter:
+                try:
+                    return await factory()
+                except Exception as e:
+                    delay = self._retry(limiter, attempt, e)
+                    if delay is None:
+                        raise
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            models = list(self._models.values())
+        return {limiter.model: limiter.stats() for limiter in models}
+
+
+def observe_response(response):
+    """httpx response hook: feed status and rate-limit headers to the limiter of the current call"""
+    limiter = _current_model.get()
+    if limiter is not None:
+        limiter.observe(response.status_code, response.headers)
+
+
+async def aobserve_response(response):
+    observe_response(response)
+
+
+def parse_limits(spec: str) -> Dict[str, tuple]:
+    """'gpt-4o-mini=500:200000,tts-1=50' -> {'gpt-4o-mini': (500, 200000), 'tts-1': (50, 0)}"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, values = item.partition("=")
+        rpm, _, tpm = values.partition(":")
+        limits[model.strip()] = (float(rpm), float(tpm or 0))
+    return limits
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Process-wide limiter shared by every session (configured from the environment)"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            store = get_store()
+            _limiter = RateLimiter(
+                parse_limits(os.getenv("OPENAI_RATE_LIMITS", "")),
+                store=store if store.shared else None,
+                max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "3")),
+            )
+        return _limiter
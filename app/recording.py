@@ -0,0 +1,308 @@
+"""
+Call Recording
+==============
+
+Every call's turns and audio, kept for QA and replay. The voice path only
+hands a finished turn to a bounded in-memory queue and moves on; when the
+queue is full the turn is dropped and counted rather than waited on. One
+background thread drains the queue in batches, encodes the audio and
+appends to the store, so nothing on the voice path touches the disk.
+
+Layout (append-only, one directory per UTC day):
+    2026-10-17/turns-<host>-<pid>-0001.jsonl        one line per turn, new segment every RECORDING_SEGMENT_MB
+    2026-10-17/audio/<call_id>/<turn_id>-caller.ogg  what the caller said (16 kHz Opus)
+    2026-10-17/audio/<call_id>/<turn_id>-bot.ogg     what the bot said (raw PCM replies re-encoded; other
+                                                     formats kept as played, one file per clip)
+
+Turn lines carry call_id, session_id, turn_id, source, flow, timestamp,
+transcript, reply, timing and the audio paths relative to RECORDINGS_DIR.
+Stored calls can be fed back through the pipeline with tests/replay.py.
+
+    RECORDINGS_DIR          where calls are recorded; recording is off when unset
+    RECORDING_QUEUE         turns buffered before new ones are dropped   (default 256)
+    RECORDING_BATCH         most turns written per batch                 (default 32)
+    RECORDING_FLUSH_MS      longest a turn waits for its batch to fill   (default 500)
+    RECORDING_SEGMENT_MB    turn segment size before rolling over        (default 64)
+    RECORDING_AUDIO_CODEC   audio codec: ogg (Opus) | flac | wav         (default ogg)
+"""
+
+import atexit
+import glob
+import hashlib
+import json
+import os
+import queue
+import re
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+
+from app import metrics
+from app.audio import STT_SAMPLE_RATE, UPLOAD_CODECS, decode_audio, encode_audio, pcm16_to_float, resample, to_mono
+from app.formats import TTS_PCM_RATE
+
+SEGMENT_PATTERN = "turns-*.jsonl"
+_PATH_ID = re.compile(r"[0-9a-f]{1,32}")  # what the app generates (uuid4 hex prefixes, turn numbers)
+
+
+def path_id(value: str) -> str:
+    """`value` if it is safe as a path component, else a digest of it (ids can come from URLs)"""
+    if _PATH_ID.fullmatch(value or ""):
+        return value
+    return hashlib.sha256(str(value).encode("utf-8")).hexdigest()[:32]
+
+
+class RecordedTurn(NamedTuple):
+    """One finished turn as handed over by the voice path (encoded later, on the writer thread)"""
+    call_id: str
+    turn_id: str
+    source: str
+    transcript: Optional[str]
+    reply: str
+    caller_audio: Union[np.ndarray, bytes, None] = None  # float32 mono at caller_rate, or an encoded clip
+    caller_rate: int = STT_SAMPLE_RATE
+    bot_audio: Sequence[bytes] = ()                      # reply clips in playback order
+    bot_format: str = "pcm"
+    bot_rate: Optional[int] = None                       # raw PCM only
+    session_id: Optional[str] = None
+    flow: Optional[str] = None
+    timing: Optional[Dict] = None
+    timestamp: Optional[str] = None
+
+
+class CallRecorder:
+    """Bounded queue in front of a batching writer thread that owns the segment files"""
+
+    def __init__(self, directory: str, max_queue: int = 256, batch_size: int = 32, flush_interval: float = 0.5,
+                 segment_bytes: int = 64 * 1024 * 1024, codec: str = "ogg"):
+        if codec not in UPLOAD_CODECS:
+            raise ValueError(f"Unknown recording codec {codec!r} (expected one of {', '.join(UPLOAD_CODECS)})")
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.segment_bytes = segment_bytes
+        self.codec = codec
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._prefix = f"turns-{socket.gethostname()}-{os.getpid()}"
+        self._segment = None
+        self._segment_day: Optional[str] = None
+        self._segment_index = 0
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self.recorded = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.bytes_written = 0
+        self._thread = threading.Thread(target=self._run, name="voicebot-recorder", daemon=True)
+        self._thread.start()
+
+    def record(self, turn: RecordedTurn) -> bool:
+        """Queue a finished turn without blocking; False when it was dropped"""
+        if turn.timestamp is None:
+            turn = turn._replace(timestamp=datetime.now(timezone.utc).isoformat())
+        try:
+            self._queue.put_nowait(turn)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            metrics.get_registry().count("recording", "dropped")
+            return False
+        return True
+
+    def _run(self):
+        while not (self._closed.is_set() and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(batch)
+            except Exception as e:  # keep draining; the turns of this batch are lost, not the recorder
+                with self._lock:
+                    self.failed += len(batch)
+                print(f"⚠️  Recording batch of {len(batch)} turns failed: {e}")
+        self._close_segment()
+
+    def _write_batch(self, batch: List[RecordedTurn]):
+        with metrics.stage("recording") as span:
+            lines: Dict[str, List[str]] = {}  # day -> turn lines
+            for turn in batch:
+                try:
+                    record = self._store_audio(turn)
+                    audio_bytes = record.pop("_audio_bytes")
+                    line = json.dumps(record, ensure_ascii=False) + "\n"
+                except Exception as e:
+                    with self._lock:
+                        self.failed += 1
+                    print(f"⚠️  Recording of {turn.call_id}/{turn.turn_id} failed: {e}")
+                    continue
+                span.bytes_out += audio_bytes
+                lines.setdefault(turn.timestamp[:10], []).append(line)
+            recorded = 0
+            for day, day_lines in lines.items():
+                data = "".join(day_lines).encode("utf-8")
+                try:
+                    segment = self._segment_for(day)
+                    segment.write(data)
+                    segment.flush()
+                except Exception as e:
+                    # Drop the segment; the next batch reopens a fresh one
+                    self._abandon_segment()
+                    with self._lock:
+                        self.failed += len(day_lines)
+                    print(f"⚠️  Recording of {len(day_lines)} turns for {day} failed: {e}")
+                    continue
+                recorded += len(day_lines)
+                span.bytes_out += len(data)
+        with self._lock:
+            self.recorded += recorded
+            self.batches += 1
+            self.bytes_written += span.bytes_out
+
+    def _store_audio(self, turn: RecordedTurn) -> Dict:
+        day = turn.timestamp[:10]
+        relative_dir = os.path.join(day, "audio", path_id(turn.call_id))
+        turn_id = path_id(turn.turn_id)
+        os.makedirs(os.path.join(self.directory, relative_dir), exist_ok=True)
+        extension = UPLOAD_CODECS[self.codec][0].lower()
+        files: Dict[str, bytes] = {}
+
+        caller = turn.caller_audio
+        if isinstance(caller, (bytes, bytearray)):
+            samples, rate = decode_audio(bytes(caller))
+            caller = resample(to_mono(samples), rate, STT_SAMPLE_RATE)
+        elif caller is not None:
+            caller = resample(caller, turn.caller_rate, STT_SAMPLE_RATE)
+        if caller is not None and caller.size:
+            files[f"{turn_id}-caller.{extension}"] = encode_audio(caller, STT_SAMPLE_RATE, self.codec)
+
+        if turn.bot_audio and turn.bot_format == "pcm":
+            # Raw replies are stored compressed, at the 24 kHz TTS rate (one Opus supports natively)
+            samples = resample(pcm16_to_float(b"".join(turn.bot_audio)), turn.bot_rate or TTS_PCM_RATE, TTS_PCM_RATE)
+            files[f"{turn_id}-bot.{extension}"] = encode_audio(samples, TTS_PCM_RATE, self.codec)
+        else:
+            for index, clip in enumerate(turn.bot_audio):
+                suffix = f"-{index + 1}" if len(turn.bot_audio) > 1 else ""
+                files[f"{turn_id}-bot{suffix}.{turn.bot_format}"] = clip
+
+        for name, data in files.items():
+            with open(os.path.join(self.directory, relative_dir, name), "wb") as f:
+                f.write(data)
+        paths = {name: os.path.join(relative_dir, name) for name in files}
+        return {
+            "timestamp": turn.timestamp,
+            "call_id": turn.call_id,
+            "session_id": turn.session_id or turn.call_id,
+            "turn_id": turn.turn_id,
+            "source": turn.source,
+            "flow": turn.flow,
+            "transcript": turn.transcript,
+            "reply": turn.reply,
+            "timing": turn.timing or {},
+            "caller_audio": next((path for name, path in paths.items() if "-caller." in name), None),
+            "bot_audio": [path for name, path in paths.items() if "-bot" in name],
+            "_audio_bytes": sum(len(data) for data in files.values()),
+        }
+
+    def _segment_for(self, day: str):
+        """The open segment for `day`, rolled over when it is full or the day changes"""
+        if self._segment is not None and (day != self._segment_day or self._segment.tell() >= self.segment_bytes):
+            self._close_segment()
+        if self._segment is None:
+            os.makedirs(os.path.join(self.directory, day), exist_ok=True)
+            while True:
+                self._segment_index += 1
+                path = os.path.join(self.directory, day, f"{self._prefix}-{self._segment_index:04d}.jsonl")
+                if not os.path.exists(path):
+                    break
+            self._segment = open(path, "ab")
+            self._segment_day = day
+        return self._segment
+
+    def _close_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def _abandon_segment(self):
+        segment, self._segment = self._segment, None
+        if segment is not None:
+            try:
+                segment.close()
+            except Exception:
+                pass
+
+    def close(self, timeout: float = 5.0):
+        """Write whatever is queued and stop the writer"""
+        self._closed.set()
+        self._thread.join(timeout=timeout)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "recorded": self.recorded,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "batches": self.batches,
+                "bytes_written": self.bytes_written,
+            }
+
+
+def trace_timing(trace: Optional[metrics.TurnTrace]) -> Dict:
+    """Per-stage milliseconds of a turn still in progress, for its turn line"""
+    if trace is None:
+        return {}
+    traced = trace.as_dict(time.perf_counter() - trace.started)
+    return {"total_ms": traced["total_ms"], **{name: stage["ms"] for name, stage in traced["stages"].items()}}
+
+
+def load_turns(directory: str) -> Iterator[Dict]:
+    """Every recorded turn under `directory`, oldest first, with audio paths made absolute"""
+    records = []
+    for path in glob.glob(os.path.join(directory, "**", SEGMENT_PATTERN), recursive=True):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    records.append(json.loads(line))
+    records.sort(key=lambda record: record["timestamp"])
+    for record in records:
+        if record.get("caller_audio"):
+            record["caller_audio"] = os.path.join(directory, record["caller_audio"])
+        record["bot_audio"] = [os.path.join(directory, path) for path in record.get("bot_audio", [])]
+        yield record
+
+
+_recorder: Optional[CallRecorder] = None
+_recorder_lock = threading.Lock()
+
+
+def get_recorder() -> Optional[CallRecorder]:
+    """Process-wide recorder writing to RECORDINGS_DIR, or None when recording is off"""
+    global _recorder
+    directory = os.getenv("RECORDINGS_DIR")
+    if not directory:
+        return None
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = CallRecorder(
+                directory,
+                max_queue=int(os.getenv("RECORDING_QUEUE", "256")),
+                batch_size=int(os.getenv("RECORDING_BATCH", "32")),
+                flush_interval=float(os.getenv("RECORDING_FLUSH_MS", "500")) / 1000,
+                segment_bytes=int(float(os.getenv("RECORDING_SEGMENT_MB", "64")) * 1024 * 1024),
+                codec=os.getenv("RECORDING_AUDIO_CODEC", "ogg"),
+            )
+            atexit.register(_recorder.close)
+        return _recorder
@@ -0,0 +1,392 @@
+"""
+Upstream Resilience
+===================
+
+Keeps the tail latency of STT, LLM and TTS calls bounded when OpenAI is slow
+or failing. Every upstream call of a stage goes through its Upstream:
+
+    deadline   the call gives up after a fixed budget instead of waiting out
+               client timeouts
+    hedging    a call still running past the stage's recent p95 latency gets
+               one duplicate request; the first answer wins and the loser is
+               discarded. Hedges are capped at a fraction of recent calls so an
+               upstream that is slow across the board doesn't see double load
+    breaker    after consecutive failures the stage fails fast for a cool-down,
+               then lets a single probe through to decide whether to close
+
+The Upstream only sees the request itself: VoiceBot takes the rate-limit slot
+(app.ratelimit) first, so time queued locally never counts against the
+deadline, the hedge trigger or the breaker, and retries happen out there, one
+slot per attempt. A hedge is only sent if the limiter has spare capacity right
+now (hedge_admit); it never queues behind other calls. Throttling (429) and
+other 4xx answers don't count as upstream failures.
+
+A call that can't be answered raises UpstreamUnavailable. VoiceBot then falls
+back to lines that are pre-rendered in the phrase bank: the pending scripted
+question, or an apology asking the caller to repeat; the gateway also speaks
+a "please hold" line when a reply is slow to start.
+
+    UPSTREAM_DEADLINE_STT / _LLM / _TTS   seconds per call                   (default 8 / 10 / 6)
+    UPSTREAM_HEDGE                        0 disables hedged requests          (default 1)
+    UPSTREAM_HEDGE_MIN_MS                 never hedge sooner than this        (default 250)
+    UPSTREAM_HEDGE_MAX_RATIO              max share of recent calls hedged   (default 0.1)
+    UPSTREAM_BREAKER_FAILURES             consecutive failures to open        (default 5)
+    UPSTREAM_BREAKER_RESET_SECONDS        open time before a probe            (default 20)
+    UPSTREAM_HOLD_AFTER_MS                gateway "please hold" delay, 0 off  (default 2000)
+    UPSTREAM_WORKERS                      threads for blocking upstream calls (default 64)
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, Dict, Optional
+
+from app import metrics
+
+# Pre-rendered by the phrase bank build alongside the scripted lines
+HOLD_LINE = "Kripya line par bane rahiye, main aapki jaankari dekh raha hoon."
+RETRY_LINE = "Maaf kijiye, abhi jawab dene mein dikkat ho rahi hai. Kripya apni baat dobara kahiye."
+FALLBACK_LINES = (HOLD_LINE, RETRY_LINE)
+
+HOLD_AFTER_SECONDS = float(os.getenv("UPSTREAM_HOLD_AFTER_MS", "2000")) / 1000
+
+DEFAULT_DEADLINES = {"stt": 8.0, "llm": 10.0, "tts": 6.0}
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class UpstreamUnavailable(RuntimeError):
+    """No answer from the upstream: its deadline passed or its circuit is open"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 20.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.reset_seconds:
+                    return False
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def is_open(self) -> bool:
+        """Open and still cooling down (a probe isn't due yet)"""
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self.opened_at < self.reset_seconds
+
+    def release(self):
+        """The call proved nothing either way (e.g. throttled); a pending probe may be retried"""
+        with self._lock:
+            self._probing = False
+
+    def success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.trips += 1
+                    metrics.get_registry().count(self.name, "breaker_open")
+                    print(f"⚠️  {self.name.upper()} circuit open for {self.reset_seconds:.0f}s "
+                          f"after {self.failures} failures")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+
+class _LatencyWindow:
+    """Recent successful request latencies, with a lazily recomputed p95"""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: deque = deque(maxlen=size)
+        self._p95: Optional[float] = None
+        self._stale = 0
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self._stale += 1
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            if self._p95 is None or self._stale >= 10:
+                ordered = sorted(self._samples)
+                self._p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+                self._stale = 0
+            return self._p95
+
+
+def _releaser(discard: Callable):
+    """Done-callback that releases the result of a losing attempt once it finishes"""
+    def release(future):
+        if not future.cancelled() and future.exception() is None:
+            discard(future.result())
+    return release
+
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=int(os.getenv("UPSTREAM_WORKERS", "64")),
+                                       thread_name_prefix="voicebot-upstream")
+        return _pool
+
+
+class Upstream:
+    """Deadline, hedging and circuit breaker for one stage's upstream calls"""
+
+    def __init__(self, stage: str, deadline: float, hedge: bool = True, hedge_min: float = 0.25,
+                 hedge_max_ratio: float = 0.1, breaker: Optional[CircuitBreaker] = None):
+        self.stage = stage
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_min = hedge_min
+        self.hedge_max_ratio = hedge_max_ratio
+        self.breaker = breaker or CircuitBreaker(stage)
+        self.latency = _LatencyWindow()
+        self._recent: deque = deque(maxlen=100)  # whether each recent call was hedged
+        self._lock = threading.Lock()
+        self.counts = {"calls": 0, "hedged": 0, "hedge_skipped": 0, "hedge_won": 0, "deadline_exceeded": 0,
+                       "errors": 0, "rejected": 0}
+
+    def _count(self, field: str):
+        with self._lock:
+            self.counts[field] += 1
+        if field != "calls":
+            metrics.get_registry().count(self.stage, field)
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds after which a duplicate is sent, or None (not enough history, or over budget)"""
+        if not self.hedge:
+            return None
+        p95 = self.latency.p95()
+        if p95 is None:
+            return None
+        with self._lock:
+            if self._recent and sum(self._recent) >= self.hedge_max_ratio * self._recent.maxlen:
+                return None
+        delay = max(self.hedge_min, p95)
+        return delay if delay < self.deadline else None
+
+    def check(self):
+        """Fail fast, without side effects, while the circuit is open (e.g. before queueing for a slot)"""
+        if self.breaker.is_open():
+            self._count("rejected")
+            raise UpstreamUnavailable(f"{self.stage.upper()} unavailable (circuit open)")
+
+    def _admit(self):
+        if not self.breaker.allow():
+            self._count("rejected")
+            raise UpstreamUnavailable(f"{self.stage.upper()} unavailable (circuit open)")
+        self._count("calls")
+
+    def _settle(self, hedged: bool, error: Optional[BaseException] = None):
+        with self._lock:
+            self._recent.append(hedged)
+        status = getattr(error, "status_code", None)
+        # A rejected request (4xx) says nothing about upstream health; a throttled one (429) neither
+        # closes nor opens the circuit, the rate limiter backs off instead
+        if status == 429:
+            self.breaker.release()
+        elif error is None or (status is not None and 400 <= status < 500):
+            self.breaker.success()
+        else:
+            self.breaker.failure()
+
+    def _timed(self, fn: Callable):
+        started = time.monotonic()
+        result = fn()
+        self.latency.add(time.monotonic() - started)
+        return result
+
+    def call(self, fn: Callable, discard: Optional[Callable] = None,
+             hedge_admit: Optional[Callable[[], bool]] = None):
+        """Run blocking fn() under the stage policy; raises UpstreamUnavailable or fn's own error
+
+        `discard(result)` releases the result of an attempt that lost the race
+        (e.g. closes a stream). `hedge_admit()` is asked before a hedge is sent
+        (e.g. for a rate-limit slot without queueing); False skips the hedge.
+        """
+        self._admit()
+        started = time.monotonic()
+        delay = self.hedge_delay()
+
+        def submit():
+            return _executor().submit(contextvars.copy_context().run, self._timed, fn)
+
+        attempts = [submit()]
+        pending = set(attempts)
+        winner, error = None, None
+        while pending and winner is None:
+            now = time.monotonic()
+            limit = started + self.deadline
+            if len(attempts) == 1 and delay is not None:
+                limit = min(limit, started + delay)
+            done, pending = wait(pending, timeout=max(0.0, limit - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    winner = winner or future
+                else:
+                    error = future.exception()
+            now = time.monotonic()
+            if winner is not None or now >= started + self.deadline:
+                break
+            if pending and len(attempts) == 1 and delay is not None and now >= started + delay:
+                if self._may_hedge(hedge_admit):
+                    attempts.append(submit())
+                    pending.add(attempts[-1])
+                delay = None
+
+        for future in attempts:
+            if future is not winner and not future.cancel() and discard is not None:
+                future.add_done_callback(_releaser(discard))
+        return self._outcome(attempts, winner, pending, error)
+
+    def _outcome(self, attempts, winner, pending, error):
+        hedged = len(attempts) > 1
+        if winner is not None:
+            if winner is not attempts[0]:
+                self._count("hedge_won")
+            self._settle(hedged)
+            return winner.result()
+        if pending:
+            self._count("deadline_exceeded")
+            error = UpstreamUnavailable(f"{self.stage.upper()} took longer than {self.deadline:.0f}s")
+        else:
+            self._count("errors")
+        self._settle(hedged, error)
+        raise error
+
+    async def _atimed(self, factory: Callable[[], Awaitable]):
+        started = time.monotonic()
+        result = await factory()
+        self.latency.add(time.monotonic() - started)
+        return result
+
+    def _may_hedge(self, hedge_admit: Optional[Callable[[], bool]]) -> bool:
+        if hedge_admit is not None and not hedge_admit():
+            self._count("hedge_skipped")
+            return False
+        self._count("hedged")
+        return True
+
+    async def acall(self, factory: Callable[[], Awaitable], discard: Optional[Callable] = None,
+                    hedge_admit: Optional[Callable[[], bool]] = None):
+        """Async call(): `factory()` returns a fresh awaitable per attempt; losers are cancelled"""
+        self._admit()
+        started = time.monotonic()
+        delay = self.hedge_delay()
+        attempts = [asyncio.ensure_future(self._atimed(factory))]
+        pending = set(attempts)
+        winner, error = None, None
+        try:
+            while pending and winner is None:
+                now = time.monotonic()
+                limit = started + self.deadline
+                if len(attempts) == 1 and delay is not None:
+                    limit = min(limit, started + delay)
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, limit - now),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = winner or task
+                    else:
+                        error = task.exception()
+                now = time.monotonic()
+                if winner is not None or now >= started + self.deadline:
+                    break
+                if pending and len(attempts) == 1 and delay is not None and now >= started + delay:
+                    if self._may_hedge(hedge_admit):
+                        attempts.append(asyncio.ensure_future(self._atimed(factory)))
+                        pending.add(attempts[-1])
+                    delay = None
+        finally:
+            for task in attempts:
+                if task is not winner:
+                    if task.done() and not task.cancelled() and task.exception() is None and discard is not None:
+                        released = discard(task.result())
+                        if asyncio.iscoroutine(released):
+                            asyncio.ensure_future(released)
+                    task.cancel()
+        return self._outcome(attempts, winner, pending, error)
+
+    def stats(self) -> Dict:
+        delay = self.hedge_delay()
+        with self._lock:
+            counts = dict(self.counts)
+        return {
+            **counts,
+            "breaker": self.breaker.state,
+            "breaker_trips": self.breaker.trips,
+            "deadline_s": self.deadline,
+            "hedge_after_ms": round(delay * 1000) if delay is not None else None,
+        }
+
+
+_upstreams: Dict[str, Upstream] = {}
+_upstreams_lock = threading.Lock()
+
+
+def get_upstream(stage: str) -> Upstream:
+    """Process-wide policy for one stage ("stt", "llm" or "tts"), configured from UPSTREAM_*"""
+    with _upstreams_lock:
+        upstream = _upstreams.get(stage)
+        if upstream is None:
+            breaker = CircuitBreaker(
+                stage,
+                failure_threshold=int(os.getenv("UPSTREAM_BREAKER_FAILURES", "5")),
+                reset_seconds=float(os.getenv("UPSTREAM_BREAKER_RESET_SECONDS", "20")),
+            )
+            upstream = Upstream(
+                stage,
+                deadline=float(os.getenv(f"UPSTREAM_DEADLINE_{stage.upper()}", DEFAULT_DEADLINES[stage])),
+                hedge=os.getenv("UPSTREAM_HEDGE", "1") != "0",
+                hedge_min=float(os.getenv("UPSTREAM_HEDGE_MIN_MS", "250")) / 1000,
+                hedge_max_ratio=float(os.getenv("UPSTREAM_HEDGE_MAX_RATIO", "0.1")),
+                breaker=breaker,
+            )
+            _upstreams[stage] = upstream
+        return upstream
+
+
+def resilience_stats() -> Dict[str, Dict]:
+    with _upstreams_lock:
+        upstreams = dict(_upstreams)
+    return {stage: upstream.stats() for stage, upstream in sorted(upstreams.items())}
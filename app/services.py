@@ -1,13 +1,396 @@
+import itertools
 import os
 from dotenv import load_dotenv
 
+from app import metrics
+from app.audio import prepare_for_stt
+from app.clients import get_async_openai_client, get_openai_client
+from app.config import get_config
+from app.dialogue import WAITING_FOR_COMPLAINT, DialogueEngine
+from app.formats import browser_plan
+from app.memory import ConversationMemory, estimate_tokens, message_tokens
+from app.phrase_bank import get_phrase_bank
+from app.prompts import get_prompt_registry
+from app.ratelimit import PRIORITY_NEW, PRIORITY_ONGOING, get_rate_limiter
+from app.resilience import RETRY_LINE, get_upstream
+from app.singleflight import get_single_flight, payload_key
+from app.tts_cache import cache_key, get_tts_cache
+from app.vad import get_vad
+
 load_dotenv()
-#llm prompt
-SYSTEM_PROMPT = """
-You are an Ola customer support bot speaking only in Hindi. Follow this script exactly:
-- Wait for the user to say: "Main 2 ghante se online hoon par mujhe koi ride nahi mil rahi."
-- Then you say: "Ola customer support mein aapka swagat hai. Kya yeh aapka registered number hai?"
-- If the user confirms (e.g., "Haan"), you say: "Aapka number blocked nahi hai. Sab theek hai. Kripya apna location badal kar phir se rides check kijye."
-- After giving the solution, end the conversation.
-Do not deviate from this script. Keep responses very short and concise.
-"""
\ No newline at end of file
+
+def _print_notify(level, message):
+    print(message)
+
+class VoiceBot:
+    """Whisper STT, scripted/LLM replies and TTS for one conversation
+
+    `notify(level, message)` surfaces user-facing errors and hints; the
+    Streamlit app routes it to st.error/st.info, headless callers just print.
+    `flow` picks the support flow from app.prompts (default: the configured one).
+    """
+
+    def __init__(self, notify=None, flow=None):
+        self.notify = notify or _print_notify
+        self.client = get_openai_client()  # shared, connection-pooled across sessions
+        self.use_flow(flow)
+        self.memory = ConversationMemory(token_budget=int(os.getenv("LLM_HISTORY_TOKEN_BUDGET", "400")))
+        self.apply_config(get_config())
+        self.tts_format = browser_plan().response_format  # what the Streamlit player plays natively
+        self.tts_cache = get_tts_cache()
+        self.stt_upload_codec = os.getenv("STT_UPLOAD_CODEC", "flac")
+        self.vad = get_vad()
+        self.phrase_bank = get_phrase_bank()
+        self.flights = get_single_flight()  # identical concurrent upstream calls share one request
+        self.limiter = get_rate_limiter()
+        # Deadlines, hedging and circuit breakers per stage; failures fall back to pre-rendered lines
+        self.upstreams = {stage: get_upstream(stage) for stage in ("stt", "llm", "tts")}
+        self._fell_back = False  # the current reply is a canned fallback, not model output
+
+    def transcribe_audio(self, audio_bytes):
+        """Transcribe audio using Whisper"""
+        try:
+            prepared = self._prepare_upload(audio_bytes)
+            if prepared is None:
+                return None
+            with metrics.stage("stt", bytes_in=len(prepared[1])) as span:
+                def create():
+                    return self.client.audio.transcriptions.create(**self._stt_request(prepared)).text
+
+                def transcribe():
+                    return self._upstream("stt", self.stt_model, create)
+
+                text = self.flights.do(payload_key("stt", prepared[1]), transcribe)
+                span.bytes_out = len(text.encode("utf-8"))
+            return text
+        except Exception as e:
+            self.notify("error", f"Transcription error: {e}")
+            return None
+
+    async def atranscribe_audio(self, audio_bytes, prepared=None):
+        """Async transcribe_audio(); pass `prepared` to upload an already encoded (filename, bytes) pair"""
+        try:
+            prepared = prepared or self._prepare_upload(audio_bytes)
+            if prepared is None:
+                return None
+            with metrics.stage("stt", bytes_in=len(prepared[1])) as span:
+                async def create():
+                    client = get_async_openai_client()
+                    return (await client.audio.transcriptions.create(**self._stt_request(prepared))).text
+
+                async def transcribe():
+                    return await self._aupstream("stt", self.stt_model, create)
+
+                text = await self.flights.ado(payload_key("stt", prepared[1]), transcribe)
+                span.bytes_out = len(text.encode("utf-8"))
+            return text
+        except Exception as e:
+            self.notify("error", f"Transcription error: {e}")
+            return None
+
+    def _prepare_upload(self, audio_bytes):
+        # 16 kHz mono, silence trimmed, re-encoded in memory: no temp file, far fewer bytes uploaded
+        with metrics.stage("encode", bytes_in=len(audio_bytes)) as span:
+            prepared = prepare_for_stt(audio_bytes, codec=self.stt_upload_codec, vad=self.vad)
+            span.bytes_out = len(prepared[1]) if prepared else 0
+        if prepared is None:
+            self.notify("info", "🤫 No speech detected, please try again.")
+        return prepared
+
+    def use_flow(self, flow_id=None):
+        """Serve a support flow (precompiled by the prompt registry); restarts the script"""
+        self.flow = get_prompt_registry().get(flow_id)
+        self.system_prompt = self.flow.system_prompt
+        self.dialogue = DialogueEngine(script=self.flow.script)
+        self.conversation_state = self.dialogue.state
+
+    def apply_config(self, config):
+        """Take models, voice and VAD threshold from app.config (also on hot reload)"""
+        self.stt_model = config.stt_model
+        self.llm_model = config.llm_model
+        self.tts_model = config.tts_model
+        self.tts_voice = config.tts_voice
+        if config.vad_threshold:
+            get_vad().threshold = config.vad_threshold
+
+    def _priority(self):
+        """Turns of conversations already under way are scheduled ahead of new conversations"""
+        if self.dialogue.state != WAITING_FOR_COMPLAINT or self.memory.stats()["messages"]:
+            return PRIORITY_ONGOING
+        return PRIORITY_NEW
+
+    def _upstream(self, stage, model, fn, tokens=0, discard=None):
+        """fn() under the stage's deadline, hedging and breaker, inside a rate-limit slot taken first
+
+        Time queued for the slot doesn't count against the deadline or the
+        hedge trigger; 429/5xx are retried in a new slot, and a hedge only goes
+        out if the limiter has a slot to spare right now.
+        """
+        upstream = self.upstreams[stage]
+        upstream.check()  # don't queue for a slot while the circuit is open
+
+        def attempt():
+            return upstream.call(fn, discard=discard, hedge_admit=lambda: self.limiter.try_acquire(model, tokens))
+
+        return self.limiter.call(model, stage, attempt, tokens=tokens, priority=self._priority())
+
+    async def _aupstream(self, stage, model, factory, tokens=0, discard=None):
+        """Async _upstream()"""
+        upstream = self.upstreams[stage]
+        upstream.check()
+
+        async def attempt():
+            return await upstream.acall(factory, discard=discard,
+                                        hedge_admit=lambda: self.limiter.try_acquire(model, tokens))
+
+        return await self.limiter.acall(model, stage, attempt, tokens=tokens, priority=self._priority())
+
+    def _llm_tokens(self, request):
+        # TPM is charged for the prompt plus the completion allowance
+        return message_tokens(request["messages"]) + request["max_tokens"]
+
+    def _stt_request(self, prepared):
+        filename, upload_bytes = prepared
+        return {"model": self.stt_model, "file": (filename, upload_bytes), "language": "hi",
+                "timeout": self.upstreams["stt"].deadline}
+
+    def _llm_request(self, user_input, stream=False):
+        messages = self.memory.build_messages(self.system_prompt, user_input)
+        request = {"model": self.llm_model, "messages": messages, "max_tokens": 150, "temperature": 0.1,
+                   "timeout": self.upstreams["llm"].deadline}  # also bounds each read of a stream
+        if stream:
+            request["stream"] = True
+        return request
+
+    def get_llm_response(self, user_input):
+        """Get response from GPT-4"""
+        try:
+            request = self._llm_request(user_input)
+            messages = request["messages"]
+            
+            with metrics.stage("llm", bytes_in=_content_bytes(messages), tokens_in=message_tokens(messages)) as span:
+                def create():
+                    return self.client.chat.completions.create(**request)
+
+                def complete():
+                    completion = self._upstream("llm", request["model"], create, tokens=self._llm_tokens(request))
+                    if completion.usage:  # only the call that actually went upstream reports token usage
+                        span.tokens_in = completion.usage.prompt_tokens
+                        span.tokens_out = completion.usage.completion_tokens
+                    return completion.choices[0].message.content
+
+                reply = self.flights.do(payload_key("llm", request), complete)
+                span.bytes_out = len((reply or "").encode("utf-8"))
+            return reply
+        except Exception as e:
+            self.notify("error", f"LLM error: {e}")
+            return self._fallback_reply()
+
+    def _fallback_reply(self):
+        """Said instead of an error when the LLM can't answer: the pending scripted question, else an apology"""
+        metrics.get_registry().count("fallback", "llm")
+        self._fell_back = True
+        return self.dialogue.reprompt() or RETRY_LINE
+
+    def stream_llm_response(self, user_input):
+        """Stream completion text deltas from GPT-4"""
+        reply = ""
+        try:
+            request = self._llm_request(user_input, stream=True)
+            messages = request["messages"]
+
+            with metrics.stage("llm", bytes_in=_content_bytes(messages), tokens_in=message_tokens(messages)) as span:
+                def open_stream():
+                    # Hedged and bounded up to the first text delta, i.e. time to first token
+                    stream = self.client.chat.completions.create(**request)
+                    chunks = iter(stream)
+                    first = next((delta for delta in map(_delta, chunks) if delta), None)
+                    return stream, chunks, [first] if first else []
+
+                _, chunks, head = self._upstream("llm", request["model"], open_stream, tokens=self._llm_tokens(request),
+                                                 discard=lambda opened: opened[0].response.close())
+                for delta in itertools.chain(head, map(_delta, chunks)):
+                    if delta:
+                        reply += delta
+                        yield delta
+                span.bytes_out = len(reply.encode("utf-8"))
+                span.tokens_out = estimate_tokens(reply)
+        except Exception as e:
+            self.notify("error", f"LLM error: {e}")
+            if not reply:
+                yield self._fallback_reply()
+
+    async def astream_llm_response(self, user_input):
+        """Async stream_llm_response()"""
+        reply = ""
+        try:
+            request = self._llm_request(user_input, stream=True)
+            messages = request["messages"]
+
+            with metrics.stage("llm", bytes_in=_content_bytes(messages), tokens_in=message_tokens(messages)) as span:
+                async def open_stream():
+                    stream = await get_async_openai_client().chat.completions.create(**request)
+                    chunks = stream.__aiter__()
+                    try:
+                        while True:
+                            delta = _delta(await chunks.__anext__())
+                            if delta:
+                                return stream, chunks, [delta]
+                    except StopAsyncIteration:
+                        return stream, chunks, []
+
+                _, chunks, head = await self._aupstream("llm", request["model"], open_stream,
+                                                        tokens=self._llm_tokens(request),
+                                                        discard=lambda opened: opened[0].response.aclose())
+                for delta in head:
+                    reply += delta
+                    yield delta
+                async for chunk in chunks:
+                    delta = _delta(chunk)
+                    if delta:
+                        reply += delta
+                        yield delta
+                span.bytes_out = len(reply.encode("utf-8"))
+                span.tokens_out = estimate_tokens(reply)
+        except Exception as e:
+            self.notify("error", f"LLM error: {e}")
+            if not reply:
+                yield self._fallback_reply()
+
+    def snapshot(self):
+        """Conversation state to persist between requests (any worker can restore it)"""
+        return {"flow": self.flow.id, "dialogue_state": self.dialogue.state, "memory": self.memory.snapshot()}
+
+    def restore(self, snapshot):
+        if snapshot.get("flow", self.flow.id) != self.flow.id:
+            self.use_flow(snapshot["flow"])
+        self.dialogue.state = snapshot.get("dialogue_state", self.dialogue.state)
+        self.conversation_state = self.dialogue.state
+        self.memory.restore(snapshot.get("memory", {}))
+
+    def _scripted_reply(self, user_input):
+        match = self.dialogue.respond(user_input)
+        self.conversation_state = self.dialogue.state
+        return match.reply if match else None
+
+    def _remember(self, user_input, reply):
+        # A fallback line is said to the caller but never fed back to the model as its own words
+        self.memory.add_turn(user_input, None if self._fell_back else reply)
+        self._fell_back = False
+
+    def stream_respond(self, user_input):
+        """Streaming counterpart of respond(): scripted replies arrive as a single delta"""
+        self._fell_back = False
+        reply = self._scripted_reply(user_input)
+        if reply is not None:
+            yield reply
+        else:
+            reply = ""
+            for delta in self.stream_llm_response(user_input):
+                reply += delta
+                yield delta
+        self._remember(user_input, reply)
+
+    async def astream_respond(self, user_input):
+        """Async stream_respond()"""
+        self._fell_back = False
+        reply = self._scripted_reply(user_input)
+        if reply is not None:
+            yield reply
+        else:
+            reply = ""
+            async for delta in self.astream_llm_response(user_input):
+                reply += delta
+                yield delta
+        self._remember(user_input, reply)
+
+    def respond(self, user_input):
+        """Answer scripted turns locally and fall back to the LLM otherwise"""
+        self._fell_back = False
+        reply = self._scripted_reply(user_input)
+        if reply is None:
+            reply = self.get_llm_response(user_input)
+        self._remember(user_input, reply)
+        return reply
+
+    def text_to_speech(self, text, response_format=None):
+        """Convert text to Hindi speech (served from the phrase bank or shared cache when possible)"""
+        response_format = response_format or self.tts_format
+        with metrics.stage("tts", bytes_in=len(text.encode("utf-8"))) as span:
+            audio = self._stored_speech(text, response_format)
+            if audio is None:
+                audio = self._synthesize(text, response_format)
+            span.bytes_out = len(audio) if audio else 0
+            return audio
+
+    async def atext_to_speech(self, text, response_format=None):
+        """Async text_to_speech()"""
+        response_format = response_format or self.tts_format
+        with metrics.stage("tts", bytes_in=len(text.encode("utf-8"))) as span:
+            audio = self._stored_speech(text, response_format)
+            if audio is None:
+                async def create():
+                    return await get_async_openai_client().audio.speech.create(
+                        **self._tts_request(text, response_format)
+                    )
+
+                async def synthesize():
+                    response = await self._aupstream("tts", self.tts_model, create)
+                    self.tts_cache.put(self.tts_model, self.tts_voice, text, response.content, response_format)
+                    return response.content
+
+                try:
+                    audio = await self.flights.ado(self._tts_flight_key(text, response_format), synthesize)
+                except Exception as e:
+                    self.notify("error", f"TTS error: {e}")
+                    audio = None
+            span.bytes_out = len(audio) if audio else 0
+            return audio
+
+    def publish_speech(self, text, audio, response_format=None):
+        """Handle under which app.media serves this audio, or None if the cache can't hold it"""
+        response_format = response_format or self.tts_format
+        key = cache_key(self.tts_model, self.tts_voice, text, response_format)
+        if audio and not self.tts_cache.contains(key):
+            self.tts_cache.put(self.tts_model, self.tts_voice, text, audio, response_format)  # e.g. phrase-bank audio
+        return key if self.tts_cache.contains(key) else None
+
+    def _stored_speech(self, text, response_format):
+        """Pre-rendered or cached audio for this text, if any"""
+        if self.phrase_bank.serves(self.tts_model, self.tts_voice):
+            banked = self.phrase_bank.lookup(text, fmt=response_format)
+            if banked:
+                return banked
+        return self.tts_cache.get(self.tts_model, self.tts_voice, text, response_format)
+
+    def _tts_request(self, text, response_format):
+        request = {"model": self.tts_model, "voice": self.tts_voice, "input": text,
+                   "timeout": self.upstreams["tts"].deadline}
+        if response_format != "mp3":
+            request["response_format"] = response_format
+        return request
+
+    def _tts_flight_key(self, text, response_format):
+        # Same content address as the TTS cache, so whitespace-only differences still coalesce
+        return f"tts:{cache_key(self.tts_model, self.tts_voice, text, response_format)}"
+
+    def _synthesize(self, text, response_format):
+        def create():
+            return self.client.audio.speech.create(**self._tts_request(text, response_format))
+
+        def synthesize():
+            audio = self._upstream("tts", self.tts_model, create).content  # Returns audio bytes directly
+            self.tts_cache.put(self.tts_model, self.tts_voice, text, audio, response_format)
+            return audio
+
+        try:
+            return self.flights.do(self._tts_flight_key(text, response_format), synthesize)
+        except Exception as e:
+            self.notify("error", f"TTS error: {e}")
+            return None
+
+def _delta(chunk):
+    return chunk.choices[0].delta.content if chunk.choices else None
+
+def _content_bytes(messages):
+    return sum(len((m.get("content") or "").encode("utf-8")) for m in messages)
@@ -0,0 +1,117 @@
+"""
+Request Coalescing (single-flight)
+==================================
+
+When several sessions make the same upstream call at the same time (every
+caller reaching the same scripted line, or sending the canonical complaint
+to the LLM), only the first one goes to OpenAI; the others wait for it and
+share the result. Calls are keyed by a hash of their normalized payload.
+Nothing is cached: once the call finishes, the next identical request goes
+upstream again (the TTS cache covers repeat reuse).
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+import weakref
+from typing import Awaitable, Callable, Dict
+
+from app import metrics
+
+
+def payload_key(kind: str, payload) -> str:
+    """Stable key for an upstream request: kind plus a hash of its canonical JSON (bytes hashed raw)"""
+    if isinstance(payload, (bytes, bytearray)):
+        digest = hashlib.sha256(payload).hexdigest()
+    else:
+        canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=repr)
+        digest = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+    return f"{kind}:{digest}"
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent identical calls, from threads (do) or coroutines (ado)"""
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._tasks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Future]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self.coalesced: Dict[str, int] = {}
+
+    def _count(self, key: str, shared: bool):
+        # caller holds self._lock
+        kind = key.split(":", 1)[0]
+        self.requests[kind] = self.requests.get(kind, 0) + 1
+        if shared:
+            self.coalesced[kind] = self.coalesced.get(kind, 0) + 1
+            metrics.get_registry().count(kind, "coalesced")
+
+    def do(self, key: str, fn: Callable):
+        """Run fn() once for all concurrent callers with the same key"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._count(key, shared=not leader)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable]):
+        """Async do(): the upstream call runs as its own task, so one waiter being cancelled doesn't cancel it for the rest"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            tasks = self._tasks.setdefault(loop, {})
+            task = tasks.get(key)
+            leader = task is None
+            if leader:
+                task = tasks[key] = loop.create_task(fn())
+                task.add_done_callback(lambda _: tasks.pop(key, None))
+            self._count(key, shared=not leader)
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = sum(self.requests.values())
+            shared = sum(self.coalesced.values())
+            return {
+                "requests": dict(self.requests),
+                "coalesced": dict(self.coalesced),
+                "coalesce_rate": shared / total if total else 0.0,
+            }
+
+
+_flights = SingleFlight()
+
+
+def get_single_flight() -> SingleFlight:
+    """Process-wide coalescing layer shared by every VoiceBot"""
+    return _flights
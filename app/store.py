@@ -0,0 +1,159 @@
+"""
+Shared State Store
+==================
+
+Pluggable key/value backend for state that must outlive one worker process:
+conversation sessions, the shared TTS audio tier and rate-limit counters.
+With a Redis-compatible store every replica behind a load balancer sees the
+same sessions and cached audio, so calls can move between workers without
+sticky sessions.
+
+    SESSION_STORE_URL     redis://host:6379/0 for a shared store   (default: in-process)
+    SESSION_TTL           seconds an idle session is kept          (default 3600)
+    STORE_PREFIX          key namespace                            (default "voicebot:")
+
+The in-process MemoryStore keeps single-replica deployments dependency free.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+
+class MemoryStore:
+    """Thread-safe in-process store with per-key expiry"""
+
+    shared = False  # visible to this process only
+
+    def __init__(self, prefix: str = "voicebot:"):
+        self.prefix = prefix
+        self._data: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            return self._live(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[self.prefix + key] = (value, expires)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(self.prefix + key, None)
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Atomically add to a counter; the TTL starts when the counter is created"""
+        key = self.prefix + key
+        with self._lock:
+            current = self._live(key)
+            value = int(current or 0) + amount
+            expires = self._data[key][1] if current is not None else (time.monotonic() + ttl if ttl else None)
+            self._data[key] = (str(value).encode(), expires)
+            return value
+
+
+class RedisStore:
+    """Store backed by any Redis-compatible server (Redis, Valkey, KeyDB, ...)"""
+
+    shared = True  # visible to every replica
+
+    def __init__(self, url: str, prefix: str = "voicebot:", client=None):
+        self.prefix = prefix
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise ImportError("SESSION_STORE_URL needs the 'redis' package: pip install redis") from e
+            client = redis.Redis.from_url(url, socket_timeout=2.0, socket_connect_timeout=2.0,
+                                          health_check_interval=30)
+        self.client = client
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        if ttl:
+            self.client.set(self.prefix + key, value, px=int(ttl * 1000))
+        else:
+            self.client.set(self.prefix + key, value)
+
+    def delete(self, key: str):
+        self.client.delete(self.prefix + key)
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Atomically add to a counter; the TTL starts when the counter is created"""
+        key = self.prefix + key
+        value = self.client.incrby(key, amount)
+        if ttl and value == amount:
+            self.client.pexpire(key, int(ttl * 1000))
+        return int(value)
+
+
+class SessionStore:
+    """JSON conversation snapshots keyed by session id, refreshed on every save"""
+
+    def __init__(self, store, ttl: float = 3600):
+        self.store = store
+        self.ttl = ttl
+
+    def load(self, session_id: str) -> Optional[Dict]:
+        try:
+            raw = self.store.get(f"session:{session_id}")
+        except Exception as e:
+            print(f"⚠️  Session store unavailable, starting fresh: {e}")
+            return None
+        return json.loads(raw) if raw else None
+
+    def save(self, session_id: str, snapshot: Dict):
+        try:
+            self.store.set(f"session:{session_id}", json.dumps(snapshot, ensure_ascii=False).encode("utf-8"), self.ttl)
+        except Exception as e:
+            print(f"⚠️  Session not saved: {e}")
+
+    def delete(self, session_id: str):
+        try:
+            self.store.delete(f"session:{session_id}")
+        except Exception:
+            pass
+
+
+_shared_store = None
+_shared_lock = threading.Lock()
+
+
+def get_store():
+    """Process-wide store selected by SESSION_STORE_URL (falls back to in-process)"""
+    global _shared_store
+    with _shared_lock:
+        if _shared_store is None:
+            url = os.getenv("SESSION_STORE_URL", "")
+            prefix = os.getenv("STORE_PREFIX", "voicebot:")
+            if url.startswith(("redis://", "rediss://", "unix://")):
+                try:
+                    _shared_store = RedisStore(url, prefix=prefix)
+                    _shared_store.client.ping()
+                    print(f"✅ Shared session store: {url.split('@')[-1]}")
+                except Exception as e:
+                    print(f"⚠️  Shared store unavailable ({e}); using in-process store")
+                    _shared_store = None
+            if _shared_store is None:
+                _shared_store = MemoryStore(prefix=prefix)
+        return _shared_store
+
+
+def get_session_store() -> SessionStore:
+    return SessionStore(get_store(), ttl=float(os.getenv("SESSION_TTL", "3600")))
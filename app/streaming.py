@@ -0,0 +1,125 @@
+"""
+Streaming LLM -> TTS
+====================
+
+Splits streamed completion text into sentences as tokens arrive and sends
+each sentence to TTS immediately, yielding audio in order. Time to first
+audio then tracks the first sentence rather than the whole reply.
+"""
+
+import contextvars
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+_SENTENCE_END = re.compile(r"[.?!।]+[\"'”’)]*(?=\s|$)")
+_LAST_WORD = re.compile(r"(\w+)$")
+# A period after these (or after an initial) doesn't end a sentence: "Mr. Sharma", "Rs. 250", "A. K."
+_ABBREVIATIONS = {"dr", "mr", "mrs", "ms", "jr", "sr", "st", "rs", "vs"}
+
+
+def _is_abbreviation(text: str, match) -> bool:
+    if match.group() != ".":
+        return False
+    word = _LAST_WORD.search(text, 0, match.start())
+    return word is not None and (word.group(1).lower() in _ABBREVIATIONS or
+                                 (len(word.group(1)) == 1 and word.group(1).isalpha()))
+
+
+class SentenceChunker:
+    """Incrementally cut a token stream into speakable sentences"""
+
+    def __init__(self, min_chars: int = 12):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, delta: str) -> List[str]:
+        """Add a token delta and return any sentences it completed"""
+        self._buffer += delta
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self._buffer):
+            # A boundary at the very end may still grow ("..."), wait for more text
+            if match.end() == len(self._buffer):
+                break
+            if _is_abbreviation(self._buffer, match):
+                continue
+            candidate = self._buffer[start:match.end()].strip()
+            if len(candidate) >= self.min_chars:
+                sentences.append(candidate)
+                start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> List[str]:
+        """Return whatever text is left at the end of the stream"""
+        rest, self._buffer = self._buffer.strip(), ""
+        return [rest] if rest else []
+
+
+class StreamingTurn:
+    """Iterate (sentence, audio) pairs in order while the completion is still streaming"""
+
+    def __init__(self, text_deltas: Iterable[str], synthesize: Callable[[str], Optional[bytes]],
+                 max_workers: int = 3, min_chars: int = 12):
+        self.text_deltas = text_deltas
+        self.synthesize = synthesize
+        self.max_workers = max_workers
+        self.chunker = SentenceChunker(min_chars=min_chars)
+        self.text = ""
+        self.sentences: List[str] = []
+        self.timing: Dict[str, Optional[float]] = {
+            "started": None,
+            "first_token": None,
+            "first_sentence": None,
+            "first_audio": None,
+            "finished": None,
+        }
+
+    def _mark(self, event: str):
+        if self.timing[event] is None:
+            self.timing[event] = time.perf_counter()
+
+    def _ready(self, pending: deque, wait: bool) -> Iterator[Tuple[str, Optional[bytes]]]:
+        """Yield finished syntheses from the head of the queue, preserving order"""
+        while pending and (wait or pending[0][1].done()):
+            sentence, future = pending.popleft()
+            audio = future.result()
+            if audio:
+                self._mark("first_audio")
+            yield sentence, audio
+
+    def __iter__(self) -> Iterator[Tuple[str, Optional[bytes]]]:
+        self._mark("started")
+        pending: deque = deque()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            def submit(sentences):
+                for sentence in sentences:
+                    self._mark("first_sentence")
+                    self.sentences.append(sentence)
+                    # Run in a copy of the caller's context so per-turn tracing follows the work
+                    context = contextvars.copy_context()
+                    pending.append((sentence, pool.submit(context.run, self.synthesize, sentence)))
+
+            for delta in self.text_deltas:
+                if not delta:
+                    continue
+                self._mark("first_token")
+                self.text += delta
+                submit(self.chunker.feed(delta))
+                yield from self._ready(pending, wait=False)
+
+            submit(self.chunker.flush())
+            yield from self._ready(pending, wait=True)
+        self._mark("finished")
+
+    def latencies_ms(self) -> Dict[str, float]:
+        """Milliseconds from the start of the turn to each recorded event"""
+        started = self.timing["started"]
+        return {
+            event: (stamp - started) * 1000
+            for event, stamp in self.timing.items()
+            if event != "started" and stamp is not None and started is not None
+        }
@@ -0,0 +1,175 @@
+"""
+Streaming STT
+=============
+
+Partial transcripts while the caller is still talking. The recognizer sees
+every frame of the utterance being segmented; when the caller pauses it
+transcribes the audio so far, so by the time the endpoint silence has
+elapsed the final transcript is usually already back and the turn starts
+without another STT round-trip. Partials also let the gateway dispatch the
+scripted reply speculatively (see app.gateway).
+
+Backends are pluggable (anything with `async transcribe(samples, sample_rate)`):
+    whisper   batch Whisper on the audio so far, one request per partial
+    standin   local stand-in that reveals a fixed transcript as speech accumulates (no network)
+    off       no partials; the whole utterance is transcribed after the endpoint
+
+    STREAMING_STT               whisper | standin | off          (default whisper)
+    STREAMING_STT_PAUSE_MS      silence before a partial is taken (default 200)
+    STREAMING_STT_INTERVAL_MS   also take a partial every N ms of speech (default 0: pauses only)
+    STREAMING_STT_STANDIN_TEXT  what the stand-in "hears"             (default: the scripted complaint)
+"""
+
+import asyncio
+import math
+import os
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from app import metrics
+from app.audio import prepare_samples_for_stt
+
+
+class Partial(NamedTuple):
+    text: str
+    covered: int     # utterance samples the transcript was computed over
+    at_pause: bool   # taken after the caller stopped talking
+
+
+class WhisperBackend:
+    """Batch Whisper through the VoiceBot (rate limits, coalescing and metrics included)"""
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    async def transcribe(self, samples: np.ndarray, sample_rate: int) -> Optional[str]:
+        with metrics.stage("encode", bytes_in=samples.size * 2) as span:
+            prepared = await asyncio.to_thread(
+                prepare_samples_for_stt, samples, sample_rate, self.bot.stt_upload_codec, vad=self.bot.vad
+            )
+            span.bytes_out = len(prepared[1]) if prepared else 0
+        if prepared is None:
+            return None
+        return await self.bot.atranscribe_audio(None, prepared=prepared)
+
+
+class StandInBackend:
+    """Offline stand-in for a streaming recognizer: `transcript` revealed word by word with speech time"""
+
+    def __init__(self, transcript: str, vad, words_per_second: float = 2.5, latency: float = 0.0):
+        self.words = transcript.split()
+        self.vad = vad
+        self.words_per_second = words_per_second
+        self.latency = latency
+
+    async def transcribe(self, samples: np.ndarray, sample_rate: int) -> Optional[str]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        speech_seconds = self.vad.speech_mask(samples, sample_rate).sum() * self.vad.frame_ms / 1000
+        count = min(len(self.words), math.ceil(speech_seconds * self.words_per_second))
+        return " ".join(self.words[:count]) or None
+
+
+class StreamingRecognizer:
+    """Partials for the utterance being segmented, then its final transcript"""
+
+    def __init__(self, backend, sample_rate: int, pause_ms: Optional[float] = 200, interval_ms: float = 0,
+                 on_partial: Optional[Callable[[Partial], None]] = None):
+        self.backend = backend
+        self.sample_rate = sample_rate
+        self.pause_ms = pause_ms
+        self.interval_ms = interval_ms
+        self.on_partial = on_partial
+        self.partials = 0
+        self.reused = 0
+        self.finals = 0
+        self._reset()
+
+    def _reset(self):
+        self._frames: List[np.ndarray] = []
+        self._samples = 0
+        self._speech_end = 0        # samples up to the end of the last speech frame
+        self._silence_ms = 0.0
+        self._since_partial_ms = 0.0
+        self._paused = False        # a partial was already taken for this pause
+        self._pending: List[tuple] = []  # (covered, task)
+
+    def feed(self, frame: np.ndarray, is_speech: bool):
+        """Add one frame of the current utterance (pre-roll included)"""
+        self._frames.append(frame)
+        self._samples += frame.size
+        frame_ms = 1000.0 * frame.size / self.sample_rate
+        if is_speech:
+            self._speech_end = self._samples
+            self._silence_ms = 0.0
+            self._paused = False
+            self._since_partial_ms += frame_ms
+            busy = any(not task.done() for _, task in self._pending)
+            if self.interval_ms and self._since_partial_ms >= self.interval_ms and not busy:
+                self._launch(at_pause=False)
+        elif self._speech_end:
+            self._silence_ms += frame_ms
+            if self.pause_ms is not None and self._silence_ms >= self.pause_ms and not self._paused:
+                self._paused = True
+                self._launch(at_pause=True)
+
+    def _launch(self, at_pause: bool):
+        covered = self._samples
+        samples = np.concatenate(self._frames)
+        self._since_partial_ms = 0.0
+        self.partials += 1
+        metrics.get_registry().count("stt", "partials")
+        task = asyncio.get_running_loop().create_task(self._partial(samples, covered, at_pause))
+        self._pending.append((covered, task))
+
+    async def _partial(self, samples: np.ndarray, covered: int, at_pause: bool) -> Optional[str]:
+        text = await self.backend.transcribe(samples, self.sample_rate)
+        if text and self.on_partial is not None:
+            self.on_partial(Partial(text, covered, at_pause))
+        return text
+
+    def finish(self, samples: np.ndarray) -> "asyncio.Task":
+        """Final transcript for the utterance just endpointed, as a task
+
+        A partial that already covered every speech frame is the final
+        transcript; otherwise the whole utterance is transcribed now.
+        """
+        speech_end, pending = self._speech_end, self._pending
+        self._reset()
+        covering = [task for covered, task in pending if covered >= speech_end]
+        for covered, task in pending:
+            if covered < speech_end and not task.done():
+                task.cancel()
+        if covering:
+            self.reused += 1
+            metrics.get_registry().count("stt", "final_from_partial")
+            return asyncio.ensure_future(self._reuse(covering[-1], samples))
+        self.finals += 1
+        return asyncio.get_running_loop().create_task(self.backend.transcribe(samples, self.sample_rate))
+
+    async def _reuse(self, task: "asyncio.Task", samples: np.ndarray) -> Optional[str]:
+        try:
+            text = await task
+        except Exception:
+            text = None
+        if text is None:  # the partial failed; fall back to the whole utterance
+            text = await self.backend.transcribe(samples, self.sample_rate)
+        return text
+
+    def stats(self) -> Dict:
+        return {"partials": self.partials, "final_from_partial": self.reused, "final_requests": self.finals}
+
+
+def create_recognizer(bot, sample_rate: int, on_partial=None, mode: Optional[str] = None) -> StreamingRecognizer:
+    """Recognizer configured from STREAMING_STT* for one call"""
+    mode = (mode or os.getenv("STREAMING_STT", "whisper")).lower()
+    if mode == "standin":
+        text = os.getenv("STREAMING_STT_STANDIN_TEXT") or bot.dialogue.complaint_texts[0]
+        backend = StandInBackend(text, bot.vad)
+    else:
+        backend = WhisperBackend(bot)
+    pause_ms = None if mode == "off" else float(os.getenv("STREAMING_STT_PAUSE_MS", "200"))
+    interval_ms = 0 if mode == "off" else float(os.getenv("STREAMING_STT_INTERVAL_MS", "0"))
+    return StreamingRecognizer(backend, sample_rate, pause_ms=pause_ms, interval_ms=interval_ms,
+                               on_partial=on_partial)
@@ -0,0 +1,184 @@
+"""
+TTS Audio Cache
+===============
+
+Content-addressed cache for synthesized speech. Entries are keyed by
+(model, voice, normalized text, response format) and kept in a bounded
+in-memory LRU, with an optional on-disk tier so audio survives process
+restarts and an optional shared store tier (app.store) so every replica
+reuses audio synthesized by any other.
+"""
+
+import hashlib
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from app.store import get_store
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text so trivially different inputs share one cache entry"""
+    text = unicodedata.normalize("NFC", text or "")
+    return " ".join(text.split())
+
+
+def cache_key(model: str, voice: str, text: str, response_format: str = "mp3") -> str:
+    """Build the content address for a TTS request"""
+    parts = [model, voice, normalize_text(text)]
+    if response_format != "mp3":
+        parts.append(response_format)  # mp3 keys are unchanged so existing disk caches stay valid
+    payload = "\x1f".join(parts)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """Thread-safe LRU of audio bytes with an optional disk tier"""
+
+    def __init__(self, max_entries: int = 128, max_bytes: int = 32 * 1024 * 1024,
+                 cache_dir: Optional[str] = None, store=None, store_ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.store = store
+        self.store_ttl = store_ttl
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.audio")
+
+    def _remember(self, key: str, audio: bytes):
+        """Insert into the memory tier and evict down to the configured bounds"""
+        if key in self._entries:
+            self._size -= len(self._entries.pop(key))
+        self._entries[key] = audio
+        self._size += len(audio)
+        while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self.evictions += 1
+
+    def get(self, model: str, voice: str, text: str, response_format: str = "mp3") -> Optional[bytes]:
+        """Return cached audio or None"""
+        return self.get_by_key(cache_key(model, voice, text, response_format))
+
+    def contains(self, key: str) -> bool:
+        """Whether the memory tier holds this key (no disk or store lookup)"""
+        with self._lock:
+            return key in self._entries
+
+    def get_by_key(self, key: str) -> Optional[bytes]:
+        """Look up audio by its content address (e.g. a media handle)"""
+        with self._lock:
+            audio = self._entries.get(key)
+            if audio is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return audio
+
+        if self.cache_dir:
+            try:
+                with open(self._disk_path(key), "rb") as f:
+                    audio = f.read()
+            except OSError:
+                audio = None
+            if audio:
+                with self._lock:
+                    self._remember(key, audio)
+                    self.hits += 1
+                    self.disk_hits += 1
+                return audio
+
+        if self.store is not None:
+            try:
+                audio = self.store.get(f"tts:{key}")
+            except Exception:
+                audio = None
+            if audio:
+                with self._lock:
+                    self._remember(key, audio)
+                    self.hits += 1
+                    self.store_hits += 1
+                return audio
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, model: str, voice: str, text: str, audio: bytes, response_format: str = "mp3"):
+        """Store audio in memory and, if configured, on disk"""
+        if not audio:
+            return
+        key = cache_key(model, voice, text, response_format)
+        with self._lock:
+            self._remember(key, audio)
+
+        if self.cache_dir:
+            path = self._disk_path(key)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, "wb") as f:
+                    f.write(audio)
+                os.replace(tmp_path, path)
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+
+        if self.store is not None:
+            try:
+                self.store.set(f"tts:{key}", audio, self.store_ttl)
+            except Exception:
+                pass  # the shared tier is best effort; local tiers already hold the audio
+
+    def clear(self):
+        """Drop the memory tier (the disk tier is left untouched)"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and current memory usage"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "store_hits": self.store_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_shared_cache: Optional[TTSCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_tts_cache() -> TTSCache:
+    """Process-wide cache shared by every session (configured from the environment)"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            store = get_store()
+            _shared_cache = TTSCache(
+                max_entries=int(os.getenv("TTS_CACHE_MAX_ENTRIES", "128")),
+                max_bytes=int(os.getenv("TTS_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+                cache_dir=os.getenv("TTS_CACHE_DIR") or None,
+                # An in-process store would only duplicate the LRU, so only attach shared ones
+                store=store if store.shared else None,
+                store_ttl=float(os.getenv("TTS_CACHE_STORE_TTL", str(7 * 24 * 3600))),
+            )
+        return _shared_cache
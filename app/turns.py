@@ -0,0 +1,139 @@
+"""
+Background Turns
+================
+
+Runs Streamlit voice turns (STT -> reply -> TTS) on a shared thread pool
+instead of inside the script run. A rerun only submits the recorded clip and
+then renders whatever the session's job has produced so far: the transcript,
+the reply text as it streams, and playable audio sources. Reruns never wait
+on, or repeat, an API call. While the job runs, the page reruns when it has
+produced something new (wait_for_change), not on a fixed timer.
+
+At most one turn runs per session; a new clip submitted while one is running
+is ignored. Workers must not touch st.* (there is no script context in the
+pool threads), so user-facing notices are collected on the job and shown by
+the next rerun.
+
+    TURN_WORKERS   background turn threads shared by all sessions (default 4)
+"""
+
+import contextvars
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class TurnJob:
+    """One turn's progress: written by its worker, read by any number of reruns"""
+
+    def __init__(self, session_id: str):
+        self.id = uuid.uuid4().hex[:8]
+        self.session_id = session_id
+        self.status = RUNNING
+        self.transcript: Optional[str] = None
+        self.reply = ""                # reply text so far
+        self.clips: List[str] = []     # audio sources, in playback order
+        self.notices: List[Tuple[str, str]] = []
+        self.timing: Dict[str, float] = {}
+        self.error: Optional[str] = None
+        self.submitted = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.version = 0               # bumped by touch() whenever there is more to show
+        self._changed = threading.Condition()
+
+    def notify(self, level: str, message: str):
+        """VoiceBot notify() for the duration of the turn"""
+        self.notices.append((level, message))
+        self.touch()
+
+    def touch(self):
+        """The worker produced something new (transcript, reply text, a clip, a notice, the end)"""
+        with self._changed:
+            self.version += 1
+            self._changed.notify_all()
+
+    def wait_for_change(self, version: int, timeout: float) -> int:
+        """Block until the job moves past `version` or `timeout` passes; returns the current version"""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    @property
+    def done(self) -> bool:
+        return self.status != RUNNING
+
+    def elapsed_ms(self) -> float:
+        return ((self.finished or time.perf_counter()) - self.submitted) * 1000
+
+
+class TurnRunner:
+    """Thread pool plus the latest job of each session"""
+
+    def __init__(self, max_workers: int = 4):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="voicebot-turn")
+        self._jobs: Dict[str, TurnJob] = {}
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.ignored = 0
+        self.failed = 0
+
+    def submit(self, session_id: str, work: Callable[[TurnJob], None]) -> TurnJob:
+        """Start `work(job)` for the session unless one of its turns is still running"""
+        with self._lock:
+            current = self._jobs.get(session_id)
+            if current is not None and not current.done:
+                self.ignored += 1
+                return current
+            job = TurnJob(session_id)
+            self._jobs[session_id] = job
+            self.submitted += 1
+        # Run in a copy of the caller's context so tracing set up by the caller follows the work
+        self.pool.submit(contextvars.copy_context().run, self._run, job, work)
+        return job
+
+    def _run(self, job: TurnJob, work: Callable[[TurnJob], None]):
+        status = DONE
+        try:
+            work(job)
+        except Exception as e:
+            traceback.print_exc()
+            job.error = f"{type(e).__name__}: {e}"
+            status = FAILED
+            self.failed += 1
+        job.finished = time.perf_counter()
+        job.status = status
+        job.touch()
+
+    def job(self, session_id: str) -> Optional[TurnJob]:
+        return self._jobs.get(session_id)
+
+    def forget(self, session_id: str):
+        """Drop the session's job once its results are taken (or on reset; a running worker then finishes unobserved)"""
+        with self._lock:
+            self._jobs.pop(session_id, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            running = sum(1 for job in self._jobs.values() if not job.done)
+        return {"running": running, "submitted": self.submitted, "ignored": self.ignored, "failed": self.failed}
+
+
+_runner: Optional[TurnRunner] = None
+_runner_lock = threading.Lock()
+
+
+def get_turn_runner() -> TurnRunner:
+    """Process-wide runner shared by every Streamlit session"""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = TurnRunner(max_workers=int(os.getenv("TURN_WORKERS", "4")))
+        return _runner
@@ -0,0 +1,174 @@
+"""
+Voice Activity Detection
+========================
+
+Energy-based, numpy-vectorized VAD with optional spectral refinement. Used
+to trim leading/trailing silence, split utterances and reject empty
+recordings before anything is sent to Whisper.
+
+Levels are frame RMS on the int16 scale, the same units as the
+`stream_test.audio_levels` written by the audio diagnostics, so thresholds
+can be calibrated directly from a `voice_bot_audio_report_*.json`.
+"""
+
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Calibrated from voice_bot_audio_report_20250824_231042.json:
+# noise floor ~0.5, speech ~40 -> geometric mean of the two
+DEFAULT_THRESHOLD = 4.9
+SPEECH_BAND_HZ = (300.0, 3400.0)
+
+
+def calibrate_threshold(levels: Sequence[float], noise_percentile: float = 25,
+                        speech_percentile: float = 90) -> Optional[float]:
+    """Pick a threshold between the noise floor and typical speech level"""
+    levels = np.asarray([lvl for lvl in levels if lvl is not None], dtype=np.float64)
+    levels = levels[np.isfinite(levels) & (levels > 0)]
+    if levels.size < 4:
+        return None
+    noise = np.percentile(levels, noise_percentile)
+    speech = np.percentile(levels, speech_percentile)
+    if speech <= noise * 2:
+        return None
+    return float(np.sqrt(noise * speech))
+
+
+def _int16_scale(samples: np.ndarray) -> np.ndarray:
+    """Float [-1, 1] or int16 samples as float32 on the int16 scale"""
+    if samples.dtype.kind == "f":
+        return samples.astype(np.float32, copy=False) * 32768.0
+    return samples.astype(np.float32)
+
+
+class VoiceActivityDetector:
+    """Frame-level speech detection over a mono signal"""
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, frame_ms: int = 30,
+                 min_speech_ms: int = 150, hangover_ms: int = 240, spectral: bool = False,
+                 band_ratio: float = 0.45):
+        self.threshold = threshold
+        self.frame_ms = frame_ms
+        self.min_speech_ms = min_speech_ms
+        self.hangover_ms = hangover_ms
+        self.spectral = spectral
+        self.band_ratio = band_ratio
+
+    @classmethod
+    def from_report(cls, report: Dict, **kwargs) -> "VoiceActivityDetector":
+        """Detector with its threshold calibrated from a diagnostics report"""
+        levels = report.get("stream_test", {}).get("audio_levels", [])
+        threshold = calibrate_threshold(levels)
+        return cls(threshold=threshold or DEFAULT_THRESHOLD, **kwargs)
+
+    def frame_length(self, sample_rate: int) -> int:
+        return max(1, int(sample_rate * self.frame_ms / 1000))
+
+    def _frames(self, samples: np.ndarray, sample_rate: int) -> np.ndarray:
+        """View the signal as (num_frames, frame_length), zero-padding the tail"""
+        frame_len = self.frame_length(sample_rate)
+        scaled = _int16_scale(samples)
+        pad = (-scaled.size) % frame_len
+        if pad:
+            scaled = np.concatenate([scaled, np.zeros(pad, dtype=np.float32)])
+        return scaled.reshape(-1, frame_len)
+
+    def frame_levels(self, samples: np.ndarray, sample_rate: int) -> np.ndarray:
+        """RMS level per frame on the int16 scale"""
+        frames = self._frames(samples, sample_rate)
+        return np.sqrt(np.mean(frames * frames, axis=1))
+
+    def _band_energy_ratio(self, frames: np.ndarray, sample_rate: int) -> np.ndarray:
+        """Fraction of each frame's energy inside the speech band"""
+        window = np.hanning(frames.shape[1]).astype(np.float32)
+        power = np.abs(np.fft.rfft(frames * window, axis=1)) ** 2
+        freqs = np.fft.rfftfreq(frames.shape[1], d=1.0 / sample_rate)
+        in_band = (freqs >= SPEECH_BAND_HZ[0]) & (freqs <= SPEECH_BAND_HZ[1])
+        total = power.sum(axis=1) + 1e-9
+        return power[:, in_band].sum(axis=1) / total
+
+    def frame_is_speech(self, frame: np.ndarray, sample_rate: int) -> bool:
+        """Instantaneous decision for a single frame (no smoothing)"""
+        scaled = _int16_scale(frame)
+        if scaled.size == 0 or np.sqrt(np.mean(scaled * scaled)) < self.threshold:
+            return False
+        if self.spectral:
+            return bool(self._band_energy_ratio(scaled[np.newaxis, :], sample_rate)[0] >= self.band_ratio)
+        return True
+
+    def speech_mask(self, samples: np.ndarray, sample_rate: int) -> np.ndarray:
+        """Boolean speech decision per frame, with hangover smoothing"""
+        frames = self._frames(samples, sample_rate)
+        if frames.size == 0:
+            return np.zeros(0, dtype=bool)
+        levels = np.sqrt(np.mean(frames * frames, axis=1))
+        mask = levels >= self.threshold
+        if self.spectral and mask.any():
+            candidates = np.flatnonzero(mask)
+            ratios = self._band_energy_ratio(frames[candidates], sample_rate)
+            mask[candidates[ratios < self.band_ratio]] = False
+
+        # Drop bursts shorter than min_speech_ms (clicks, pops)
+        min_frames = max(1, self.min_speech_ms // self.frame_ms)
+        mask = self._remove_short_runs(mask, min_frames)
+
+        # Extend each speech run so word endings and short pauses are kept
+        hangover = self.hangover_ms // self.frame_ms
+        if hangover and mask.any():
+            kernel = np.ones(2 * hangover + 1, dtype=np.int32)
+            mask = np.convolve(mask.astype(np.int32), kernel, mode="same") > 0
+        return mask
+
+    @staticmethod
+    def _runs(mask: np.ndarray) -> List[Tuple[int, int]]:
+        """(start, end) frame indices of each run of True"""
+        edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+        return list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+
+    def _remove_short_runs(self, mask: np.ndarray, min_frames: int) -> np.ndarray:
+        if min_frames <= 1:
+            return mask
+        mask = mask.copy()
+        for start, end in self._runs(mask):
+            if end - start < min_frames:
+                mask[start:end] = False
+        return mask
+
+    def segments(self, samples: np.ndarray, sample_rate: int) -> List[Tuple[int, int]]:
+        """Utterances as (start_sample, end_sample) pairs"""
+        frame_len = self.frame_length(sample_rate)
+        mask = self.speech_mask(samples, sample_rate)
+        return [(int(start) * frame_len, min(int(end) * frame_len, samples.shape[0])) for start, end in self._runs(mask)]
+
+    def has_speech(self, samples: np.ndarray, sample_rate: int) -> bool:
+        return bool(self.segments(samples, sample_rate))
+
+    def trim(self, samples: np.ndarray, sample_rate: int) -> Optional[np.ndarray]:
+        """Cut leading and trailing silence; None when there is no speech at all"""
+        segments = self.segments(samples, sample_rate)
+        if not segments:
+            return None
+        return samples[segments[0][0]:segments[-1][1]]
+
+    def split(self, samples: np.ndarray, sample_rate: int) -> List[np.ndarray]:
+        """Split a recording into separate utterances (views, no copies)"""
+        return [samples[start:end] for start, end in self.segments(samples, sample_rate)]
+
+
+_shared_vad: Optional[VoiceActivityDetector] = None
+_shared_lock = threading.Lock()
+
+
+def get_vad() -> VoiceActivityDetector:
+    """Detector calibrated from the latest diagnostics report, if there is one"""
+    global _shared_vad
+    with _shared_lock:
+        if _shared_vad is None:
+            try:
+                from voice_bot_config_helper import load_diagnostic_report
+                _shared_vad = VoiceActivityDetector.from_report(load_diagnostic_report())
+            except Exception:
+                _shared_vad = VoiceActivityDetector()
+        return _shared_vad
@@ -0,0 +1,345 @@
+"""
+Offline Voice Bot Benchmark
+===========================
+
+Drives VoiceBot (and optionally the Pipecat pipeline) against the local fake
+OpenAI server with WAV fixtures at increasing concurrency, and reports turns
+per second, time-to-first-audio and memory per session. No network access
+is needed, so it can gate performance regressions in CI.
+
+    python -m tests.benchmark --concurrency 1,4,16 --turns 2
+    python -m tests.benchmark --fixtures recordings/ --json bench.json --max-ttfa-p95-ms 2500
+    python -m tests.benchmark --pipecat
+    python -m tests.benchmark --shared-store     # every turn on a fresh "replica" via the fake Redis
+    python -m tests.benchmark --spike-rate 0.05 --spike-seconds 3   # latency spikes: hedging keeps p95 bounded
+    python -m tests.benchmark --error-rate 1 --fault-endpoints chat  # LLM outage: breaker + fallback lines
+"""
+
+import argparse
+import asyncio
+import glob
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+import soundfile as sf
+
+from tests.fake_openai import FakeOpenAIServer
+from tests.fake_redis import FakeRedisServer
+
+
+def synth_fixture(seconds: float = 2.5, sample_rate: int = 44100, channels: int = 2, seed: int = 0) -> bytes:
+    """Speech-like WAV: harmonic voiced bursts between stretches of background noise"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    f0 = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = ((t > 0.4) & (t < seconds - 0.4)) * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t) ** 2)
+    signal = 0.2 * voiced * envelope + 0.0005 * rng.standard_normal(t.size)
+    buffer = io.BytesIO()
+    sf.write(buffer, np.repeat(signal[:, None], channels, axis=1), sample_rate, format="WAV", subtype="PCM_16")
+    return buffer.getvalue()
+
+
+def load_fixtures(directory: str = None) -> List[bytes]:
+    if directory:
+        paths = sorted(glob.glob(os.path.join(directory, "*.wav")))
+        if not paths:
+            raise FileNotFoundError(f"No .wav fixtures in {directory}")
+        fixtures = []
+        for path in paths:
+            with open(path, "rb") as f:
+                fixtures.append(f.read())
+        return fixtures
+    return [synth_fixture(seed=i) for i in range(3)]
+
+
+def percentile(values: List[float], q: float):
+    return round(float(np.percentile(values, q)) * 1000, 1) if values else None
+
+
+def run_voicebot_session(fixtures: List[bytes], turns: int, streaming: bool, bots: list,
+                         hop: bool = False) -> List[Dict]:
+    """One conversation; with hop=True each turn runs on a new VoiceBot restored from the session store"""
+    from app.services import VoiceBot
+    from app.store import get_session_store
+    from app.streaming import StreamingTurn
+
+    sessions = get_session_store()
+    session_id = f"bench-{id(bots)}-{threading.get_ident()}"
+    bot = VoiceBot(notify=lambda level, message: None)
+    bots.append(bot)
+    results = []
+    for i in range(turns):
+        started = time.perf_counter()
+        if hop and i:
+            expected = bot.dialogue.state
+            bot = VoiceBot(notify=lambda level, message: None)
+            bot.restore((sessions.load(session_id) or {}).get("bot", {}))
+            if bot.dialogue.state != expected:
+                raise RuntimeError(f"Session {session_id} lost its dialogue state on hop "
+                                   f"({bot.dialogue.state} != {expected})")
+        first_audio = None
+        transcript = bot.transcribe_audio(fixtures[i % len(fixtures)])
+        if transcript:
+            if streaming:
+                for _, audio in StreamingTurn(bot.stream_respond(transcript), bot.text_to_speech):
+                    if audio and first_audio is None:
+                        first_audio = time.perf_counter()
+            else:
+                if bot.text_to_speech(bot.respond(transcript)):
+                    first_audio = time.perf_counter()
+        if hop:
+            sessions.save(session_id, {"bot": bot.snapshot()})
+        finished = time.perf_counter()
+        results.append({
+            "ok": first_audio is not None,
+            "ttfa": (first_audio or finished) - started,
+            "total": finished - started,
+        })
+    return results
+
+
+def bench_voicebot(fixtures: List[bytes], concurrency: int, turns: int, streaming: bool, hop: bool = False) -> Dict:
+    bots: list = []
+    tracemalloc.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(run_voicebot_session, fixtures, turns, streaming, bots, hop) for _ in range(concurrency)]
+        results = [r for future in futures for r in future.result()]
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    ok = [r for r in results if r["ok"]]
+    ttfa = [r["ttfa"] for r in ok]
+    return {
+        "target": "voicebot",
+        "concurrency": concurrency,
+        "turns": len(results),
+        "failed_turns": len(results) - len(ok),
+        "turns_per_sec": round(len(ok) / elapsed, 2),
+        "ttfa_p50_ms": percentile(ttfa, 50),
+        "ttfa_p95_ms": percentile(ttfa, 95),
+        "turn_p95_ms": percentile([r["total"] for r in results], 95),
+        "mem_per_session_kb": round(current / max(1, len(bots)) / 1024, 1),
+        "peak_mem_kb": round(peak / 1024, 1),
+    }
+
+
+def bench_pipecat(fixtures: List[bytes], concurrency: int, base_url: str) -> Dict:
+    """Run concurrent Pipecat pipelines (no local transport) and time the first TTS audio"""
+    from pipecat.frames.frames import (
+        EndFrame,
+        InputAudioRawFrame,
+        TTSAudioRawFrame,
+        UserStartedSpeakingFrame,
+        UserStoppedSpeakingFrame,
+    )
+    from pipecat.pipeline.pipeline import Pipeline
+    from pipecat.pipeline.task import PipelineParams, PipelineTask, PipelineTaskParams
+    from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext
+    from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+    from pipecat.services.openai.llm import OpenAILLMService
+    from pipecat.services.openai.stt import OpenAISTTService
+    from pipecat.services.openai.tts import OpenAITTSService
+
+    from app.audio import decode_audio, resample, to_mono
+    from app.dialogue import DialogueEngine
+    from app.processors import ScriptedDialogueProcessor
+    from app.prompts import get_prompt_registry
+
+    class FirstAudioProbe(FrameProcessor):
+        def __init__(self):
+            super().__init__()
+            self.first_audio = asyncio.Event()
+
+        async def process_frame(self, frame, direction: FrameDirection):
+            await super().process_frame(frame, direction)
+            if isinstance(frame, TTSAudioRawFrame):
+                self.first_audio.set()
+            await self.push_frame(frame, direction)
+
+    def pcm16k(wav: bytes) -> bytes:
+        samples, rate = decode_audio(wav)
+        mono = resample(to_mono(samples), rate, 16000)
+        return (np.clip(mono, -1, 1) * 32767).astype(np.int16).tobytes()
+
+    flow = get_prompt_registry().get()
+    chunks = []
+    for fixture in fixtures:
+        pcm = pcm16k(fixture)
+        chunks.append([pcm[i:i + 640] for i in range(0, len(pcm), 640)])  # 20 ms frames
+
+    async def session(index: int) -> Dict:
+        api = {"api_key": "benchmark", "base_url": base_url}
+        stt = OpenAISTTService(model="whisper-1", **api)
+        llm = OpenAILLMService(model="gpt-4o-mini", **api)
+        tts = OpenAITTSService(model="tts-1", voice="nova", **api)
+        context = OpenAILLMContext(messages=[{"role": "system", "content": flow.system_prompt}])
+        aggregator = llm.create_context_aggregator(context)
+        probe = FirstAudioProbe()
+        pipeline = Pipeline([
+            stt,
+            ScriptedDialogueProcessor(DialogueEngine(script=flow.script), context=context),
+            aggregator.user(),
+            llm,
+            tts,
+            probe,
+        ])
+        task = PipelineTask(pipeline, params=PipelineParams(audio_in_sample_rate=16000))
+        runner = asyncio.create_task(task.run(PipelineTaskParams(loop=asyncio.get_running_loop())))
+
+        frames = [UserStartedSpeakingFrame()]
+        frames += [InputAudioRawFrame(audio=c, sample_rate=16000, num_channels=1) for c in chunks[index % len(chunks)]]
+        await task.queue_frames(frames)
+        started = time.perf_counter()
+        await task.queue_frames([UserStoppedSpeakingFrame()])
+        try:
+            await asyncio.wait_for(probe.first_audio.wait(), timeout=30)
+            result = {"ok": True, "ttfa": time.perf_counter() - started}
+        except asyncio.TimeoutError:
+            result = {"ok": False, "ttfa": time.perf_counter() - started}
+        await task.queue_frames([EndFrame()])
+        await runner
+        return result
+
+    async def run_all():
+        return await asyncio.gather(*(session(i) for i in range(concurrency)))
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    results = asyncio.run(run_all())
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    ttfa = [r["ttfa"] for r in results if r["ok"]]
+    return {
+        "target": "pipecat",
+        "concurrency": concurrency,
+        "turns": len(results),
+        "failed_turns": len(results) - len(ttfa),
+        "turns_per_sec": round(len(ttfa) / elapsed, 2),
+        "ttfa_p50_ms": percentile(ttfa, 50),
+        "ttfa_p95_ms": percentile(ttfa, 95),
+        "turn_p95_ms": None,
+        "mem_per_session_kb": round(current / max(1, concurrency) / 1024, 1),
+        "peak_mem_kb": round(peak / 1024, 1),
+    }
+
+
+def print_row(row: Dict):
+    print(f"{row['target']:<9} c={row['concurrency']:<4} turns={row['turns']:<5} fail={row['failed_turns']:<3} "
+          f"{row['turns_per_sec']:>7} turns/s  TTFA p50 {row['ttfa_p50_ms']} ms / p95 {row['ttfa_p95_ms']} ms  "
+          f"mem/session {row['mem_per_session_kb']} KB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline latency/throughput benchmark for the voice bot")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated session counts")
+    parser.add_argument("--turns", type=int, default=2, help="turns per VoiceBot session")
+    parser.add_argument("--fixtures", help="directory of recorded .wav fixtures (synthetic if omitted)")
+    parser.add_argument("--no-streaming", action="store_true", help="use respond()+text_to_speech() instead of streaming")
+    parser.add_argument("--warm", action="store_true", help="keep the TTS cache and phrase bank enabled")
+    parser.add_argument("--llm", action="store_true", help="use a non-scripted transcript so every turn hits the LLM")
+    parser.add_argument("--pipecat", action="store_true", help="also benchmark the Pipecat pipeline")
+    parser.add_argument("--stt-latency", type=float, default=0.3)
+    parser.add_argument("--llm-ttft", type=float, default=0.35)
+    parser.add_argument("--llm-token-interval", type=float, default=0.02)
+    parser.add_argument("--tts-latency", type=float, default=0.25)
+    parser.add_argument("--upstream-rpm", type=int, default=0, help="per-endpoint RPM quota enforced by the fake server")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of upstream requests failed with a 500")
+    parser.add_argument("--spike-rate", type=float, default=0.0, help="share of upstream requests stalled")
+    parser.add_argument("--spike-seconds", type=float, default=3.0, help="length of an injected stall")
+    parser.add_argument("--fault-endpoints", help="comma-separated endpoints to inject faults into (default all)")
+    parser.add_argument("--shared-store", action="store_true",
+                        help="use a fake Redis session/cache store and move every turn to a new VoiceBot")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--max-ttfa-p95-ms", type=float, help="exit non-zero if any level exceeds this p95")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(
+        stt_latency=args.stt_latency, llm_ttft=args.llm_ttft,
+        llm_token_interval=args.llm_token_interval, tts_latency=args.tts_latency, rpm_limit=args.upstream_rpm,
+        error_rate=args.error_rate, spike_rate=args.spike_rate, spike_seconds=args.spike_seconds,
+        fault_endpoints=args.fault_endpoints.split(",") if args.fault_endpoints else None,
+    )
+    if args.llm:
+        server.transcript = "Mera payment do din se atka hua hai, kya aap check kar sakte hain?"
+    server.start()
+
+    # Point every client at the fake server before any app module builds one
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ["OPENAI_API_KEY"] = "benchmark"
+    os.environ.pop("VOICE_METRICS_JSONL", None)
+    if not args.warm:
+        os.environ["TTS_CACHE_MAX_ENTRIES"] = "0"
+        os.environ.pop("TTS_CACHE_DIR", None)
+        os.environ["PHRASE_BANK_DIR"] = tempfile.mkdtemp(prefix="empty_phrase_bank_")
+
+    store_server = None
+    if args.shared_store:
+        store_server = FakeRedisServer().start()
+        os.environ["SESSION_STORE_URL"] = store_server.url
+
+    fixtures = load_fixtures(args.fixtures)
+
+    # Import and build shared state once so it isn't billed to the first level's sessions
+    from app.services import VoiceBot
+    VoiceBot(notify=lambda level, message: None)
+
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    rows = []
+    print(f"Fake OpenAI server at {server.base_url} ({len(fixtures)} fixtures, threads={threading.active_count()})")
+    try:
+        for level in levels:
+            row = bench_voicebot(fixtures, level, args.turns, streaming=not args.no_streaming, hop=args.shared_store)
+            rows.append(row)
+            print_row(row)
+        if args.pipecat:
+            for level in levels:
+                row = bench_pipecat(fixtures, level, server.base_url)
+                rows.append(row)
+                print_row(row)
+    finally:
+        server.stop()
+        if store_server:
+            store_server.stop()
+
+    print(f"Upstream requests: {server.requests}")
+    from app.singleflight import get_single_flight
+    print(f"Coalesced requests: {get_single_flight().stats()['coalesced']}")
+    if args.error_rate or args.spike_rate:
+        from app.resilience import resilience_stats
+        print(f"Injected faults: {server.faults}")
+        for stage, stats in resilience_stats().items():
+            print(f"  {stage}: {stats}")
+    if args.upstream_rpm:
+        from app.ratelimit import get_rate_limiter
+        print(f"Throttled upstream (429): {server.throttled}")
+        for model, limits in get_rate_limiter().stats().items():
+            print(f"  {model}: {limits}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"rows": rows, "requests": server.requests}, f, indent=2)
+
+    if args.max_ttfa_p95_ms is not None:
+        slow = [r for r in rows if r["ttfa_p95_ms"] is None or r["ttfa_p95_ms"] > args.max_ttfa_p95_ms]
+        if slow:
+            print(f"❌ TTFA p95 above {args.max_ttfa_p95_ms} ms at concurrency {[r['concurrency'] for r in slow]}")
+            sys.exit(1)
+        print(f"✅ TTFA p95 within {args.max_ttfa_p95_ms} ms at every level")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""
+Fake OpenAI Server
+==================
+
+Local stand-in for the three endpoints the voice bot uses, so VoiceBot and
+the Pipecat pipeline can be benchmarked without network access:
+
+    POST /v1/audio/transcriptions   -> {"text": ...}
+    POST /v1/chat/completions       -> completion, or SSE chunks when stream=true
+    POST /v1/audio/speech           -> audio bytes (mp3 placeholder or raw pcm)
+
+Latency and streaming behaviour are configurable per endpoint. With rpm_limit
+set, each endpoint enforces a sliding one-minute request quota and answers
+with x-ratelimit-* headers and 429s like the real API.
+
+Faults can be injected (and changed while running) to exercise app.resilience:
+error_rate answers that share of requests with a 500, spike_rate stalls that
+share for spike_seconds before answering, fault_endpoints limits both to some
+endpoints ("transcriptions", "chat", "speech"). Set error_rate=1 for an outage.
+
+`transcripts` maps the sha256 of an uploaded audio file to what it should
+transcribe to (anything else gets `transcript`), so recorded calls can be
+replayed with their own transcripts (tests/replay.py).
+
+    server = FakeOpenAIServer(stt_latency=0.3, llm_ttft=0.4, llm_token_interval=0.02)
+    server.start()
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+"""
+
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+COMPLAINT = "Main 2 ghante se online hoon par mujhe koi ride nahi mil rahi."
+DEFAULT_REPLY = "Ola customer support mein aapka swagat hai. Kya yeh aapka registered number hai?"
+
+
+class FakeOpenAIServer:
+    """Threaded HTTP server imitating the OpenAI audio and chat endpoints"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, transcript: str = COMPLAINT,
+                 reply: str = DEFAULT_REPLY, stt_latency: float = 0.3, llm_ttft: float = 0.35,
+                 llm_token_interval: float = 0.02, tts_latency: float = 0.25, tts_bytes_per_char: int = 400,
+                 rpm_limit: int = 0, error_rate: float = 0.0, spike_rate: float = 0.0, spike_seconds: float = 3.0,
+                 fault_endpoints=None, seed: int = 0):
+        self.host = host
+        self.port = port
+        self.transcript = transcript
+        self.transcripts = {}  # sha256 of the uploaded file -> text
+        self.reply = reply
+        self.stt_latency = stt_latency
+        self.llm_ttft = llm_ttft
+        self.llm_token_interval = llm_token_interval
+        self.tts_latency = tts_latency
+        self.tts_bytes_per_char = tts_bytes_per_char
+        self.rpm_limit = rpm_limit
+        self.error_rate = error_rate
+        self.spike_rate = spike_rate
+        self.spike_seconds = spike_seconds
+        self.fault_endpoints = fault_endpoints
+        self.requests = {"transcriptions": 0, "chat": 0, "speech": 0}
+        self.throttled = {"transcriptions": 0, "chat": 0, "speech": 0}
+        self.faults = {"errors": 0, "spikes": 0}
+        self._random = random.Random(seed)
+        self._windows = {endpoint: deque() for endpoint in self.requests}
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def count(self, endpoint: str):
+        with self._lock:
+            self.requests[endpoint] += 1
+
+    def admit(self, endpoint: str) -> dict:
+        """Apply the per-endpoint RPM quota; returns rate-limit headers and a 429 flag"""
+        if not self.rpm_limit:
+            return {}
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows[endpoint]
+            while window and window[0] <= now - 60:
+                window.popleft()
+            limited = len(window) >= self.rpm_limit
+            if limited:
+                self.throttled[endpoint] += 1
+            else:
+                window.append(now)
+            reset = max(0.0, window[0] + 60 - now) if window else 0.0
+            headers = {
+                "x-ratelimit-limit-requests": str(self.rpm_limit),
+                "x-ratelimit-remaining-requests": str(max(0, self.rpm_limit - len(window))),
+                "x-ratelimit-reset-requests": f"{reset:.3f}s",
+            }
+        if limited:
+            headers["retry-after-ms"] = str(int(reset * 1000) + 1)
+            headers["_limited"] = "1"
+        return headers
+
+    def fault(self, endpoint: str) -> str:
+        """Fault to inject into this request: "error", "spike" or "" """
+        if self.fault_endpoints and endpoint not in self.fault_endpoints:
+            return ""
+        with self._lock:
+            roll = self._random.random()
+            if roll < self.error_rate:
+                self.faults["errors"] += 1
+                return "error"
+            if roll < self.error_rate + self.spike_rate:
+                self.faults["spikes"] += 1
+                return "spike"
+        return ""
+
+    def start(self) -> "FakeOpenAIServer":
+        handler = type("BoundHandler", (_Handler,), {"fake": self})
+        self._server = ThreadingHTTPServer((self.host, self.port), handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    fake: FakeOpenAIServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, payload, status: int = 200, headers: dict = None):
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json", headers)
+
+    def _admit(self, endpoint: str):
+        """Rate-limit headers for this request, or None after answering 429 (or an injected 500)"""
+        headers = self.fake.admit(endpoint)
+        if headers.pop("_limited", None):
+            error = {"message": "Rate limit reached for requests", "type": "requests", "code": "rate_limit_exceeded"}
+            self._json({"error": error}, status=429, headers=headers)
+            return None
+        fault = self.fake.fault(endpoint)
+        if fault == "error":
+            self._json({"error": {"message": "Injected fault", "type": "server_error", "code": None}}, status=500)
+            return None
+        if fault == "spike":
+            time.sleep(self.fake.spike_seconds)
+        return headers
+
+    def do_POST(self):
+        body = self._body()
+        path = self.path.split("?")[0].rstrip("/")
+        if path.endswith("/audio/transcriptions"):
+            self._transcription(body)
+        elif path.endswith("/chat/completions"):
+            self._chat(json.loads(body or b"{}"))
+        elif path.endswith("/audio/speech"):
+            self._speech(json.loads(body or b"{}"))
+        else:
+            self._json({"error": {"message": f"Unknown endpoint {path}"}}, status=404)
+
+    def _uploaded_file(self, body: bytes) -> bytes:
+        """The file part of a multipart/form-data upload"""
+        header = f"Content-Type: {self.headers.get('Content-Type', '')}\r\n\r\n".encode("latin-1")
+        for part in BytesParser().parsebytes(header + body).walk():
+            if part.get_filename():
+                return part.get_payload(decode=True) or b""
+        return b""
+
+    def _transcription(self, body: bytes):
+        fake = self.fake
+        headers = self._admit("transcriptions")
+        if headers is None:
+            return
+        fake.count("transcriptions")
+        time.sleep(fake.stt_latency)
+        text = fake.transcript
+        if fake.transcripts:
+            text = fake.transcripts.get(hashlib.sha256(self._uploaded_file(body)).hexdigest(), text)
+        self._json({"text": text}, headers=headers)
+
+    def _chat(self, request):
+        fake = self.fake
+        headers = self._admit("chat")
+        if headers is None:
+            return
+        fake.count("chat")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        model = request.get("model", "gpt-4o-mini")
+        tokens = [word + " " for word in fake.reply.split(" ")]
+        time.sleep(fake.llm_ttft)
+
+        if not request.get("stream"):
+            time.sleep(fake.llm_token_interval * len(tokens))
+            self._json({
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": fake.reply}}],
+                "usage": {"prompt_tokens": 100, "completion_tokens": len(tokens), "total_tokens": 100 + len(tokens)},
+            }, headers=headers)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        def chunk(delta, finish_reason=None):
+            payload = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            self._write_chunk(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n")
+
+        chunk({"role": "assistant", "content": ""})
+        for token in tokens:
+            chunk({"content": token})
+            time.sleep(fake.llm_token_interval)
+        chunk({}, finish_reason="stop")
+        self._write_chunk("data: [DONE]\n\n")
+        self._write_chunk("")
+
+    def _write_chunk(self, text: str):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _speech(self, request):
+        fake = self.fake
+        headers = self._admit("speech")
+        if headers is None:
+            return
+        fake.count("speech")
+        time.sleep(fake.tts_latency)
+        size = max(1, len(request.get("input", ""))) * fake.tts_bytes_per_char
+        if request.get("response_format") == "pcm":
+            audio = bytes(size - size % 2)
+            content_type = "audio/pcm"
+        else:
+            # MPEG frame sync header followed by padding: enough for byte-level benchmarking
+            audio = b"\xff\xfb\x90\x64" + bytes(size)
+            content_type = "audio/mpeg"
+        self._send(200, audio, content_type, headers)
+
+
+if __name__ == "__main__":
+    with FakeOpenAIServer(port=8765) as server:
+        print(f"Fake OpenAI server on {server.base_url} (Ctrl+C to stop)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
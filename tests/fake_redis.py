@@ -0,0 +1,191 @@
+"""
+Fake Redis Server
+=================
+
+Minimal RESP2/RESP3 server covering the commands app.store uses, so the shared
+store (and multi-replica behaviour) can be exercised with the real redis
+client but without a Redis installation:
+
+    HELLO, PING, SELECT, CLIENT, GET, SET [EX|PX|NX|XX], DEL, EXISTS, INCR, INCRBY,
+    EXPIRE, PEXPIRE, TTL, PTTL, MGET, DBSIZE, FLUSHDB, FLUSHALL
+
+    with FakeRedisServer() as server:
+        os.environ["SESSION_STORE_URL"] = server.url
+"""
+
+import socketserver
+import threading
+import time
+from typing import Dict, Optional
+
+
+class FakeRedisServer:
+    """Threaded TCP server speaking enough RESP for app.store"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.data: Dict[bytes, tuple] = {}
+        self.commands = 0
+        self.lock = threading.Lock()
+        self._server: Optional[socketserver.ThreadingTCPServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"redis://{self.host}:{self.port}/0"
+
+    def start(self) -> "FakeRedisServer":
+        handler = type("BoundHandler", (_Handler,), {"fake": self})
+        self._server = socketserver.ThreadingTCPServer((self.host, self.port), handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="fake-redis", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _live(self, key: bytes):
+        entry = self.data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return entry
+
+    def execute(self, args):
+        """Run one command under the server lock and return the reply value"""
+        name = args[0].upper().decode()
+        args = args[1:]
+        with self.lock:
+            self.commands += 1
+            if name == "PING":
+                return _Simple("PONG")
+            if name in ("SELECT", "CLIENT"):
+                return _Simple("OK")
+            if name in ("FLUSHDB", "FLUSHALL"):
+                self.data.clear()
+                return _Simple("OK")
+            if name == "DBSIZE":
+                return sum(1 for key in list(self.data) if self._live(key))
+            if name == "GET":
+                entry = self._live(args[0])
+                return entry[0] if entry else None
+            if name == "MGET":
+                return [(self._live(key) or (None,))[0] for key in args]
+            if name == "SET":
+                return self._set(args)
+            if name == "DEL":
+                return sum(1 for key in args if self.data.pop(key, None) is not None)
+            if name == "EXISTS":
+                return sum(1 for key in args if self._live(key))
+            if name in ("INCR", "INCRBY"):
+                entry = self._live(args[0])
+                amount = int(args[1]) if name == "INCRBY" else 1
+                try:
+                    value = int(entry[0] if entry else 0) + amount
+                except ValueError:
+                    return _Error("ERR value is not an integer or out of range")
+                self.data[args[0]] = (str(value).encode(), entry[1] if entry else None)
+                return value
+            if name in ("EXPIRE", "PEXPIRE"):
+                entry = self._live(args[0])
+                if not entry:
+                    return 0
+                seconds = int(args[1]) / (1000.0 if name == "PEXPIRE" else 1.0)
+                self.data[args[0]] = (entry[0], time.monotonic() + seconds)
+                return 1
+            if name in ("TTL", "PTTL"):
+                entry = self._live(args[0])
+                if not entry:
+                    return -2
+                if entry[1] is None:
+                    return -1
+                remaining = entry[1] - time.monotonic()
+                return int(remaining * 1000) if name == "PTTL" else int(remaining)
+        return _Error(f"ERR unknown command '{name}'")
+
+    def _set(self, args):
+        key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+        expires = None
+        for flag, scale in ((b"EX", 1.0), (b"PX", 1000.0)):
+            if flag in options:
+                expires = time.monotonic() + int(args[2 + options.index(flag) + 1]) / scale
+        exists = self._live(key) is not None
+        if (b"NX" in options and exists) or (b"XX" in options and not exists):
+            return None
+        self.data[key] = (value, expires)
+        return _Simple("OK")
+
+
+class _Simple(str):
+    pass
+
+
+class _Error(str):
+    pass
+
+
+def _encode(value, proto: int = 2) -> bytes:
+    if value is None:
+        return b"_\r\n" if proto == 3 else b"$-1\r\n"
+    if isinstance(value, _Error):
+        return f"-{value}\r\n".encode()
+    if isinstance(value, _Simple):
+        return f"+{value}\r\n".encode()
+    if isinstance(value, int):
+        return f":{value}\r\n".encode()
+    if isinstance(value, list):
+        return f"*{len(value)}\r\n".encode() + b"".join(_encode(v, proto) for v in value)
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    fake: FakeRedisServer
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()  # inline command (e.g. from telnet)
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        proto = 2
+        while True:
+            try:
+                args = self._read_command()
+            except (ConnectionError, ValueError):
+                return
+            if not args:
+                return
+            if args[0].upper() == b"HELLO":
+                # Newer clients ask for RESP3; replies only differ in the null and handshake encoding
+                proto = int(args[1]) if len(args) > 1 else 2
+                header = b"%1\r\n" if proto == 3 else b"*2\r\n"
+                self.wfile.write(header + b"+proto\r\n" + _encode(proto))
+            else:
+                self.wfile.write(_encode(self.fake.execute(args), proto))
+            self.wfile.flush()
+
+
+if __name__ == "__main__":
+    with FakeRedisServer(port=6390) as server:
+        print(f"Fake Redis server on {server.url} (Ctrl+C to stop)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,204 @@
+"""
+Call Replay
+===========
+
+Feeds recorded calls (app.recording) back through the voice pipeline for
+offline benchmarking and regression checks. Every call gets a fresh VoiceBot
+on the flow it was recorded with and replays its turns in order: caller
+audio through STT, the transcript through the script or LLM, the reply
+through TTS. Reports time-to-first-audio like tests.benchmark, plus how many
+transcripts and replies still match the recording.
+
+By default the upstream is the local fake OpenAI server, primed so every
+recorded clip transcribes to its recorded transcript (LLM replies are the
+fake's, so only scripted replies are expected to match). --live sends the
+calls to the API configured in the environment instead.
+
+    python -m tests.replay recordings/ --concurrency 8
+    python -m tests.replay recordings/ --call 35f75f9fa9b0 --json replay.json
+    python -m tests.replay recordings/ --live --limit 20 --max-ttfa-p95-ms 2500
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from app.recording import load_turns
+from tests.benchmark import percentile
+from tests.fake_openai import FakeOpenAIServer
+
+
+def _same(a, b) -> bool:
+    return " ".join((a or "").split()).lower() == " ".join((b or "").split()).lower()
+
+
+def load_calls(directory: str, call_ids=None, limit: int = 0) -> "OrderedDict[str, List[Dict]]":
+    """Recorded turns grouped by call, oldest call first; turns without caller audio are skipped"""
+    calls: "OrderedDict[str, List[Dict]]" = OrderedDict()
+    for record in load_turns(directory):
+        if record.get("caller_audio") and (not call_ids or record["call_id"] in call_ids):
+            calls.setdefault(record["call_id"], []).append(record)
+    if limit:
+        calls = OrderedDict(list(calls.items())[:limit])
+    return calls
+
+
+def read_audio(record: Dict) -> bytes:
+    with open(record["caller_audio"], "rb") as f:
+        return f.read()
+
+
+def prime_transcripts(server: FakeOpenAIServer, calls: Dict[str, List[Dict]]):
+    """Make the fake server answer each recorded clip with its recorded transcript"""
+    from app.audio import prepare_for_stt
+    from app.services import VoiceBot
+
+    bot = VoiceBot(notify=lambda level, message: None)
+    for turns in calls.values():
+        for record in turns:
+            prepared = prepare_for_stt(read_audio(record), codec=bot.stt_upload_codec, vad=bot.vad)
+            if prepared is not None and record.get("transcript"):
+                server.transcripts[hashlib.sha256(prepared[1]).hexdigest()] = record["transcript"]
+
+
+def replay_call(turns: List[Dict], streaming: bool) -> List[Dict]:
+    """One recorded call, turn by turn, on a fresh VoiceBot"""
+    from app.services import VoiceBot
+    from app.streaming import StreamingTurn
+
+    bot = VoiceBot(notify=lambda level, message: None, flow=turns[0].get("flow"))
+    results = []
+    for record in turns:
+        audio = read_audio(record)
+        started = time.perf_counter()
+        first_audio, reply = None, ""
+        transcript = bot.transcribe_audio(audio)
+        if transcript:
+            if streaming:
+                turn = StreamingTurn(bot.stream_respond(transcript), bot.text_to_speech)
+                for _, clip in turn:
+                    if clip and first_audio is None:
+                        first_audio = time.perf_counter()
+                reply = turn.text
+            else:
+                reply = bot.respond(transcript) or ""
+                if reply and bot.text_to_speech(reply):
+                    first_audio = time.perf_counter()
+        finished = time.perf_counter()
+        results.append({
+            "call_id": record["call_id"],
+            "turn_id": record["turn_id"],
+            "ok": first_audio is not None,
+            "ttfa": (first_audio or finished) - started,
+            "total": finished - started,
+            "recorded_ttfa_ms": record.get("timing", {}).get("first_audio"),
+            "transcript_match": _same(transcript, record.get("transcript")),
+            "reply_match": _same(reply, record.get("reply")),
+        })
+    return results
+
+
+def replay(calls: Dict[str, List[Dict]], concurrency: int, streaming: bool) -> Dict:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(replay_call, turns, streaming) for turns in calls.values()]
+        results = [r for future in futures for r in future.result()]
+    elapsed = time.perf_counter() - started
+
+    ok = [r for r in results if r["ok"]]
+    ttfa = [r["ttfa"] for r in ok]
+    return {
+        "calls": len(calls),
+        "concurrency": concurrency,
+        "turns": len(results),
+        "failed_turns": len(results) - len(ok),
+        "turns_per_sec": round(len(ok) / elapsed, 2) if elapsed else None,
+        "ttfa_p50_ms": percentile(ttfa, 50),
+        "ttfa_p95_ms": percentile(ttfa, 95),
+        "turn_p95_ms": percentile([r["total"] for r in results], 95),
+        "transcript_match": sum(r["transcript_match"] for r in results),
+        "reply_match": sum(r["reply_match"] for r in results),
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded calls through the voice pipeline")
+    parser.add_argument("recordings", nargs="?", default=os.getenv("RECORDINGS_DIR", "recordings"),
+                        help="recordings directory (default RECORDINGS_DIR)")
+    parser.add_argument("--call", action="append", help="replay only this call id (repeatable)")
+    parser.add_argument("--limit", type=int, default=0, help="replay at most this many calls")
+    parser.add_argument("--concurrency", type=int, default=4, help="calls replayed at once")
+    parser.add_argument("--no-streaming", action="store_true", help="use respond()+text_to_speech() instead of streaming")
+    parser.add_argument("--live", action="store_true", help="use the API from the environment, not the fake server")
+    parser.add_argument("--warm", action="store_true", help="keep the TTS cache and phrase bank enabled")
+    parser.add_argument("--stt-latency", type=float, default=0.3)
+    parser.add_argument("--llm-ttft", type=float, default=0.35)
+    parser.add_argument("--llm-token-interval", type=float, default=0.02)
+    parser.add_argument("--tts-latency", type=float, default=0.25)
+    parser.add_argument("--json", help="write the summary and per-turn results to this file")
+    parser.add_argument("--max-ttfa-p95-ms", type=float, help="exit non-zero if the replay's TTFA p95 exceeds this")
+    args = parser.parse_args()
+
+    calls = load_calls(args.recordings, set(args.call or ()), args.limit)
+    if not calls:
+        print(f"❌ No recorded calls with caller audio in {args.recordings}")
+        sys.exit(1)
+
+    os.environ.pop("RECORDINGS_DIR", None)  # don't record the replay itself
+    os.environ.pop("VOICE_METRICS_JSONL", None)
+    if not args.warm:
+        os.environ["TTS_CACHE_MAX_ENTRIES"] = "0"
+        os.environ.pop("TTS_CACHE_DIR", None)
+        os.environ["PHRASE_BANK_DIR"] = tempfile.mkdtemp(prefix="empty_phrase_bank_")
+
+    server = None
+    if not args.live:
+        server = FakeOpenAIServer(
+            stt_latency=args.stt_latency, llm_ttft=args.llm_ttft,
+            llm_token_interval=args.llm_token_interval, tts_latency=args.tts_latency,
+        ).start()
+        # Point every client at the fake server before any app module builds one
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ["OPENAI_API_KEY"] = "replay"
+        prime_transcripts(server, calls)
+
+    turns = sum(len(call) for call in calls.values())
+    print(f"Replaying {len(calls)} calls ({turns} turns) from {args.recordings} "
+          f"against {'the live API' if args.live else server.base_url}")
+    try:
+        summary = replay(calls, args.concurrency, streaming=not args.no_streaming)
+    finally:
+        if server:
+            server.stop()
+
+    print(f"replay    calls={summary['calls']:<4} turns={summary['turns']:<5} fail={summary['failed_turns']:<3} "
+          f"{summary['turns_per_sec']:>7} turns/s  TTFA p50 {summary['ttfa_p50_ms']} ms / p95 {summary['ttfa_p95_ms']} ms")
+    print(f"Transcripts matching the recording: {summary['transcript_match']}/{summary['turns']}, "
+          f"replies: {summary['reply_match']}/{summary['turns']}")
+    recorded = [r["recorded_ttfa_ms"] for r in summary["results"] if r["recorded_ttfa_ms"] is not None]
+    if recorded:
+        print(f"Recorded TTFA p50 {percentile([ms / 1000 for ms in recorded], 50)} ms "
+              f"/ p95 {percentile([ms / 1000 for ms in recorded], 95)} ms")
+    if server:
+        print(f"Upstream requests: {server.requests}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    if args.max_ttfa_p95_ms is not None:
+        if summary["ttfa_p95_ms"] is None or summary["ttfa_p95_ms"] > args.max_ttfa_p95_ms:
+            print(f"❌ TTFA p95 above {args.max_ttfa_p95_ms} ms")
+            sys.exit(1)
+        print(f"✅ TTFA p95 within {args.max_ttfa_p95_ms} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Microphone capture: waiting for the next block is not an underrun, a stalled device is"""
+
+import asyncio
+import time
+
+import numpy as np
+
+from app.capture import MicrophoneCapture
+
+CONFIG = {"rate": 16000, "channels": 1, "frames_per_buffer": 1024}  # 64 ms blocks
+
+
+class FakeStream:
+    """Real-time paced input; the device goes quiet for `stall` seconds after a few blocks"""
+
+    def __init__(self, stall=0.0):
+        self.stall = stall
+        self.reads = 0
+
+    def read(self, samples, exception_on_overflow=True):
+        time.sleep(samples / CONFIG["rate"] + (self.stall if self.reads == 4 else 0))
+        self.reads += 1
+        return np.zeros(samples, dtype=np.int16).tobytes()
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        pass
+
+
+async def capture_frames(stream, count):
+    async with MicrophoneCapture(CONFIG, frame_ms=30, stream_factory=lambda config: stream) as capture:
+        frames = 0
+        async for _ in capture.frames():
+            frames += 1
+            if frames == count:
+                break
+    return capture.stats()
+
+
+def test_keeping_up_with_the_device_is_not_an_underrun():
+    assert asyncio.run(capture_frames(FakeStream(), 10))["underruns"] == 0
+
+
+def test_stalled_device_counts_an_underrun():
+    assert asyncio.run(capture_frames(FakeStream(stall=0.3), 12))["underruns"] == 1
@@ -0,0 +1,54 @@
+"""Layered runtime config: file and env precedence, validation, hot reload"""
+
+import json
+import os
+
+import pytest
+
+from app.config import _ConfigCache, load_config
+
+
+def write_config(path, ns, **values):
+    path.write_text(json.dumps({"audio": {"sample_rate": 16000}, **values}))
+    os.utime(path, ns=(ns, ns))  # distinct stamps without sleeping
+
+
+@pytest.fixture
+def config_file(tmp_path, monkeypatch):
+    path = tmp_path / "voice_bot_config.json"
+    monkeypatch.setenv("VOICE_CONFIG", str(path))
+    monkeypatch.delenv("VOICE_TTS_VOICE", raising=False)
+    monkeypatch.delenv("VOICE_AUDIO_SAMPLE_RATE", raising=False)
+    return path
+
+
+def test_env_overrides_file_over_defaults(config_file):
+    write_config(config_file, 10 ** 18, tts_voice="alloy")
+    config = load_config(str(config_file), env={"VOICE_AUDIO_SAMPLE_RATE": "24000"})
+    assert config.tts_voice == "alloy" and config.audio.sample_rate == 24000
+    assert config.llm_model == "gpt-4o-mini" and config.source == str(config_file)
+
+    config = load_config(str(config_file), env={"VOICE_TTS_VOICE": "echo"})
+    assert config.tts_voice == "echo" and config.audio.sample_rate == 16000
+
+
+def test_invalid_values_are_rejected(config_file):
+    write_config(config_file, 10 ** 18, tts_voice="robot")
+    with pytest.raises(ValueError, match="tts_voice"):
+        load_config(str(config_file), env={})
+    with pytest.raises(ValueError, match="sample_rate"):
+        load_config(None, env={"VOICE_AUDIO_SAMPLE_RATE": "abc"})
+
+
+def test_reload_on_change_keeps_last_good_config(config_file):
+    cache = _ConfigCache(check_interval=0)
+    write_config(config_file, 10 ** 18, tts_voice="alloy")
+    first = cache.get()
+    assert first.tts_voice == "alloy"
+    assert cache.get() is first  # unchanged file: no reload
+
+    write_config(config_file, 10 ** 18 + 1, tts_voice="robot")
+    assert cache.get() is first  # broken edit: the last good config stays
+
+    write_config(config_file, 10 ** 18 + 2, tts_voice="shimmer")
+    assert cache.get().tts_voice == "shimmer"
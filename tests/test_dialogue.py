@@ -0,0 +1,59 @@
+"""Scripted fast path: transliteration, complaint matching and confirmation scoring"""
+
+import pytest
+
+from app.dialogue import (ENDED, WAITING_FOR_COMPLAINT, WAITING_FOR_CONFIRMATION, DialogueEngine, fold,
+                          transliterate)
+from app.prompts import get_prompt_registry
+
+
+@pytest.fixture
+def script():
+    return get_prompt_registry().get(None).script
+
+
+def engine(script, state):
+    return DialogueEngine(script=script, state=state)
+
+
+def test_transliteration_and_folding():
+    assert transliterate("नमस्ते") == "namaste"
+    assert transliterate("Latin text") == "Latin text"
+    # Devanagari and the spellings Whisper produces in Latin script land on the same form
+    assert fold("हाँ") == fold("Haan") == fold("haan")
+    assert fold("नहीं") == fold("Nahin")
+
+
+def test_complaint_matches_in_either_script(script):
+    bot = engine(script, WAITING_FOR_COMPLAINT)
+    match = bot.respond(script.complaint_texts[0])
+    assert match.intent == "complaint" and match.reply == script.greeting
+    assert bot.state == WAITING_FOR_CONFIRMATION
+    assert engine(script, WAITING_FOR_COMPLAINT).classify("Mera payment abhi tak nahi aaya") is None
+
+
+@pytest.mark.parametrize("transcript", [
+    "Haan, yeh mera registered number hai.",
+    "Haan ji",
+    "हाँ जी",
+    "हाँ, यह मेरा रजिस्टर्ड नंबर है",
+])
+def test_confirmation(script, transcript):
+    bot = engine(script, WAITING_FOR_CONFIRMATION)
+    match = bot.respond(transcript)
+    assert match is not None and match.reply == script.solution
+    assert bot.state == ENDED
+
+
+@pytest.mark.parametrize("transcript", [
+    "Nahi, yeh mera number nahi hai",
+    "नहीं",
+    "Haan par number galat hai",            # a "yes" that goes on to say it's wrong
+    "Haan haan haan, lekin yeh number galat hai",
+    "Mujhe kuch aur poochna hai",
+])
+def test_negated_or_unclear_goes_to_the_llm(script, transcript):
+    bot = engine(script, WAITING_FOR_CONFIRMATION)
+    assert bot.respond(transcript) is None
+    assert bot.state == WAITING_FOR_CONFIRMATION
+    assert bot.stats()["llm_turns"] == 1
@@ -0,0 +1,68 @@
+"""Audio formats: TTS format negotiation per sink and resampling raw PCM to the sink rate"""
+
+import numpy as np
+import pytest
+
+from app.audio import float_to_pcm16, pcm16_to_float, resample
+from app.formats import TTS_PCM_RATE, AudioPlan, adapt, browser_plan, negotiate, pipecat_plan
+
+
+def test_first_supported_format_wins():
+    assert negotiate(["flac", "mp3"]) == AudioPlan("flac")
+    assert negotiate(["webm", " MP3 ", "flac"]) == AudioPlan("mp3")  # unknown skipped, names normalized
+
+
+def test_aliases_map_to_tts_names():
+    assert negotiate(["ogg"]).response_format == "opus"
+    assert negotiate(["mpeg"]).mime_type == "audio/mpeg"
+    assert negotiate(["s16le"], 16000).response_format == "pcm"
+
+
+def test_no_supported_format_is_an_error():
+    with pytest.raises(ValueError, match="No TTS format"):
+        negotiate(["webm", "aiff"])
+
+
+def test_pcm_is_resampled_only_when_rates_differ():
+    assert negotiate(["pcm"]) == AudioPlan("pcm", TTS_PCM_RATE, None)
+    assert negotiate(["pcm"], TTS_PCM_RATE) == AudioPlan("pcm", TTS_PCM_RATE, None)
+    assert negotiate(["pcm"], 16000) == AudioPlan("pcm", 16000, TTS_PCM_RATE)
+    assert pipecat_plan(48000) == AudioPlan("pcm", 48000, TTS_PCM_RATE)
+
+
+def test_browser_plan_follows_the_preference_order(monkeypatch):
+    monkeypatch.delenv("TTS_BROWSER_FORMATS", raising=False)
+    assert browser_plan() == AudioPlan("mp3")
+    monkeypatch.setenv("TTS_BROWSER_FORMATS", "webm,opus,mp3")
+    assert browser_plan() == AudioPlan("opus")
+
+
+@pytest.mark.parametrize("src, dst", [(24000, 16000), (16000, 48000), (44100, 16000), (8000, 24000)])
+def test_resample_hits_the_target_length(src, dst):
+    samples = np.zeros(src // 2, dtype=np.float32)  # half a second
+    out = resample(samples, src, dst)
+    assert out.dtype == np.float32
+    assert out.size == dst // 2
+
+
+def test_resample_keeps_a_tone_in_band():
+    t = np.arange(TTS_PCM_RATE) / TTS_PCM_RATE
+    out = resample(np.sin(2 * np.pi * 440 * t).astype(np.float32), TTS_PCM_RATE, 16000)
+    spectrum = np.abs(np.fft.rfft(out))
+    assert np.argmax(spectrum) == 440  # 1 s at 16 kHz: one bin per Hz
+
+
+def test_resample_is_a_no_op_at_the_same_rate():
+    samples = np.linspace(-1, 1, 100, dtype=np.float32)
+    assert resample(samples, 16000, 16000) is samples
+    assert resample(np.zeros(0, dtype=np.float32), 24000, 16000).size == 0
+
+
+def test_adapt_converts_pcm_to_the_planned_rate():
+    pcm = float_to_pcm16(np.full(TTS_PCM_RATE // 10, 0.25, dtype=np.float32))  # 100 ms
+    out = adapt(pcm, negotiate(["pcm"], 16000))
+    assert len(out) == 2 * 1600
+    assert np.allclose(pcm16_to_float(out)[100:-100], 0.25, atol=1e-3)
+
+    assert adapt(pcm, negotiate(["pcm"])) is pcm
+    assert adapt(b"mp3 bytes", negotiate(["mp3"])) == b"mp3 bytes"
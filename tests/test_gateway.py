@@ -0,0 +1,70 @@
+"""Gateway: malformed control and audio frames and failed turns are reported, the call stays up"""
+
+import json
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    from app.gateway import create_app
+
+    return TestClient(create_app(max_calls=1))
+
+
+@pytest.mark.parametrize("frame", [
+    "not json",
+    "null",
+    json.dumps({"type": "start", "sample_rate": "abc"}),
+    json.dumps({"type": "start", "sample_rate": 1}),
+])
+def test_bad_control_frame_keeps_call(client, frame):
+    with client.websocket_connect("/ws/call") as ws:
+        ready = ws.receive_json()
+        ws.send_text(frame)
+        notice = ws.receive_json()
+        assert notice["type"] == "notice" and notice["level"] == "error"
+
+        # The call is still there: a valid start is accepted and hangup ends it
+        ws.send_json({"type": "start", "sample_rate": 8000})
+        ws.send_json({"type": "hangup"})
+    assert ready["type"] == "ready"
+    assert client.get("/healthz").json()["active_calls"] == 0
+
+
+def speech(ms=300, rate=16000):
+    t = np.arange(rate * ms // 1000) / rate
+    return (np.sin(2 * np.pi * 440 * t) * 12000).astype(np.int16).tobytes()
+
+
+def test_odd_length_audio_frame_is_dropped(client):
+    with client.websocket_connect("/ws/call") as ws:
+        ws.receive_json()
+        ws.send_bytes(b"\x01\x02\x03")
+        notice = ws.receive_json()
+        assert notice["level"] == "error" and "3 bytes" in notice["message"]
+        ws.send_json({"type": "hangup"})
+    assert client.get("/healthz").json()["active_calls"] == 0
+
+
+def test_failed_turn_keeps_listening(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("STREAMING_STT", "standin")
+    from app.gateway import CallSession, create_app
+
+    async def broken_turn(self, transcription, speech_ended, samples):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(CallSession, "_turn", broken_turn)
+    client = TestClient(create_app(max_calls=1))
+    with client.websocket_connect("/ws/call") as ws:
+        ws.receive_json()
+        for _ in range(2):  # the second utterance still reaches the turn loop
+            ws.send_bytes(speech())
+            ws.send_json({"type": "end_of_utterance"})
+            notice = ws.receive_json()
+            assert notice["level"] == "error" and "boom" in notice["message"]
+        ws.send_json({"type": "hangup"})
@@ -0,0 +1,38 @@
+"""Media endpoint: only serves URLs the browser was told how to reach"""
+
+import httpx
+import pytest
+
+from app import media
+from app.tts_cache import cache_key, get_tts_cache
+
+
+@pytest.fixture
+def no_server(monkeypatch):
+    monkeypatch.setattr(media, "_server", None)
+    yield
+    if media._server is not None:
+        media._server.shutdown()
+        media._server.server_close()
+
+
+def test_audio_stays_inline_without_a_public_url(monkeypatch, no_server):
+    monkeypatch.delenv("MEDIA_PUBLIC_URL", raising=False)
+    assert media.start_media_server(port=0) is None
+    assert media.start_media_server() is None
+    assert media.media_url("ab" * 32) is None
+
+
+def test_public_url_serves_from_localhost_without_cors(monkeypatch, no_server):
+    monkeypatch.setenv("MEDIA_PUBLIC_URL", "https://bot.example.com/media/")
+    monkeypatch.delenv("MEDIA_ALLOW_ORIGIN", raising=False)
+    server = media.start_media_server(port=18502)
+    assert server.server_address[0] == "127.0.0.1"
+
+    get_tts_cache().put("tts-1", "alloy", "namaste", b"ID3 audio", "mp3")
+    handle = cache_key("tts-1", "alloy", "namaste", "mp3")
+    assert media.media_url(handle) == f"https://bot.example.com/media/audio/{handle}.mp3"
+
+    response = httpx.get(f"http://127.0.0.1:18502/audio/{handle}.mp3")
+    assert response.status_code == 200 and response.content == b"ID3 audio"
+    assert "access-control-allow-origin" not in response.headers
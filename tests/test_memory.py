@@ -0,0 +1,68 @@
+"""Conversation memory: token budget, summarization of evicted turns, pinned system messages"""
+
+from app.memory import ConversationMemory, estimate_tokens, fit_to_budget, message_tokens
+
+SYSTEM = "Aap Ola ke support agent hain. Script ke hisaab se jawab dijiye."
+
+
+def turn(i):
+    return f"Sawaal number {i} ke baare mein. Aur thoda extra text.", f"Jawab number {i}. Kuch aur bhi."
+
+
+def test_estimate_tokens_weights_devanagari_higher():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("नमस्ते") > estimate_tokens("namaste")
+
+
+def test_recent_turns_stay_verbatim_within_budget():
+    memory = ConversationMemory(token_budget=400)
+    memory.add_turn(*turn(1))
+    messages = memory.build_messages(SYSTEM, "Naya sawaal")
+    assert [m["role"] for m in messages] == ["system", "user", "assistant", "user"]
+    assert messages[1]["content"] == turn(1)[0] and messages[-1]["content"] == "Naya sawaal"
+    assert not memory.stats()["summarized"]
+
+
+def test_over_budget_turns_are_summarized_and_budget_holds():
+    memory = ConversationMemory(max_messages=100, token_budget=60, summary_budget=40)
+    for i in range(10):
+        memory.add_turn(*turn(i))
+    stats = memory.stats()
+    assert stats["summarized"]
+    assert stats["tokens"] <= 60 + 40
+    messages = memory.build_messages(SYSTEM)
+    # Pinned first: the flow's system prompt, then the summary of older turns, then recent turns verbatim
+    assert messages[0] == {"role": "system", "content": SYSTEM}
+    assert messages[1]["role"] == "system" and "summarized" in messages[1]["content"]
+    assert messages[-1]["content"] == turn(9)[1]
+    assert "Sawaal number 0" not in messages[1]["content"]  # oldest lines dropped from the summary first
+
+
+def test_max_messages_evicts_oldest():
+    memory = ConversationMemory(max_messages=4, token_budget=10_000)
+    for i in range(3):
+        memory.add_turn(*turn(i))
+    assert memory.stats()["messages"] == 4
+    assert "Sawaal number 0" in memory.summary
+
+
+def test_snapshot_round_trip():
+    memory = ConversationMemory(max_messages=4)
+    for i in range(3):
+        memory.add_turn(*turn(i))
+    restored = ConversationMemory(max_messages=4)
+    restored.restore(memory.snapshot())
+    assert restored.build_messages(SYSTEM) == memory.build_messages(SYSTEM)
+    assert restored.stats() == memory.stats()
+
+
+def test_fit_to_budget_keeps_leading_system_messages():
+    messages = [{"role": "system", "content": SYSTEM}, {"role": "system", "content": "Flow: ride issue"}]
+    for i in range(20):
+        user, bot = turn(i)
+        messages += [{"role": "user", "content": user}, {"role": "assistant", "content": bot}]
+    fitted = fit_to_budget(messages, token_budget=150, summary_budget=40)
+    assert fitted[:2] == messages[:2]
+    assert fitted[2]["role"] == "system" and "summarized" in fitted[2]["content"]
+    assert fitted[-1] == messages[-1]
+    assert message_tokens(fitted) <= 150 + 40
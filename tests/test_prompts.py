@@ -0,0 +1,86 @@
+"""Prompt registry: compiled flows, hot reload that survives broken edits, unknown flow ids"""
+
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.prompts import PromptRegistry
+
+SCRIPT = '''
+- Wait for the user to say: "{complaint}"
+- Then you say: "Kya yeh aapka registered number hai?"
+- If the user confirms (e.g., "Haan"), you say: "Sab theek hai."
+'''
+
+
+def write_flow(path, ns, complaint, title="Ride issue"):
+    path.write_text(f'title = "{title}"\nscript = \'\'\'{SCRIPT.format(complaint=complaint)}\'\'\'\n')
+    os.utime(path, ns=(ns, ns))  # distinct stamps without sleeping
+
+
+@pytest.fixture
+def prompts_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("VOICE_FLOW", "ride_issue")
+    (tmp_path / "system_prompt.txt").write_text("You are a support agent.\n")
+    write_flow(tmp_path / "ride_issue.toml", 10 ** 18, "Mujhe ride nahi mil rahi.")
+    write_flow(tmp_path / "payment.toml", 10 ** 18, "Payment nahi aaya.", title="Payment")
+    return tmp_path
+
+
+def test_flows_compile_with_the_shared_prompt_first(prompts_dir):
+    registry = PromptRegistry(str(prompts_dir), check_interval=0)
+    assert list(registry.flows()) == ["payment", "ride_issue"]
+    flow = registry.get()
+    assert flow.id == "ride_issue" and flow.title == "Ride issue"
+    assert flow.system_prompt.startswith("You are a support agent.\n- Wait for the user")
+    assert flow.script.complaint_texts == ("Mujhe ride nahi mil rahi.",)
+
+
+def test_edit_is_picked_up_on_the_next_lookup(prompts_dir):
+    registry = PromptRegistry(str(prompts_dir), check_interval=0)
+    registry.get("ride_issue")
+    write_flow(prompts_dir / "ride_issue.toml", 2 * 10 ** 18, "Koi ride nahi aa rahi.")
+    assert registry.get("ride_issue").script.complaint_texts == ("Koi ride nahi aa rahi.",)
+    assert registry.stats() == {"flows": 2, "compiled": 3, "errors": 0}  # payment was not recompiled
+
+
+@pytest.mark.parametrize("broken", [
+    'title = "unterminated',                    # not TOML
+    'title = "No script"\n',                     # valid TOML, invalid flow
+    "script = '''\n- Then you say: \"Hi\"\n'''",  # script without a complaint
+])
+def test_broken_edit_keeps_the_previous_flow(prompts_dir, broken):
+    registry = PromptRegistry(str(prompts_dir), check_interval=0)
+    previous = registry.get("ride_issue")
+    path = prompts_dir / "ride_issue.toml"
+    path.write_text(broken)
+    os.utime(path, ns=(2 * 10 ** 18, 2 * 10 ** 18))
+    assert registry.get("ride_issue") is previous
+    assert registry.stats()["errors"] == 1
+
+    write_flow(path, 3 * 10 ** 18, "Koi ride nahi aa rahi.")  # fixing the file recovers
+    assert registry.get("ride_issue").script.complaint_texts == ("Koi ride nahi aa rahi.",)
+
+
+def test_unknown_flow_is_an_error_naming_the_available_ones(prompts_dir):
+    registry = PromptRegistry(str(prompts_dir), check_interval=0)
+    with pytest.raises(ValueError, match="'nope'.*payment, ride_issue"):
+        registry.get("nope")
+
+
+def test_unknown_flow_falls_back_to_the_default(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.delenv("VOICE_FLOW", raising=False)
+    from app.gateway import create_app
+    from app.prompts import get_prompt_registry
+
+    default = get_prompt_registry().get(None).id
+    client = TestClient(create_app(max_calls=1))
+    with client.websocket_connect("/ws/call") as ws:
+        ws.receive_json()
+        ws.send_json({"type": "start", "sample_rate": 16000, "flow": "nope"})
+        notice = ws.receive_json()
+        ws.send_json({"type": "hangup"})
+    assert notice["level"] == "warning"
+    assert "'nope'" in notice["message"] and notice["message"].endswith(f"using {default}")
@@ -0,0 +1,63 @@
+"""Rate limiter: one slot per retry attempt, and rejected hedge probes give their capacity back"""
+
+import pytest
+
+from app.ratelimit import RateLimiter
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def failing(statuses):
+    """fn() that raises the given statuses in turn, then succeeds"""
+    remaining = list(statuses)
+
+    def fn():
+        if remaining:
+            raise StatusError(remaining.pop(0))
+        return "ok"
+    return fn
+
+
+def test_retry_takes_a_new_slot():
+    limiter = RateLimiter({"m": (600, 0)}, max_retries=3)
+    assert limiter.call("m", "llm", failing([429, 429])) == "ok"
+    stats = limiter.stats()["m"]
+    assert stats["granted"] == 3  # every attempt was charged to the bucket
+    assert stats["retried"] == 2
+
+
+def test_client_errors_and_exhausted_retries_raise():
+    limiter = RateLimiter({"m": (600, 0)}, max_retries=1)
+    with pytest.raises(StatusError):
+        limiter.call("m", "llm", failing([400]))
+    with pytest.raises(StatusError):
+        limiter.call("m", "llm", failing([429, 429]))
+    assert limiter.stats()["m"]["granted"] == 3
+
+
+def test_sdk_does_not_retry(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    from app.clients import get_openai_client
+
+    assert get_openai_client().max_retries == 0
+
+
+class FullWindow:
+    """Shared store whose deployment-wide minute window is always over the limit"""
+
+    def incr(self, key, ttl=None):
+        return 10 ** 6
+
+
+def test_global_reject_refunds_the_local_token():
+    limiter = RateLimiter({"m": (60, 1000)}, store=FullWindow())
+    model = limiter.model("m")
+    requests, tokens = model.requests.level, model.tokens.level
+    assert not limiter.try_acquire("m", tokens=100)
+    assert model.requests.level == pytest.approx(requests, abs=0.01)
+    assert model.tokens.level == pytest.approx(tokens, abs=1)
+    assert model.stats()["granted"] == 0
@@ -0,0 +1,68 @@
+"""Call recorder: the writer outlives a failing segment and ids never leave RECORDINGS_DIR"""
+
+import os
+import time
+
+import numpy as np
+
+from app.recording import CallRecorder, RecordedTurn, load_turns
+
+
+class BrokenSegment:
+    def write(self, data):
+        raise OSError("disk full")
+
+    def flush(self):
+        pass
+
+    def tell(self):
+        return 0
+
+    def close(self):
+        pass
+
+
+def wait_for(recorder, **expected):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        stats = recorder.stats()
+        if all(stats[field] == value for field, value in expected.items()):
+            return stats
+        time.sleep(0.02)
+    return recorder.stats()
+
+
+def turn(turn_id):
+    return RecordedTurn(call_id="c1", turn_id=turn_id, source="test", transcript="namaste", reply="ji",
+                        timestamp="2026-10-17T10:00:00+00:00")
+
+
+def test_writer_survives_a_failing_segment(tmp_path):
+    recorder = CallRecorder(str(tmp_path), flush_interval=0.05)
+    try:
+        recorder._segment, recorder._segment_day = BrokenSegment(), "2026-10-17"
+        recorder.record(turn("t1"))
+        assert wait_for(recorder, failed=1)["failed"] == 1
+
+        # The broken segment was dropped: the next batch opens a new one and is written
+        recorder.record(turn("t2"))
+        stats = wait_for(recorder, recorded=1)
+        assert stats["recorded"] == 1 and stats["failed"] == 1
+        assert recorder._thread.is_alive()
+    finally:
+        recorder.close()
+    assert [record["turn_id"] for record in load_turns(str(tmp_path))] == ["t2"]
+
+
+def test_ids_from_urls_stay_inside_the_recordings_dir(tmp_path):
+    directory = tmp_path / "recordings"
+    recorder = CallRecorder(str(directory), flush_interval=0.05, codec="wav")
+    try:
+        recorder.record(turn("t1")._replace(call_id="../../../escaped", turn_id="../t1",
+                                            caller_audio=np.zeros(1600, dtype=np.float32)))
+        assert wait_for(recorder, recorded=1)["recorded"] == 1
+    finally:
+        recorder.close()
+    assert not (tmp_path / "escaped").exists()
+    [record] = load_turns(str(directory))
+    assert os.path.realpath(record["caller_audio"]).startswith(os.path.realpath(directory) + os.sep)
@@ -0,0 +1,41 @@
+"""Diagnostics report index: incremental refresh and host keys"""
+
+import json
+import os
+
+from voice_bot_config_helper import INDEX_FILE, REPORT_PREFIX, ReportIndex
+
+
+def write_report(directory, stamp, **system_info):
+    path = os.path.join(directory, f"{REPORT_PREFIX}{stamp}.json")
+    with open(path, 'w') as f:
+        json.dump({'system_info': {'platform': 'Windows', 'platform_version': '10.0.26100',
+                                   'timestamp': stamp, **system_info}, 'devices': []}, f)
+    return path
+
+
+def test_unchanged_directory_is_not_reparsed_or_rewritten(tmp_path):
+    write_report(tmp_path, '20250824_231042')
+    assert ReportIndex(str(tmp_path)).refresh() == 1
+    index_stat = os.stat(tmp_path / INDEX_FILE)
+
+    assert ReportIndex(str(tmp_path)).refresh() == 0
+    assert os.stat(tmp_path / INDEX_FILE).st_mtime_ns == index_stat.st_mtime_ns
+
+
+def test_report_rewritten_in_place_is_reparsed(tmp_path):
+    path = write_report(tmp_path, '20250824_231042')
+    ReportIndex(str(tmp_path)).refresh()
+
+    write_report(tmp_path, '20250824_231042', hostname='pc-7', extra='x' * 10)
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 1))
+    index = ReportIndex(str(tmp_path))
+    assert index.refresh() == 1
+    assert index.hosts() == ['pc-7']
+
+
+def test_host_falls_back_to_the_platform(tmp_path):
+    write_report(tmp_path, '20250824_231042')
+    index = ReportIndex(str(tmp_path))
+    index.refresh()
+    assert index.latest()['host'] == 'Windows-10.0.26100'
@@ -0,0 +1,70 @@
+"""Upstream resilience: local queueing is not an upstream failure, fallbacks are not model output"""
+
+import threading
+import time
+
+import pytest
+
+from app.ratelimit import RateLimiter
+from app.resilience import CLOSED, RETRY_LINE, CircuitBreaker, Upstream, UpstreamUnavailable
+from tests.test_ratelimit import failing
+
+
+@pytest.fixture
+def bot(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    from app.services import VoiceBot
+
+    bot = VoiceBot(notify=lambda level, message: None)
+    # 30 RPM: a burst of 3, then one slot every 2 s, far beyond the deadline
+    bot.limiter = RateLimiter({"m": (30, 0)}, max_retries=3)
+    bot.upstreams = {"tts": Upstream("tts", deadline=0.5, breaker=CircuitBreaker("tts", failure_threshold=2))}
+    return bot
+
+
+def test_throttled_limiter_does_not_trip_the_breaker(bot):
+    def request():
+        time.sleep(0.05)
+        return "ok"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(bot._upstream("tts", "m", request)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    upstream = bot.upstreams["tts"]
+    assert results == ["ok"] * 5
+    assert upstream.breaker.state == CLOSED and upstream.breaker.trips == 0
+    assert upstream.counts["deadline_exceeded"] == 0
+    assert bot.limiter.stats()["m"]["queue_depth"] == 0
+
+
+def test_429_is_retried_without_counting_as_a_failure(bot):
+    assert bot._upstream("tts", "m", failing([429, 429])) == "ok"
+    breaker = bot.upstreams["tts"].breaker
+    assert breaker.state == CLOSED and breaker.failures == 0
+
+
+def test_hedge_waits_for_no_slot(bot):
+    limiter = bot.limiter.model("m")
+    limiter.requests.level = 0  # nothing to spare
+    assert not bot.limiter.try_acquire("m")
+    limiter.requests.level = 1
+    assert bot.limiter.try_acquire("m")
+    assert limiter.stats()["queue_depth"] == 0
+
+
+def test_fallback_line_stays_out_of_the_llm_history(bot, monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise UpstreamUnavailable("LLM unavailable (circuit open)")
+
+    monkeypatch.setattr(bot, "_upstream", unavailable)
+    assert bot.respond("Mujhe kuch aur poochna hai") == RETRY_LINE
+    assert "".join(bot.stream_respond("Aur ek sawaal hai")) == RETRY_LINE
+
+    history = bot.memory.build_messages(bot.system_prompt)
+    assert [m["content"] for m in history if m["role"] != "system"] == [
+        "Mujhe kuch aur poochna hai", "Aur ek sawaal hai"]
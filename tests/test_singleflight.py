@@ -0,0 +1,110 @@
+"""Single-flight: identical concurrent calls share one upstream request"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.singleflight import SingleFlight, payload_key
+
+CALLERS = 5
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+def run_threads(flights, fn):
+    """CALLERS threads calling do() with one key at the same time"""
+    outcomes = []
+
+    def caller():
+        try:
+            outcomes.append(flights.do("tts:k", fn))
+        except Exception as e:
+            outcomes.append(e)
+
+    threads = [threading.Thread(target=caller) for _ in range(CALLERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    return outcomes
+
+
+def test_payload_key_is_canonical():
+    assert payload_key("llm", {"a": 1, "b": [2]}) == payload_key("llm", {"b": [2], "a": 1})
+    assert payload_key("llm", {"a": 1}) != payload_key("tts", {"a": 1})
+    assert payload_key("stt", b"audio").startswith("stt:")
+
+
+def test_concurrent_calls_make_one_request():
+    flights, calls = SingleFlight(), []
+
+    def fn():
+        calls.append(1)
+        wait_until(lambda: flights.requests.get("tts") == CALLERS)
+        return "audio"
+
+    assert run_threads(flights, fn) == ["audio"] * CALLERS
+    assert len(calls) == 1
+    assert flights.stats()["coalesced"] == {"tts": CALLERS - 1}
+    assert flights.do("tts:k", lambda: "again") == "again"  # the key was cleared: a new call goes upstream
+
+
+def test_error_reaches_every_waiter_and_clears_the_key():
+    flights = SingleFlight()
+
+    def fn():
+        wait_until(lambda: flights.requests.get("tts") == CALLERS)
+        raise RuntimeError("upstream down")
+
+    outcomes = run_threads(flights, fn)
+    assert len(outcomes) == CALLERS and all(isinstance(o, RuntimeError) for o in outcomes)
+    assert flights.do("tts:k", lambda: "recovered") == "recovered"
+
+
+def test_async_callers_share_one_task():
+    flights, calls = SingleFlight(), []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "audio"
+
+    async def failing():
+        await asyncio.sleep(0.05)
+        raise RuntimeError("upstream down")
+
+    async def main():
+        results = await asyncio.gather(*(flights.ado("tts:k", fn) for _ in range(CALLERS)))
+        errors = await asyncio.gather(*(flights.ado("tts:e", failing) for _ in range(CALLERS)),
+                                      return_exceptions=True)
+        return results, errors, await flights.ado("tts:k", fn)
+
+    results, errors, again = asyncio.run(main())
+    assert results == ["audio"] * CALLERS and again == "audio"
+    assert len(calls) == 2  # one shared call, then a fresh one after the key cleared
+    assert all(isinstance(e, RuntimeError) for e in errors)
+
+
+def test_cancelled_waiter_does_not_cancel_the_call():
+    flights = SingleFlight()
+
+    async def fn():
+        await asyncio.sleep(0.05)
+        return "audio"
+
+    async def main():
+        first = asyncio.ensure_future(flights.ado("tts:k", fn))
+        second = asyncio.ensure_future(flights.ado("tts:k", fn))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == "audio"
@@ -0,0 +1,42 @@
+"""Session hand-off between replicas through a Redis-compatible store"""
+
+import pytest
+
+from app.dialogue import WAITING_FOR_COMPLAINT, WAITING_FOR_CONFIRMATION
+from app.store import RedisStore, SessionStore
+from tests.fake_redis import FakeRedisServer
+
+
+@pytest.fixture
+def sessions():
+    with FakeRedisServer() as server:
+        yield SessionStore(RedisStore(server.url, prefix="test:"), ttl=60)
+
+
+@pytest.fixture
+def new_bot(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    from app.services import VoiceBot
+
+    return lambda: VoiceBot(notify=lambda level, message: None)
+
+
+def test_snapshot_survives_a_hop(sessions, new_bot):
+    first = new_bot()
+    reply = first.respond(first.dialogue.complaint_texts[0])
+    assert reply and first.dialogue.state == WAITING_FOR_CONFIRMATION
+    sessions.save("s1", {"bot": first.snapshot(), "messages": []})
+
+    # Another replica picks the call up, unwrapping the saved record the way app.py does
+    second = new_bot()
+    assert second.dialogue.state == WAITING_FOR_COMPLAINT
+    second.restore((sessions.load("s1") or {}).get("bot", {}))
+    assert second.dialogue.state == WAITING_FOR_CONFIRMATION
+    assert second.flow.id == first.flow.id
+    assert second.memory.snapshot() == first.memory.snapshot()
+
+
+def test_missing_session_starts_fresh(sessions, new_bot):
+    bot = new_bot()
+    bot.restore((sessions.load("nope") or {}).get("bot", {}))
+    assert bot.dialogue.state == WAITING_FOR_COMPLAINT
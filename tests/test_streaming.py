@@ -0,0 +1,50 @@
+"""Streaming replies: sentence boundaries and in-order audio"""
+
+import time
+
+from app.streaming import SentenceChunker, StreamingTurn
+
+
+def chunk(text, step=3, min_chars=12):
+    """Feed `text` a few characters at a time, like token deltas"""
+    chunker = SentenceChunker(min_chars=min_chars)
+    sentences = []
+    for i in range(0, len(text), step):
+        sentences += chunker.feed(text[i:i + step])
+    return sentences + chunker.flush()
+
+
+def test_splits_on_latin_punctuation_and_danda():
+    assert chunk("Aapki ride cancel ho gayi hai। Kya main aapki aur madad karoon? Dhanyavaad!") == [
+        "Aapki ride cancel ho gayi hai।", "Kya main aapki aur madad karoon?", "Dhanyavaad!"]
+
+
+def test_abbreviations_and_initials_do_not_end_a_sentence():
+    assert chunk("Main aapko Mr. Sharma se jod raha hoon. Rs. 250 aapke khaate mein A. K. Singh ne bheje hain.") == [
+        "Main aapko Mr. Sharma se jod raha hoon.", "Rs. 250 aapke khaate mein A. K. Singh ne bheje hain."]
+
+
+def test_short_sentences_merge_up_to_the_minimum_length():
+    assert chunk("Ji. Haan. Aapka number registered hai.") == ["Ji. Haan. Aapka number registered hai."]
+    assert chunk("Ji haan, bilkul. Theek hai.") == ["Ji haan, bilkul.", "Theek hai."]
+
+
+def test_a_boundary_at_the_end_waits_for_more_text():
+    chunker = SentenceChunker()
+    assert chunker.feed("Kripya intezaar kijiye.") == []  # might still become "..."
+    assert chunker.feed("..  Main dekh raha hoon") == ["Kripya intezaar kijiye..."]
+    assert chunker.flush() == ["Main dekh raha hoon"]
+
+
+def test_audio_arrives_in_sentence_order_when_tts_finishes_out_of_order():
+    sentences = ["Pehla vaakya lamba hai.", "Doosra vaakya.", "Teesra vaakya yahan."]
+    delays = {sentences[0]: 0.2, sentences[1]: 0.0, sentences[2]: 0.1}
+
+    def synthesize(sentence):
+        time.sleep(delays[sentence])
+        return sentence.encode()
+
+    turn = StreamingTurn((s + " " for s in sentences), synthesize, max_workers=3)
+    assert [(sentence, audio.decode()) for sentence, audio in turn] == [(s, s) for s in sentences]
+    assert turn.text.split() == " ".join(sentences).split()
+    assert set(turn.latencies_ms()) == {"first_token", "first_sentence", "first_audio", "finished"}
@@ -0,0 +1,104 @@
+"""Streaming STT: partials, the final transcript from finish() and reuse across utterances"""
+
+import asyncio
+
+import numpy as np
+
+from app.streaming_stt import StreamingRecognizer
+
+RATE = 16000
+FRAME = np.full(RATE // 50, 0.1, dtype=np.float32)  # 20 ms
+
+
+class FakeUpstream:
+    """Transcribes to "<n> samples" and records what it was asked for"""
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    async def transcribe(self, samples, sample_rate):
+        self.calls.append(samples.size)
+        await asyncio.sleep(0)
+        if self.fail:
+            raise RuntimeError("upstream down")
+        return f"{samples.size} samples"
+
+
+def utterance(recognizer, speech_frames, silence_frames):
+    frames = [FRAME] * (speech_frames + silence_frames)
+    for i, frame in enumerate(frames):
+        recognizer.feed(frame, is_speech=i < speech_frames)
+    return np.concatenate(frames)
+
+
+def test_finish_transcribes_the_whole_utterance_without_partials():
+    async def main():
+        upstream = FakeUpstream()
+        recognizer = StreamingRecognizer(upstream, RATE, pause_ms=None)
+        samples = utterance(recognizer, 10, 2)
+        return await recognizer.finish(samples), upstream, recognizer
+
+    text, upstream, recognizer = asyncio.run(main())
+    assert text == f"{12 * FRAME.size} samples"
+    assert upstream.calls == [12 * FRAME.size]
+    assert recognizer.stats() == {"partials": 0, "final_from_partial": 0, "final_requests": 1}
+
+
+def test_pause_partial_becomes_the_final_transcript():
+    async def main():
+        upstream, partials = FakeUpstream(), []
+        recognizer = StreamingRecognizer(upstream, RATE, pause_ms=40, on_partial=partials.append)
+        samples = utterance(recognizer, 10, 5)  # partial taken after 2 silent frames
+        return await recognizer.finish(samples), upstream, recognizer, partials
+
+    text, upstream, recognizer, partials = asyncio.run(main())
+    assert text == f"{12 * FRAME.size} samples"
+    assert upstream.calls == [12 * FRAME.size]  # no second request at the endpoint
+    assert [p.at_pause for p in partials] == [True]
+    assert recognizer.stats() == {"partials": 1, "final_from_partial": 1, "final_requests": 0}
+
+
+def test_failed_partial_falls_back_to_the_whole_utterance():
+    async def main():
+        upstream = FakeUpstream(fail=True)
+        recognizer = StreamingRecognizer(upstream, RATE, pause_ms=40)
+        samples = utterance(recognizer, 10, 5)
+        await asyncio.gather(*(task for _, task in recognizer._pending), return_exceptions=True)
+        upstream.fail = False
+        return await recognizer.finish(samples), upstream
+
+    text, upstream = asyncio.run(main())
+    assert text == f"{15 * FRAME.size} samples"
+    assert upstream.calls == [12 * FRAME.size, 15 * FRAME.size]
+
+
+def test_recognizer_starts_clean_after_finish():
+    async def main():
+        upstream = FakeUpstream()
+        recognizer = StreamingRecognizer(upstream, RATE, pause_ms=40)
+        first = await recognizer.finish(utterance(recognizer, 10, 5))
+        second = await recognizer.finish(utterance(recognizer, 4, 3))
+        return first, second, upstream, recognizer
+
+    first, second, upstream, recognizer = asyncio.run(main())
+    assert first == f"{12 * FRAME.size} samples"
+    assert second == f"{6 * FRAME.size} samples"  # nothing carried over from the first utterance
+    assert upstream.calls == [12 * FRAME.size, 6 * FRAME.size]
+    assert recognizer.stats()["final_from_partial"] == 2
+
+
+def test_partial_not_covering_the_speech_is_cancelled():
+    async def main():
+        upstream = FakeUpstream()
+        recognizer = StreamingRecognizer(upstream, RATE, pause_ms=40)
+        frames = utterance(recognizer, 5, 2)  # partial launched here
+        stale = recognizer._pending[-1][1]
+        for _ in range(5):  # caller resumes before it is used
+            recognizer.feed(FRAME, is_speech=True)
+        text = await recognizer.finish(np.concatenate([frames] + [FRAME] * 5))
+        return text, stale
+
+    text, stale = asyncio.run(main())
+    assert stale.cancelled()
+    assert text == f"{12 * FRAME.size} samples"
@@ -0,0 +1,45 @@
+"""Content-addressed TTS cache: keys, byte-bounded LRU, disk tier and lookups by handle"""
+
+from app.tts_cache import TTSCache, cache_key
+
+
+def test_key_normalizes_text_but_not_voice_or_format():
+    key = cache_key("tts-1", "nova", "Namaste,  aap kaise   hain?")
+    assert key == cache_key("tts-1", "nova", " Namaste, aap kaise hain?\n")
+    # NFC: the precomposed and the nukta spelling of the same letter are the same text
+    assert cache_key("tts-1", "nova", "\u095b") == cache_key("tts-1", "nova", "\u091c\u093c")
+    assert key != cache_key("tts-1", "alloy", "Namaste, aap kaise hain?")
+    assert key != cache_key("tts-1", "nova", "Namaste, aap kaise hain?", "opus")
+    assert len(key) == 64
+
+
+def test_lru_evicts_by_bytes_oldest_first():
+    cache = TTSCache(max_entries=100, max_bytes=10)
+    cache.put("m", "v", "one", b"1111")
+    cache.put("m", "v", "two", b"2222")
+    assert cache.get("m", "v", "one") == b"1111"  # now the most recently used
+    cache.put("m", "v", "three", b"3333")          # 12 bytes > 10: "two" goes
+    assert cache.get("m", "v", "two") is None
+    assert cache.get("m", "v", "one") == b"1111" and cache.get("m", "v", "three") == b"3333"
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["bytes"] == 8 and stats["entries"] == 2
+
+
+def test_disk_tier_survives_a_restart_and_is_promoted(tmp_path):
+    TTSCache(cache_dir=str(tmp_path)).put("m", "v", "namaste", b"audio")
+
+    restarted = TTSCache(cache_dir=str(tmp_path))
+    key = cache_key("m", "v", "namaste")
+    assert not restarted.contains(key)
+    assert restarted.get("m", "v", "namaste") == b"audio"
+    assert restarted.contains(key)  # promoted to memory
+    assert restarted.get("m", "v", "namaste") == b"audio"
+    assert restarted.stats()["disk_hits"] == 1 and restarted.stats()["hits"] == 2
+
+
+def test_get_by_key_serves_media_handles():
+    cache = TTSCache()
+    cache.put("m", "v", "namaste", b"pcm", "pcm")
+    assert cache.get_by_key(cache_key("m", "v", "namaste", "pcm")) == b"pcm"
+    assert cache.get_by_key("0" * 64) is None
+    assert cache.stats()["misses"] == 1
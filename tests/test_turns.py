@@ -0,0 +1,21 @@
+"""Background turns wake a waiting rerun only when they have something new"""
+
+import time
+
+from app.turns import TurnRunner
+
+
+def test_rerun_waits_for_progress_not_a_timer():
+    runner = TurnRunner(max_workers=1)
+
+    def work(job):
+        time.sleep(0.1)
+        job.transcript = "namaste"
+        job.touch()
+
+    job = runner.submit("s1", work)
+    assert job.wait_for_change(job.version, timeout=0.01) == 0  # nothing new yet: times out
+    assert job.wait_for_change(0, timeout=2) >= 1 and job.transcript == "namaste"
+    version = job.wait_for_change(1, timeout=2)  # the end of the turn is news too
+    assert job.done and version == 2
+    runner.pool.shutdown()
@@ -0,0 +1,66 @@
+"""VAD: noise-floor calibration and silence trimming on synthetic tone-plus-silence signals"""
+
+import numpy as np
+import pytest
+
+from app.vad import DEFAULT_THRESHOLD, VoiceActivityDetector, calibrate_threshold
+
+RATE = 16000
+
+
+def tone(seconds, amplitude=0.3, hz=440.0):
+    t = np.arange(int(RATE * seconds)) / RATE
+    return (amplitude * np.sin(2 * np.pi * hz * t)).astype(np.float32)
+
+
+def silence(seconds, noise=0.0):
+    rng = np.random.default_rng(0)
+    return (noise * rng.standard_normal(int(RATE * seconds))).astype(np.float32)
+
+
+def test_calibration_sits_between_noise_floor_and_speech():
+    levels = [0.5] * 20 + [40.0] * 10
+    threshold = calibrate_threshold(levels)
+    assert 0.5 < threshold < 40.0
+    assert threshold == pytest.approx(np.sqrt(0.5 * 40.0))
+
+
+def test_calibration_needs_separable_levels():
+    assert calibrate_threshold([1.0, 1.2, 1.1, 1.3, 1.0]) is None  # no speech above the floor
+    assert calibrate_threshold([0.5, None, 40.0]) is None           # too few levels
+
+
+def test_from_report_falls_back_to_the_default():
+    report = {"stream_test": {"audio_levels": [0.5] * 20 + [40.0] * 10}}
+    assert VoiceActivityDetector.from_report(report).threshold == pytest.approx(np.sqrt(20.0))
+    assert VoiceActivityDetector.from_report({}).threshold == DEFAULT_THRESHOLD
+
+
+def test_trim_cuts_leading_and_trailing_silence():
+    vad = VoiceActivityDetector(hangover_ms=0)
+    signal = np.concatenate([silence(0.5, noise=1e-5), tone(1.0), silence(0.7, noise=1e-5)])
+    trimmed = vad.trim(signal, RATE)
+    frame = vad.frame_length(RATE)
+    assert abs(trimmed.size - RATE) <= frame
+    assert vad.segments(signal, RATE)[0][0] == pytest.approx(0.5 * RATE, abs=frame)
+
+
+def test_hangover_keeps_a_short_pause_inside_one_utterance():
+    vad = VoiceActivityDetector()
+    signal = np.concatenate([tone(0.4), silence(0.2), tone(0.4)])
+    assert len(vad.segments(signal, RATE)) == 1
+    apart = np.concatenate([tone(0.4), silence(1.0), tone(0.4)])
+    assert len(vad.split(apart, RATE)) == 2
+
+
+def test_silence_and_clicks_are_not_speech():
+    vad = VoiceActivityDetector()
+    assert vad.trim(silence(1.0, noise=1e-5), RATE) is None
+    click = np.concatenate([silence(0.5), tone(0.03, amplitude=0.9), silence(0.5)])
+    assert not vad.has_speech(click, RATE)
+
+
+def test_spectral_mode_rejects_out_of_band_hum():
+    vad = VoiceActivityDetector(spectral=True)
+    assert vad.has_speech(tone(0.5, hz=1000.0), RATE)
+    assert not vad.has_speech(tone(0.5, hz=60.0), RATE)
@@ -4,25 +4,145 @@ Voice Bot Configuration Helper
 
 This script uses diagnostic results to automatically configure the voice bot
 with optimal audio settings based on the detected hardware and capabilities.
+The result is written to voice_bot_config.json, which app/config.py loads
+(and hot-reloads) at runtime.
 """
 
+import argparse
 import json
 import os
 from typing import Dict, List, Optional
 from datetime import datetime
 
-def load_diagnostic_report(report_path: str = None) -> Dict:
-    """Load the most recent diagnostic report"""
+VOICE_SAMPLE_RATE = 16000  # what Whisper and the VAD work at
+TTS_OUTPUT_SAMPLE_RATE = 24000  # OpenAI TTS PCM; played as is, without resampling
+
+REPORT_PREFIX = 'voice_bot_audio_report_'
+INDEX_FILE = '.voice_bot_report_index.json'
+INDEX_VERSION = 2  # 2: host derived by report_host()
+# Per-device fields config generation needs; everything else stays in the report
+DEVICE_FIELDS = ('index', 'name', 'max_input_channels', 'max_output_channels', 'default_sample_rate', 'working')
+
+def report_host(info: Dict) -> str:
+    """Which machine a report describes: its hostname when the report has one, else platform and OS version
+
+    The diagnostics reports shipped so far record no hostname, so machines on
+    the same OS build share a history until they do.
+    """
+    host = info.get('hostname') or info.get('node')
+    if host:
+        return host
+    system = '-'.join(str(info[k]) for k in ('platform', 'platform_version') if info.get(k))
+    return system or 'local'
+
+def summarize_report(report: Dict) -> Dict:
+    """Compact copy of a report with what device selection needs (no audio_levels, no issue text)"""
+    info = report.get('system_info', {})
+    return {
+        'host': report_host(info),
+        'platform': info.get('platform'),
+        'timestamp': info.get('timestamp', ''),
+        'devices': [{k: d.get(k) for k in DEVICE_FIELDS} for d in report.get('devices', [])],
+        'format_test': {
+            'compatible_rates': report.get('format_test', {}).get('compatible_rates', []),
+            'compatible_channels': report.get('format_test', {}).get('compatible_channels', []),
+        },
+    }
+
+class ReportIndex:
+    """Small on-disk index of diagnostics reports, updated incrementally
+
+    Each report is parsed once, when it first appears (or its mtime or size
+    changes), and reduced to a summary; later runs only stat the report files
+    and rewrite the index when something changed. "Latest" means the newest
+    report timestamp per host (file name breaks ties), so every machine in a
+    fleet picks the same report from the same set of files.
+    """
+
+    def __init__(self, directory: str = '.', index_path: str = None):
+        self.directory = directory
+        self.index_path = index_path or os.path.join(directory, INDEX_FILE)
+        self.entries: Dict[str, Dict] = {}  # file name -> {mtime_ns, size, summary}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') == INDEX_VERSION:
+            self.entries = data.get('reports', {})
+
+    def _save(self):
+        tmp = f"{self.index_path}.tmp"
+        try:
+            with open(tmp, 'w') as f:
+                json.dump({'version': INDEX_VERSION, 'reports': self.entries}, f)
+            os.replace(tmp, self.index_path)
+        except OSError as e:
+            print(f"Warning: report index not saved: {e}")
+
+    def refresh(self) -> int:
+        """Index new or changed reports and forget deleted ones; returns how many were parsed"""
+        seen, parsed = set(), 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not (entry.name.startswith(REPORT_PREFIX) and entry.name.endswith('.json')):
+                    continue
+                seen.add(entry.name)
+                stat = entry.stat()
+                known = self.entries.get(entry.name)
+                if known and known['mtime_ns'] == stat.st_mtime_ns and known['size'] == stat.st_size:
+                    continue
+                try:
+                    with open(entry.path, 'r') as f:
+                        summary = summarize_report(json.load(f))
+                except (OSError, ValueError) as e:
+                    print(f"Warning: skipping unreadable report {entry.name}: {e}")
+                    continue
+                self.entries[entry.name] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'summary': summary}
+                parsed += 1
+
+        deleted = set(self.entries) - seen
+        for name in deleted:
+            del self.entries[name]
+        if parsed or deleted:
+            self._save()
+        return parsed
+
+    def hosts(self) -> List[str]:
+        return sorted({e['summary']['host'] for e in self.entries.values()})
+
+    def history(self, host: str = None) -> List[Dict]:
+        """Reports oldest first (optionally for one host), each with its file name"""
+        reports = [dict(e['summary'], file=name) for name, e in self.entries.items()
+                   if host is None or e['summary']['host'] == host]
+        return sorted(reports, key=lambda r: (r['timestamp'], r['file']))
+
+    def latest(self, host: str = None) -> Optional[Dict]:
+        reports = self.history(host)
+        return reports[-1] if reports else None
+
+def get_report_index(directory: str = '.') -> ReportIndex:
+    index = ReportIndex(directory)
+    index.refresh()
+    return index
+
+def _latest_summary(host: str = None, directory: str = '.') -> Dict:
+    summary = get_report_index(directory).latest(host)
+    if summary is None:
+        where = f" for host {host}" if host else ""
+        raise FileNotFoundError(f"No diagnostic reports found{where}. Run voice_bot_audio_diagnostics.py first.")
+    return summary
+
+def load_diagnostic_report(report_path: str = None, host: str = None) -> Dict:
+    """Load the most recent diagnostic report (optionally for one host)"""
     if report_path and os.path.exists(report_path):
         with open(report_path, 'r') as f:
             return json.load(f)
     
-    # Find the most recent report
-    reports = [f for f in os.listdir('.') if f.startswith('voice_bot_audio_report_') and f.endswith('.json')]
-    if not reports:
-        raise FileNotFoundError("No diagnostic reports found. Run voice_bot_audio_diagnostics.py first.")
-    
-    latest_report = max(reports, key=lambda x: os.path.getctime(x))
+    latest_report = _latest_summary(host)['file']
     print(f"Loading diagnostic report: {latest_report}")
     
     with open(latest_report, 'r') as f:
@@ -52,7 +172,9 @@ def get_optimal_audio_config(report: Dict) -> Dict:
     config = {
         'device_index': device['index'] if device else 0,
         'device_name': device['name'] if device else 'Default',
-        'sample_rate': 16000,  # Default for voice recognition
+        'sample_rate': VOICE_SAMPLE_RATE,  # Default for voice recognition
+        'native_sample_rate': int(device['default_sample_rate']) if device and device.get('default_sample_rate') else None,
+        'output_sample_rate': TTS_OUTPUT_SAMPLE_RATE,
         'channels': 1,  # Mono for voice
         'format': 'pyaudio.paInt16',  # Most compatible format
         'chunk_size': 1024,
@@ -60,10 +182,12 @@ def get_optimal_audio_config(report: Dict) -> Dict:
         'recommendations': []
     }
     
-    # Use compatible sample rates if available
+    # Capture at 16 kHz whenever the device accepts it, even if its native rate
+    # is 44.1/48 kHz: PortAudio converts once at the source, so every later stage
+    # handles a third of the samples and nothing resamples again before Whisper
     compatible_rates = format_test.get('compatible_rates', [])
-    if 16000 in compatible_rates:
-        config['sample_rate'] = 16000
+    if VOICE_SAMPLE_RATE in compatible_rates:
+        config['sample_rate'] = VOICE_SAMPLE_RATE
     elif 22050 in compatible_rates:
         config['sample_rate'] = 22050
     elif 44100 in compatible_rates:
@@ -71,20 +195,16 @@ def get_optimal_audio_config(report: Dict) -> Dict:
     elif compatible_rates:
         config['sample_rate'] = compatible_rates[0]
     
-    # Use device's default sample rate if it's compatible
-    if device and device.get('default_sample_rate'):
-        device_rate = int(device['default_sample_rate'])
-        if device_rate in compatible_rates:
-            config['sample_rate'] = device_rate
-    
     # Add recommendations
     if device:
         config['recommendations'].append(f"Using device: {device['name']}")
     else:
         config['recommendations'].append("No optimal device found, using default")
     
-    if config['sample_rate'] != 16000:
+    if config['sample_rate'] != VOICE_SAMPLE_RATE:
         config['recommendations'].append(f"Using sample rate {config['sample_rate']}Hz (16000Hz preferred for voice)")
+    elif config['native_sample_rate'] and config['native_sample_rate'] != VOICE_SAMPLE_RATE:
+        config['recommendations'].append(f"Capturing at 16000Hz (device native {config['native_sample_rate']}Hz)")
     
     return config
 
@@ -94,11 +214,10 @@ def generate_pipecat_config(config: Dict) -> str:
 # PipeCat Audio Configuration (Generated from diagnostics)
 audio_params = LocalAudioTransportParams(
     audio_in_sample_rate={config['sample_rate']},
-    audio_out_sample_rate=24000,
+    audio_out_sample_rate={config['output_sample_rate']},
     audio_in_channels={config['channels']},
     audio_out_channels=1,
-    audio_in_device_name={config['device_index']},
-    audio_out_device_name=3,  # Adjust based on your speakers
+    input_device_index={config['device_index']},
 )
 '''
 
@@ -120,78 +239,56 @@ stream = p.open(
 )
 '''
 
-def generate_config_file(config: Dict, output_file: str = 'voice_bot_config.py'):
-    """Generate a complete configuration file"""
-    config_code = f'''#!/usr/bin/env python3
-"""
-Voice Bot Audio Configuration
-============================
-
-Auto-generated configuration based on audio diagnostics.
-Generated on: {datetime.now().isoformat()}
-Device: {config['device_name']}
-Sample Rate: {config['sample_rate']}Hz
-"""
+# Keys of the diagnostics config that the runtime reads (see app/config.py AudioSettings)
+RUNTIME_AUDIO_KEYS = ('device_index', 'device_name', 'sample_rate', 'native_sample_rate', 'output_sample_rate',
+                      'channels', 'chunk_size', 'exception_on_overflow')
 
-# Audio Configuration
-AUDIO_CONFIG = {json.dumps(config, indent=2)}
+def generate_config_file(config: Dict, output_file: str = 'voice_bot_config.json', report_file: str = None):
+    """Write the runtime config (plain JSON, loaded and validated by app/config.py)
 
-# PipeCat Configuration
-def get_pipecat_audio_params():
-    """Get PipeCat audio parameters"""
-    from pipecat.transports.local.audio import LocalAudioTransportParams
-    
-    return LocalAudioTransportParams(
-        audio_in_sample_rate={config['sample_rate']},
-        audio_out_sample_rate=24000,
-        audio_in_channels={config['channels']},
-        audio_out_channels=1,
-        audio_in_device_name={config['device_index']},
-        audio_out_device_name=3,  # Adjust based on your speakers
-    )
-
-# PyAudio Configuration
-def get_pyaudio_config():
-    """Get PyAudio configuration"""
-    import pyaudio
-    
-    return {{
-        'format': pyaudio.paInt16,
-        'channels': {config['channels']},
-        'rate': {config['sample_rate']},
-        'input': True,
-        'input_device_index': {config['device_index']},
-        'frames_per_buffer': {config['chunk_size']},
-        'exception_on_overflow': {config['exception_on_overflow']}
-    }}
-
-# Usage Example
-if __name__ == "__main__":
-    print("Voice Bot Audio Configuration")
-    print("=" * 40)
-    print(f"Device: {{AUDIO_CONFIG['device_name']}}")
-    print(f"Sample Rate: {{AUDIO_CONFIG['sample_rate']}}Hz")
-    print(f"Channels: {{AUDIO_CONFIG['channels']}}")
-    print(f"Device Index: {{AUDIO_CONFIG['device_index']}}")
-    print()
-    print("Recommendations:")
-    for rec in AUDIO_CONFIG['recommendations']:
-        print(f"  - {{rec}}")
-'''
-    
-    with open(output_file, 'w') as f:
-        f.write(config_code)
+    Settings other than the audio section (models, voice, VAD threshold) are
+    kept from an existing file.
+    """
+    data = {}
+    if os.path.exists(output_file):
+        try:
+            with open(output_file, 'r') as f:
+                data = json.load(f)
+        except ValueError:
+            pass
+    data.update({
+        'generated_on': datetime.now().isoformat(),
+        'report': report_file,
+        'audio': {key: config[key] for key in RUNTIME_AUDIO_KEYS},
+        'recommendations': config['recommendations'],
+    })
+    tmp = f"{output_file}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=2)
+        f.write('\n')
+    os.replace(tmp, output_file)  # running processes hot-reload; never let them see a half-written file
     
     print(f"Configuration saved to: {output_file}")
 
 def main():
     """Main function to generate configuration"""
+    parser = argparse.ArgumentParser(description="Generate voice_bot_config.json from audio diagnostics")
+    parser.add_argument('--host', help="use the latest report from this host")
+    parser.add_argument('--history', action='store_true', help="list indexed reports and exit")
+    args = parser.parse_args()
+
     print("Voice Bot Configuration Helper")
     print("=" * 40)
     
     try:
-        # Load diagnostic report
-        report = load_diagnostic_report()
+        if args.history:
+            for entry in get_report_index().history(args.host):
+                print(f"{entry['timestamp']}  {entry['host']:<20} {entry['file']}")
+            return
+
+        # Device selection only needs the indexed summary, not the full report
+        report = _latest_summary(args.host)
+        print(f"Using diagnostic report: {report['file']} ({report['host']})")
         
         # Generate optimal configuration
         config = get_optimal_audio_config(report)
@@ -209,7 +306,7 @@ def main():
         print()
         
         # Generate configuration file
-        generate_config_file(config)
+        generate_config_file(config, report_file=report['file'])
         
         # Show usage examples
         print("Usage Examples:")
@@ -221,8 +318,9 @@ def main():
         print("2. For PyAudio:")
         print(generate_pyaudio_config(config))
         print()
-        print("3. Import configuration:")
-        print("from voice_bot_config import get_pipecat_audio_params, get_pyaudio_config")
+        print("3. Load configuration:")
+        print("from app.config import get_config")
+        print("get_config().audio.pipecat_params()  /  get_config().audio.pyaudio_config()")
         
     except Exception as e:
         print(f"Error: {e}")